@@ -0,0 +1,72 @@
+import os, sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import db
+import archive
+
+parser = argparse.ArgumentParser(
+    description="Move transactions older than the horizon into per-user, per-year compressed column files.")
+parser.add_argument("--db", default=os.path.abspath(os.path.join(os.getcwd(), "data", "expense.db")),
+                    help="the directory database (shard 0); further shards come from DB_SHARDS")
+parser.add_argument("--months", type=int, default=archive.HORIZON_MONTHS,
+                    help="complete months to keep hot (default ARCHIVE_HORIZON_MONTHS, %(default)s)")
+parser.add_argument("--user", type=int, action="append", help="only archive this user (repeatable)")
+parser.add_argument("--status", action="store_true", help="only list archived users")
+parser.add_argument("--vacuum", action="store_true", help="VACUUM each shard afterwards to return the space")
+parser.add_argument("--apply", action="store_true", help="move the rows (default is a dry run)")
+args = parser.parse_args()
+
+if not os.path.exists(args.db):
+    raise SystemExit("DB not found: " + args.db)
+db.DB_PATH = args.db
+missing = [p for p in db.shard_paths() if not os.path.exists(p)]
+if missing:
+    raise SystemExit("Shard not found: " + ", ".join(missing))
+db.for_each_shard(lambda conn, shard: db.init_schema(conn))
+print("Archive directory:", archive.archive_dir())
+
+if args.status:
+    for shard, users in enumerate(db.for_each_shard(lambda conn, shard: archive.status(conn))):
+        print("shard %d:" % shard)
+        if not users:
+            print("  - Nothing archived")
+        for u in users:
+            print("  - user %d: %d rows before %s in %d files, %.1f KiB (generation %d)" % (
+                u["user_id"], u["rows"], u["through"], u["files"], u["bytes"] / 1024, u["generation"]))
+    raise SystemExit(0)
+
+before = archive.cutoff(months=args.months)
+users = set(args.user) if args.user else None
+
+def sizes():
+    return [os.path.getsize(p) for p in db.shard_paths()]
+
+if not args.apply:
+    print("Dry run (use --apply to move), rows dated before %s:" % before)
+    found = False
+    for shard, rows in enumerate(db.for_each_shard(lambda conn, shard: archive.candidates(conn, before))):
+        for user_id, n in rows:
+            if users is None or user_id in users:
+                print("  - shard %d, user %d: %d rows" % (shard, user_id, n))
+                found = True
+    if not found:
+        print("  - Nothing to archive")
+else:
+    print("Archiving rows dated before %s:" % before)
+    size_before = sizes()
+    t = time.perf_counter()
+    moved = db.for_each_shard(lambda conn, shard: archive.archive_shard(conn, before, users))
+    seconds = time.perf_counter() - t
+    total = 0
+    for shard, per_user in enumerate(moved):
+        for user_id, n in sorted(per_user.items()):
+            print("  - shard %d, user %d: %d rows" % (shard, user_id, n))
+            total += n
+    print("Moved %d rows in %.1fs (%.0f rows/s)" % (total, seconds, total / max(seconds, 1e-9)))
+    if args.vacuum:
+        db.for_each_shard(lambda conn, shard: conn.execute("VACUUM"))
+        for shard, (a, b) in enumerate(zip(size_before, sizes())):
+            print("  shard %d: %.1f MiB -> %.1f MiB" % (shard, a / 2**20, b / 2**20))
+print('\nDone.')
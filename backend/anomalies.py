@@ -0,0 +1,231 @@
+# backend/anomalies.py
+"""
+Streaming detection of unusual expenses.
+
+category_stats keeps running Welford statistics (count, mean, M2) of log(amount) per
+(user, category). Every inserted expense is scored against the statistics as they were before
+it arrived, then folded in, so each insert costs O(1). Log amounts make "5x the usual" the
+same distance for a 200 coffee and a 20000 rent. Flagged rows go to the anomalies table.
+
+Stats follow arrival order and keep the category a row had when it was inserted; backfill()
+recomputes them from history in one vectorized pass, for every group or only the ones given.
+"""
+import os
+import math
+import logging
+
+import archive
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger("expense-backend")
+
+Z_THRESHOLD = float(os.environ.get("ANOMALY_Z", "3.0"))
+MIN_HISTORY = 5          # rows a (user, category) needs before anything is flagged
+MIN_RATIO = 2.0          # and at least this many times the typical amount
+MIN_STD = 0.1            # floor for the log-scale spread, so near-constant bills don't flag small changes
+
+def _z(x, n, mean, m2):
+    std = max(math.sqrt(m2 / (n - 1)), MIN_STD)
+    return (x - mean) / std
+
+def _is_anomaly(n, z, ratio):
+    return n >= MIN_HISTORY and z >= Z_THRESHOLD and ratio >= MIN_RATIO
+
+def observe(conn, user_id, rows):
+    """
+    Score and absorb newly inserted expenses: rows are (fingerprint, category, type, amount).
+    Returns the anomalies recorded (dicts). Commits. The stats are read and written back under the
+    write lock, so concurrent inserts into one (user, category) don't lose each other's updates.
+    """
+    rows = [r for r in rows if r[2] == 'expense' and abs(r[3]) > 0]
+    if not rows:
+        return []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        out = _observe(conn, user_id, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return out
+
+def _observe(conn, user_id, rows):
+    cats = sorted({r[1] or 'Uncategorized' for r in rows})
+    marks = ",".join("?" * len(cats))
+    stats = {r[0]: [r[1], r[2], r[3]] for r in conn.execute(
+        "SELECT category, n, mean, m2 FROM category_stats WHERE user_id=? AND category IN (%s)" % marks,
+        [user_id] + cats)}
+
+    flagged = []
+    for fp, category, _, amount in rows:
+        category = category or 'Uncategorized'
+        x = math.log(abs(amount))
+        s = stats.setdefault(category, [0, 0.0, 0.0])
+        n, mean, m2 = s
+        if n >= 2:
+            z = _z(x, n, mean, m2)
+            typical = math.exp(mean)
+            if _is_anomaly(n, z, abs(amount) / typical):
+                flagged.append((fp, category, abs(amount), round(typical, 2), round(z, 2)))
+        # Welford update
+        n += 1
+        delta = x - mean
+        mean += delta / n
+        m2 += delta * (x - mean)
+        s[:] = [n, mean, m2]
+
+    conn.executemany(
+        "INSERT INTO category_stats (user_id, category, n, mean, m2) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(user_id, category) DO UPDATE SET n=excluded.n, mean=excluded.mean, m2=excluded.m2",
+        [(user_id, c, s[0], s[1], s[2]) for c, s in stats.items()]
+    )
+    out = []
+    if flagged:
+        fps = [f[0] for f in flagged]
+        ids = dict(conn.execute("SELECT fingerprint, id FROM transactions WHERE fingerprint IN (%s)"
+                                % ",".join("?" * len(fps)), fps).fetchall())
+        for fp, category, amount, typical, z in flagged:
+            if fp not in ids:
+                continue
+            out.append({"transaction_id": ids[fp], "category": category, "amount": amount,
+                        "typical_amount": typical, "z_score": z})
+        conn.executemany(
+            "INSERT INTO anomalies (transaction_id, user_id, category, amount, typical_amount, z_score) "
+            "VALUES (?,?,?,?,?,?)",
+            [(a["transaction_id"], user_id, a["category"], a["amount"], a["typical_amount"], a["z_score"]) for a in out]
+        )
+    return out
+
+def backfill(conn, groups=None):
+    """
+    Rebuild category_stats and anomalies from stored expenses in one vectorized pass:
+    prefix sums within each (user, category) group give every row the stats of the rows before it.
+    groups limits the pass to those (user_id, category) pairs. Anomalies that are flagged again keep
+    their id and dismissed flag. Archived expenses (archive.py) count towards the stats but are never
+    flagged.
+    """
+    sql = ("SELECT t.id, t.user_id, COALESCE(t.category, 'Uncategorized') AS cat, ABS(t.amount) FROM transactions t %s "
+           "WHERE t.type='expense' AND t.amount != 0 ORDER BY t.user_id, cat, t.id")
+    if groups is None:
+        rows = conn.execute(sql % "").fetchall()
+        archived = _archived_expenses(conn, {r[0]: None for r in conn.execute("SELECT user_id FROM archive_marks")})
+        conn.execute("DELETE FROM category_stats")
+        scoped = conn.execute("SELECT id, transaction_id FROM anomalies ORDER BY id").fetchall()
+    else:
+        groups = sorted(set(groups))
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS backfill_groups "
+                     "(user_id INTEGER, category TEXT, PRIMARY KEY (user_id, category))")
+        conn.execute("DELETE FROM temp.backfill_groups")
+        conn.executemany("INSERT INTO temp.backfill_groups (user_id, category) VALUES (?, ?)", groups)
+        rows = conn.execute(sql % "JOIN temp.backfill_groups g ON g.user_id = t.user_id "
+                                  "AND g.category = COALESCE(t.category, 'Uncategorized')").fetchall()
+        wanted = {}
+        for user_id, category in groups:
+            wanted.setdefault(user_id, set()).add(category)
+        archived = _archived_expenses(conn, wanted)
+        conn.execute("DELETE FROM category_stats WHERE (user_id, category) IN "
+                     "(SELECT user_id, category FROM temp.backfill_groups)")
+        # the groups' anomalies, and any other anomaly of a row in them (its category changed since)
+        in_rows = {r[0] for r in rows}
+        scoped = [(r[0], r[1]) for r in conn.execute(
+            "SELECT a.id, a.transaction_id, g.user_id IS NOT NULL FROM anomalies a "
+            "LEFT JOIN temp.backfill_groups g ON g.user_id = a.user_id AND g.category = a.category "
+            "WHERE a.user_id IN (SELECT DISTINCT user_id FROM temp.backfill_groups) ORDER BY a.id")
+            if r[2] or r[1] in in_rows]
+    # (id, user_id, category, |amount|, hot); ids order archived and hot rows by arrival alike
+    rows = [tuple(r) + (True,) for r in rows] + [r + (False,) for r in archived]
+    if archived:
+        rows.sort(key=lambda r: (r[1], r[2], r[0]))
+    if not rows:
+        _store_anomalies(conn, scoped, [])
+        conn.commit()
+        return 0
+    ids = np.array([r[0] for r in rows])
+    x = np.log(np.array([r[3] for r in rows], dtype=np.float64))
+    keys = [(r[1], r[2]) for r in rows]
+    new_group = np.ones(len(rows), dtype=bool)
+    new_group[1:] = [keys[i] != keys[i - 1] for i in range(1, len(keys))]
+    starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+    pos = np.arange(len(rows)) - starts[group]          # rows seen before this one in its group
+
+    # centre on the group's first value so the sum-of-squares form stays well conditioned
+    xc = x - x[starts][group]
+    s1 = np.cumsum(xc)
+    s2 = np.cumsum(xc * xc)
+    base1 = np.where(starts > 0, s1[starts - 1], 0.0)[group]
+    base2 = np.where(starts > 0, s2[starts - 1], 0.0)[group]
+    prev1 = s1 - xc - base1
+    prev2 = s2 - xc * xc - base2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_c = np.where(pos > 0, prev1 / np.maximum(pos, 1), 0.0)
+        m2 = np.maximum(prev2 - pos * mean_c ** 2, 0.0)
+        std = np.maximum(np.sqrt(m2 / np.maximum(pos - 1, 1)), MIN_STD)
+        z = (xc - mean_c) / std
+    mean = mean_c + x[starts][group]
+    flag = np.array([r[4] for r in rows]) & (pos >= MIN_HISTORY) & (z >= Z_THRESHOLD) & (np.exp(x - mean) >= MIN_RATIO)
+
+    _store_anomalies(conn, scoped, [
+        (int(ids[i]), keys[i][0], keys[i][1], float(np.exp(x[i])), round(float(np.exp(mean[i])), 2), round(float(z[i]), 2))
+        for i in np.flatnonzero(flag)])
+
+    # final stats per group = everything up to and including its last row
+    ends = np.append(starts[1:], len(rows)) - 1
+    n = pos[ends] + 1
+    tot1 = s1[ends] - np.where(starts > 0, s1[starts - 1], 0.0)
+    tot2 = s2[ends] - np.where(starts > 0, s2[starts - 1], 0.0)
+    g_mean_c = tot1 / n
+    conn.executemany(
+        "INSERT INTO category_stats (user_id, category, n, mean, m2) VALUES (?,?,?,?,?)",
+        [(keys[starts[g]][0], keys[starts[g]][1], int(n[g]), float(g_mean_c[g] + x[starts[g]]),
+          float(max(tot2[g] - n[g] * g_mean_c[g] ** 2, 0.0))) for g in range(len(starts))]
+    )
+    conn.commit()
+    logger.info("Anomaly backfill: %d groups, %d anomalies", len(starts), int(flag.sum()))
+    return int(flag.sum())
+
+def _archived_expenses(conn, wanted):
+    """
+    (id, user_id, category, |amount|) of the committed archived expenses of the users in wanted,
+    {user_id: categories, or None for all}.
+    """
+    out = []
+    for user_id, categories in wanted.items():
+        cols = archive.scan(user_id, ["id", "type", "category", "amount"], conn=conn)
+        for tx_id, tx_type, category, amount in zip(*[cols[n].tolist() for n in ("id", "type", "category", "amount")]):
+            category = category or 'Uncategorized'
+            if tx_type == 'expense' and amount and (categories is None or category in categories):
+                out.append((tx_id, user_id, category, abs(amount)))
+    return out
+
+def _store_anomalies(conn, scoped, found):
+    """
+    Replace the anomalies in scoped ((id, transaction_id) rows) with found ((transaction_id, user_id,
+    category, amount, typical_amount, z_score) rows): a transaction flagged before keeps its anomaly
+    row, updated in place, so ids a client holds and dismissals survive the rebuild.
+    """
+    flagged = {f[0] for f in found}
+    kept, stale = {}, []
+    for anomaly_id, tx_id in scoped:
+        if tx_id in flagged and tx_id not in kept:
+            kept[tx_id] = anomaly_id
+        else:
+            stale.append((anomaly_id,))
+    conn.executemany("DELETE FROM anomalies WHERE id=?", stale)
+    conn.executemany(
+        "UPDATE anomalies SET user_id=?, category=?, amount=?, typical_amount=?, z_score=? WHERE id=?",
+        [f[1:] + (kept[f[0]],) for f in found if f[0] in kept]
+    )
+    conn.executemany(
+        "INSERT INTO anomalies (transaction_id, user_id, category, amount, typical_amount, z_score) VALUES (?,?,?,?,?,?)",
+        [f for f in found if f[0] not in kept]
+    )
+
+def ensure_index(conn):
+    """Run the backfill for databases that have expenses from before the detector existed."""
+    has_stats = conn.execute("SELECT 1 FROM category_stats LIMIT 1").fetchone()
+    has_rows = conn.execute("SELECT 1 FROM transactions WHERE type='expense' LIMIT 1").fetchone()
+    if has_rows and not has_stats:
+        backfill(conn)
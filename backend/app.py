@@ -2,17 +2,33 @@
 import os
 import csv
 import io
+import heapq
 import logging
 from datetime import datetime, timedelta
 from collections import OrderedDict
 
-from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+from flask_jwt_extended import JWTManager
 from werkzeug.utils import secure_filename
 
 import db
 import auth
-from categorizer import categorize  # expected to return (category, confidence, suggestions)
+from category_aliases import CANONICAL_CATEGORIES, normalize_category, load_aliases
+import dedupe
+import search
+import daily_index
+import learned_categorizer
+import recurring
+import anomalies
+import budgets
+import archive
+import backup
+import forecast_engine
+import lazy
+import offload
+import metrics
+import profiling
+import serialization
 
 # ----- logging -----
 logging.basicConfig(level=logging.INFO)
@@ -21,33 +37,6 @@ logger = logging.getLogger("expense-backend")
 # Supported date formats (try in order)
 DATE_FORMATS = ["%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%Y"]
 
-# ----- Category normalization helper -----
-from difflib import get_close_matches
-
-CANONICAL_CATEGORIES = [
-    "Groceries", "Transport", "Dining", "Rent", "Utilities", "Entertainment",
-    "Healthcare", "Education", "Insurance", "Loan_Repayment", "Salary",
-    "Shopping", "Travel", "Miscellaneous", "Uncategorized"
-]
-
-def normalize_category(cat):
-    """Map incoming category string to a canonical category if close; otherwise return cleaned string."""
-    if not cat:
-        return "Uncategorized"
-    cat = str(cat).strip()
-    # exact match (case-insensitive)
-    for c in CANONICAL_CATEGORIES:
-        if cat.lower() == c.lower():
-            return c
-    # fuzzy match to canonical list
-    match = get_close_matches(cat, CANONICAL_CATEGORIES, n=1, cutoff=0.75)
-    if match:
-        return match[0]
-    # collapse very short or obviously garbage tokens to 'Uncategorized'
-    if len(cat) <= 2 or cat.lower() in ("n/a", "na", "none"):
-        return "Uncategorized"
-    return cat
-
 # ----- Utilities -----
 def parse_date(s):
     """Try several common date formats, return datetime.date or None."""
@@ -65,6 +54,14 @@ def parse_date(s):
     except Exception:
         return None
 
+def category_breakdown(totals):
+    """{category: total} -> list of {category, total, percent} sorted by total, largest first."""
+    grand = sum(totals.values())
+    results = [{"category": c, "total": t} for c, t in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)]
+    for r in results:
+        r['percent'] = round((r['total'] / grand * 100), 2) if grand else 0.0
+    return results
+
 def row_to_dict(row):
     """Convert sqlite3.Row or mapping-like row into plain dict safely."""
     try:
@@ -79,13 +76,53 @@ def row_to_dict(row):
 # ----- Upload limits -----
 MAX_UPLOAD_BYTES = 5 * 1024 * 1024  # 5 MB
 MAX_ROWS_PER_UPLOAD = 5000
+EXPORT_CHUNK_ROWS = 1000  # CSV rows per streamed chunk
 
 # ----- Flask app factory -----
 def create_app():
     app = Flask(__name__)
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'super-secret-key')
+
+    # make sure new tables exist, then build the in-memory category alias index
+    conn = db.connect()
+    try:
+        db.init_schema(conn)
+        auth.ensure_email_index(conn)
+        db.pin_existing_users(conn)
+        load_aliases(conn)
+    finally:
+        conn.close()
+
+    # backfills and derived indexes, per shard (all shards at once when DB_SHARDS is set)
+    def prepare_shard(conn, shard):
+        if shard:
+            db.init_schema(conn)
+        dedupe.backfill_fingerprints(conn)
+        search.ensure_index(conn)
+        daily_index.ensure_index(conn)
+        archive.ensure_index(conn)
+        recurring.ensure_index(conn)
+        anomalies.ensure_index(conn)
+        budgets.ensure_index(conn)
+    db.for_each_shard(prepare_shard)
+
+    if learned_categorizer.ENABLED:
+        learned_categorizer.load_all()
+
     app.register_blueprint(auth.auth_bp, url_prefix='/auth')
     JWTManager(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
+    backup.init_app(app)
+    serialization.init_app(app)
+
+    # numpy/pandas/scikit-learn load on first use; WARM_UP=1 loads them now in a background thread
+    # (WARM_UP=blocking: before create_app returns) for workers that should serve forecasts right away
+    warm_up = os.environ.get('WARM_UP', '').lower()
+    if warm_up in ('1', 'true', 'background'):
+        lazy.warm_up_in_background()
+    elif warm_up == 'blocking':
+        lazy.warm_up()
 
     @app.route('/')
     def root():
@@ -97,17 +134,14 @@ def create_app():
 
     # ---------------- Transaction creation ----------------
     @app.route('/transactions', methods=['POST'])
-    @jwt_required()
+    @auth.user_required
     def add_transaction():
         """
         Create a single transaction. If category is missing, call categorizer.
         Expects JSON: {date (ISO), amount, description (optional), type (expense|income), category (optional)}
         """
-        # get user id (we stored identity as string earlier)
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        # resolved from the token by auth.user_required
+        user_id = g.user_id
 
         try:
             data = request.get_json(force=True)
@@ -132,9 +166,11 @@ def create_app():
         category = data.get('category')  # may be None
 
         suggestion = None
+        source = 'user'
         if not category or str(category).strip() == '':
+            source = 'auto'
             try:
-                cat, confidence, suggestions = categorize(desc)
+                cat, confidence, suggestions = learned_categorizer.categorize_batch(db.get_db(), user_id, [desc])[0]
             except Exception as e:
                 logger.debug("Categorizer failed: %s", e)
                 cat, confidence, suggestions = (None, 0.0, [])
@@ -144,16 +180,37 @@ def create_app():
         # normalize category to canonical label
         category = normalize_category(category)
 
-        # Insert row
+        # Insert row. A manual entry is never treated as a duplicate: take the first free
+        # ordinal so an identical earlier row (or a later CSV re-upload of it) doesn't collide.
+        mkey = recurring.merchant_key(desc) or ""
         try:
-            tx_id = db.execute_db(
-                "INSERT INTO transactions (user_id, date, amount, description, category, type) VALUES (?,?,?,?,?,?)",
-                (user_id, date_val, amount, desc, category, tx_type)
-            )
+            tx_id = None
+            ordinal = 0
+            while tx_id is None:
+                fp = dedupe.fingerprint(user_id, date_val, amount, desc, ordinal)
+                cur = db.write_db(
+                    "INSERT INTO transactions (user_id, date, amount, description, category, type, fingerprint, "
+                    "category_source, merchant_key) VALUES (?,?,?,?,?,?,?,?,?) ON CONFLICT(fingerprint) DO NOTHING",
+                    (user_id, date_val, amount, desc, category, tx_type, fp, source, mkey)
+                )
+                if cur.rowcount:
+                    tx_id = cur.lastrowid
+                ordinal += 1
+            db.commit_db()
         except Exception as e:
             logger.exception("DB insert failed")
             return jsonify({"msg": "DB insert failed", "error": str(e)}), 500
 
+        # the row is stored: a failure below must not make the client retry (and store it twice)
+        flagged = []
+        try:
+            dedupe.user_filter(user_id).add(fp)
+            recurring.refresh(user_id, [mkey])
+            flagged = anomalies.observe(db.get_db(), user_id, [(fp, category, tx_type, amount)])
+        except Exception:
+            logger.exception("Post-insert update failed after insert")
+            db.get_db().rollback()
+
         resp = {
             "msg": "created",
             "transaction_id": tx_id,
@@ -161,16 +218,15 @@ def create_app():
         }
         if suggestion:
             resp.update(suggestion)
+        if flagged:
+            resp["anomaly"] = flagged[0]
         return jsonify(resp), 201
 
     # ---------------- Bulk CSV upload ----------------
     @app.route('/transactions/bulk', methods=['POST'])
-    @jwt_required()
+    @auth.user_required
     def upload_csv():
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        user_id = g.user_id
 
         if 'file' not in request.files:
             return jsonify({"msg": "file required (multipart form-data field 'file')"}), 400
@@ -205,11 +261,12 @@ def create_app():
 
         stream = io.StringIO(content)
         reader = csv.DictReader(stream)
-        inserted = 0
         errors = []
+        parsed_rows = []  # (row number, date, amount, description, type, raw category, fingerprint)
+        occurrences = {}  # content key -> times seen in this file, gives each repeat its ordinal
 
         for i, row in enumerate(reader, start=1):
-            if inserted >= MAX_ROWS_PER_UPLOAD:
+            if len(parsed_rows) >= MAX_ROWS_PER_UPLOAD:
                 errors.append({"row": i, "reason": "row limit reached"})
                 break
 
@@ -235,48 +292,130 @@ def create_app():
                 tx_type = 'income' if amount > 0 else 'expense'
 
             category = row.get('category') or row.get('Category') or ''
+
+            key = dedupe.content_key(date_val, amount, desc)
+            ordinal = occurrences.get(key, 0)
+            occurrences[key] = ordinal + 1
+            fp = dedupe.fingerprint(user_id, date_val, amount, desc, ordinal)
+            parsed_rows.append((i, date_val, amount, desc, tx_type, category, fp))
+
+        # Bloom pre-check: rows the filter has definitely never seen skip the lookup entirely;
+        # "maybe seen" rows are confirmed with batched index lookups before any categorization.
+        try:
+            bloom = dedupe.user_filter(user_id)
+            maybe = [r[6] for r in parsed_rows if r[6] in bloom]
+            already = dedupe.existing_fingerprints(user_id, maybe) if maybe else set()
+            # rows as old as the user's archive may have been stored and archived since
+            already |= archive.existing_fingerprints(user_id, [(r[1], r[6]) for r in parsed_rows if r[6] not in already])
+        except Exception as e:
+            logger.exception("Duplicate pre-check failed")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+        duplicates = [r[0] for r in parsed_rows if r[6] in already]
+        fresh = [r for r in parsed_rows if r[6] not in already]
+
+        # categorize every uncategorized row in one batch (learned model if enabled, rules otherwise)
+        unlabeled = [r[3] for r in fresh if not r[5]]
+        try:
+            predicted = iter(learned_categorizer.categorize_batch(db.get_db(), user_id, unlabeled))
+        except Exception as e:
+            logger.debug("Categorizer failed on upload batch: %s", e)
+            predicted = iter([(None, 0.0, [])] * len(unlabeled))
+
+        to_insert = []
+        for i, date_val, amount, desc, tx_type, category, fp in fresh:
+            source = 'user'
             if not category:
-                try:
-                    cat, confidence, suggestions = categorize(desc)
-                except Exception as e:
-                    logger.debug("Categorizer failed on row %s: %s", i, e)
-                    cat = None
-                category = cat or "Uncategorized"
+                source = 'auto'
+                category = next(predicted)[0] or "Uncategorized"
 
             # normalize category before insert
             category = normalize_category(category)
+            to_insert.append((user_id, date_val, amount, desc, category, tx_type, fp, source,
+                              recurring.merchant_key(desc) or ""))
 
+        # set-based insert; the unique fingerprint index drops anything another request stored meanwhile
+        inserted = 0
+        flagged = []
+        if to_insert:
             try:
-                db.execute_db(
-                    "INSERT INTO transactions (user_id, date, amount, description, category, type) VALUES (?,?,?,?,?,?)",
-                    (user_id, date_val, amount, desc, category, tx_type)
-                )
-                inserted += 1
+                added = set(db.insert_new_db(
+                    "INSERT INTO transactions (user_id, date, amount, description, category, type, fingerprint, "
+                    "category_source, merchant_key) VALUES (?,?,?,?,?,?,?,?,?) ON CONFLICT(fingerprint) DO NOTHING",
+                    to_insert, "transactions", "fingerprint"
+                ))
+                # rows another request stored meanwhile are not ours to count or score
+                stored = [r for r in to_insert if r[6] in added]
+                inserted = len(stored)
             except Exception as e:
-                logger.exception("DB error on row %s", i)
-                errors.append({"row": i, "reason": "db error", "error": str(e)})
-                continue
-
-        return jsonify({"msg": "uploaded", "filename": filename, "inserted": inserted, "errors": errors}), 200
+                logger.exception("DB error on bulk insert")
+                return jsonify({"msg": "DB insert failed", "error": str(e), "errors": errors}), 500
+            # the rows are stored: a failure below must not fail the upload
+            try:
+                for r in stored:
+                    bloom.add(r[6])
+                recurring.refresh(user_id, [r[8] for r in stored])
+                flagged = anomalies.observe(db.get_db(), user_id, [(r[6], r[4], r[5], r[2]) for r in stored])
+                if learned_categorizer.ENABLED and inserted:
+                    learned_categorizer.train_incremental(db.get_db())
+            except Exception:
+                logger.exception("Post-insert update failed after bulk insert")
+                db.get_db().rollback()
+
+        skipped = len(duplicates) + (len(to_insert) - inserted)
+        metrics.UPLOAD_ROWS.inc("inserted", amount=inserted)
+        metrics.UPLOAD_ROWS.inc("duplicate", amount=skipped)
+        metrics.UPLOAD_ROWS.inc("error", amount=len(errors))
+        return jsonify({
+            "msg": "uploaded",
+            "filename": filename,
+            "inserted": inserted,
+            "skipped_duplicates": skipped,
+            "duplicate_rows": duplicates[:100],
+            "anomalies": flagged[:100],
+            "errors": errors
+        }), 200
 
     # ---------------- List transactions ----------------
     @app.route('/transactions', methods=['GET'])
-    @jwt_required()
+    @auth.user_required
     def list_transactions():
+        """
+        Newest first. Optional keyset pagination: limit (max 1000) and cursor, where cursor is
+        the X-Next-Cursor header of the previous page ('<date>:<id>').
+        format=columns returns {columns, rows} instead of a list of objects.
+        """
+        user_id = g.user_id
+
         try:
-            user_id = int(get_jwt_identity())
+            limit = max(1, min(int(request.args.get('limit', 1000)), 1000))
         except Exception:
-            user_id = get_jwt_identity()
+            limit = 1000
+        cursor = request.args.get('cursor')
+
+        sql = "SELECT id, date, amount, description, category, type FROM transactions WHERE user_id=?"
+        args = [user_id]
+        if cursor:
+            try:
+                last_date, last_id = search.parse_cursor(cursor)
+            except Exception:
+                return jsonify({"msg": "invalid cursor"}), 400
+            sql += " AND (date < ? OR (date = ? AND id < ?))"
+            args += [last_date, last_date, last_id]
+        sql += " ORDER BY date DESC, id DESC LIMIT ?"
+        args.append(limit + 1)
 
         try:
-            rows = db.query_db(
-                "SELECT id, date, amount, description, category, type FROM transactions WHERE user_id=? ORDER BY date DESC LIMIT 1000",
-                (user_id,)
-            )
+            rows = db.query_db(sql, args)
         except Exception as e:
             logger.exception("DB query failed in list_transactions")
             return jsonify({"msg": "DB query failed", "error": str(e)}), 500
 
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = "%s:%s" % (rows[-1]['date'], rows[-1]['id'])
+
         results = []
         for r in rows:
             try:
@@ -291,20 +430,104 @@ def create_app():
                 except Exception:
                     row['date'] = str(row['date'])
             results.append(row)
-        return jsonify(results)
+        resp = jsonify(serialization.shape_rows(results))
+        if next_cursor:
+            resp.headers['X-Next-Cursor'] = next_cursor
+        return resp
+
+    # ---------------- Export ----------------
+    @app.route('/transactions/export', methods=['GET'])
+    @auth.user_required
+    def export_transactions():
+        """
+        All transactions, hot and archived, oldest first, streamed as CSV in the upload format
+        (date, amount, description, category, type), so an export can be uploaded again.
+        Query params: from, to (optional, inclusive)
+        """
+        user_id = g.user_id
+
+        bounds = []
+        for name in ('from', 'to'):
+            raw = request.args.get(name)
+            parsed = parse_date(raw) if raw else None
+            if raw and not parsed:
+                return jsonify({"msg": "invalid %s date" % name}), 400
+            bounds.append(parsed.isoformat() if parsed else None)
+        start, end = bounds
+
+        columns = ["date", "amount", "description", "category", "type"]
+        sql = "SELECT %s FROM transactions WHERE user_id=?" % ", ".join(columns)
+        args = [user_id]
+        if start:
+            sql += " AND date >= ?"
+            args.append(start)
+        if end:
+            sql += " AND date <= ?"
+            args.append(end)
+        try:
+            hot = db.get_db().execute(sql + " ORDER BY date, id", args)
+        except Exception as e:
+            logger.exception("DB query failed in export_transactions")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+        def generate():
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            cold = archive.iter_rows(user_id, columns, start, end)
+            for i, row in enumerate(heapq.merge(cold, hot, key=lambda r: r[0]), start=1):
+                writer.writerow(tuple(row))
+                if i % EXPORT_CHUNK_ROWS == 0:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+
+        return Response(stream_with_context(generate()), mimetype="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=transactions.csv"})
+
+    # ---------------- Search transactions ----------------
+    @app.route('/transactions/search', methods=['GET'])
+    @auth.user_required
+    def search_transactions():
+        """
+        Full-text search over description and category.
+        Query params: q (required; 'swig*' for prefix match), sort (rank|date, default rank),
+        limit (default 50, max 200), cursor (next_cursor from the previous page),
+        format=columns for results as {columns, rows}.
+        """
+        user_id = g.user_id
+
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({"msg": "q query param required"}), 400
+        sort = request.args.get('sort', 'rank')
+        if sort not in ('rank', 'date'):
+            return jsonify({"msg": "sort must be 'rank' or 'date'"}), 400
+        try:
+            limit = int(request.args.get('limit', 50))
+        except Exception:
+            limit = 50
+
+        try:
+            results, next_cursor = search.search_transactions(user_id, q, limit=limit, cursor=request.args.get('cursor'), sort=sort)
+        except ValueError:
+            return jsonify({"msg": "invalid cursor"}), 400
+        except Exception as e:
+            logger.exception("DB query failed in search_transactions")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+        return jsonify({"results": serialization.shape_rows(results), "next_cursor": next_cursor})
 
     # ---------------- Override category ----------------
     @app.route('/transactions/<int:tx_id>/category', methods=['PUT'])
-    @jwt_required()
+    @auth.user_required
     def override_transaction_category(tx_id):
         """
         Allow the authenticated user to override the category of a transaction they own.
         Body: { "category": "NewCategory" }
         """
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        user_id = g.user_id
 
         try:
             data = request.get_json(force=True)
@@ -323,7 +546,10 @@ def create_app():
             return jsonify({"msg": "transaction not found or access denied"}), 404
 
         try:
-            db.execute_db("UPDATE transactions SET category=? WHERE id=? AND user_id=?", (new_cat, tx_id, user_id))
+            db.execute_db("UPDATE transactions SET category=?, category_source='override' WHERE id=? AND user_id=?",
+                          (new_cat, tx_id, user_id))
+            # every correction is training signal, whether or not the learned model is switched on
+            learned_categorizer.record_override(db.get_db(), user_id, tx['description'], new_cat)
         except Exception as e:
             logger.exception("DB update failed for tx %s", tx_id)
             return jsonify({"msg": "DB update failed", "error": str(e)}), 500
@@ -340,17 +566,14 @@ def create_app():
 
     # ---------------- Reporting endpoints ----------------
     @app.route('/reports/category', methods=['GET'])
-    @jwt_required()
+    @auth.user_required
     def report_category():
         """
         Returns total expense per category for the last N days (default 30).
         Also provides percent share of total expense.
         Query param: days (int)
         """
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        user_id = g.user_id
 
         try:
             days = int(request.args.get('days', 30))
@@ -359,33 +582,283 @@ def create_app():
 
         since_date = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
         try:
-            rows = db.query_db(
-                "SELECT category, SUM(amount) as total FROM transactions WHERE user_id=? AND type='expense' AND date >= ? GROUP BY category ORDER BY total DESC",
-                (user_id, since_date)
-            )
+            # open-ended range: everything dated on/after since_date
+            totals = daily_index.range_totals(user_id, since_date, "9999-12-31")
         except Exception as e:
             logger.exception("DB query error in report_category")
             return jsonify({"msg": "DB query failed", "error": str(e)}), 500
 
-        results = [dict(r) for r in rows]
-        total_expense = sum([float(r.get('total') or 0) for r in results]) or 0.0
-        # add percentage
-        for r in results:
-            t = float(r.get('total') or 0.0)
-            r['percent'] = round((t / total_expense * 100), 2) if total_expense else 0.0
+        results = category_breakdown(totals)
+        total_expense = sum(totals.values())
         return jsonify({"total_expense": round(total_expense, 2), "by_category": results})
 
+    @app.route('/reports/range', methods=['GET'])
+    @auth.user_required
+    def report_range():
+        """
+        Totals per category between two dates (inclusive), answered from the daily prefix-sum index.
+        Query params: from, to (required), type (expense|income, default expense),
+        compare (optional: 'previous' = same-length period before, 'year' = same dates a year earlier)
+        """
+        user_id = g.user_id
+
+        start = parse_date(request.args.get('from'))
+        end = parse_date(request.args.get('to'))
+        if not start or not end:
+            return jsonify({"msg": "from and to query params required (YYYY-MM-DD or similar)"}), 400
+        if start > end:
+            return jsonify({"msg": "from must not be after to"}), 400
+        tx_type = request.args.get('type', 'expense')
+        if tx_type not in ('income', 'expense'):
+            return jsonify({"msg": "type must be 'income' or 'expense'"}), 400
+        compare = request.args.get('compare')
+        if compare and compare not in ('previous', 'year'):
+            return jsonify({"msg": "compare must be 'previous' or 'year'"}), 400
+
+        try:
+            totals = daily_index.range_totals(user_id, start.isoformat(), end.isoformat(), tx_type)
+            if compare:
+                prev_start, prev_end = daily_index.shift_period(start, end, compare)
+                prev_totals = daily_index.range_totals(user_id, prev_start.isoformat(), prev_end.isoformat(), tx_type)
+        except Exception as e:
+            logger.exception("DB query error in report_range")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+        total = sum(totals.values())
+        resp = {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "type": tx_type,
+            "total": round(total, 2),
+            "by_category": category_breakdown(totals)
+        }
+        if compare:
+            prev_total = sum(prev_totals.values())
+            changes = []
+            for cat in sorted(set(totals) | set(prev_totals)):
+                cur_t, prev_t = totals.get(cat, 0.0), prev_totals.get(cat, 0.0)
+                changes.append({
+                    "category": cat,
+                    "total": cur_t,
+                    "previous_total": prev_t,
+                    "change": round(cur_t - prev_t, 2),
+                    "change_percent": round((cur_t - prev_t) / prev_t * 100, 2) if prev_t else None
+                })
+            changes.sort(key=lambda c: abs(c['change']), reverse=True)
+            resp["comparison"] = {
+                "mode": compare,
+                "from": prev_start.isoformat(),
+                "to": prev_end.isoformat(),
+                "total": round(prev_total, 2),
+                "change": round(total - prev_total, 2),
+                "change_percent": round((total - prev_total) / prev_total * 100, 2) if prev_total else None,
+                "by_category": changes
+            }
+        return jsonify(resp)
+
+    @app.route('/anomalies', methods=['GET'])
+    @auth.user_required
+    def list_anomalies():
+        """
+        Expenses flagged as unusual for their category, newest first.
+        Query params: limit (default 50, max 500), include_dismissed (1 = also dismissed ones)
+        """
+        user_id = g.user_id
+
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        except Exception:
+            return jsonify({"msg": "limit must be an integer"}), 400
+        dismissed_clause = "" if request.args.get('include_dismissed') in ('1', 'true') else " AND a.dismissed=0"
+
+        try:
+            rows = db.query_db(
+                "SELECT a.id, a.transaction_id, t.date, t.description, a.category, a.amount, a.typical_amount, "
+                "a.z_score, a.dismissed, a.created_at FROM anomalies a JOIN transactions t ON t.id = a.transaction_id "
+                "WHERE a.user_id=?" + dismissed_clause + " ORDER BY a.id DESC LIMIT ?",
+                (user_id, limit)
+            )
+        except Exception as e:
+            logger.exception("DB query error in list_anomalies")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+        results = []
+        for r in rows:
+            a = dict(r)
+            a['times_typical'] = round(a['amount'] / a['typical_amount'], 1) if a['typical_amount'] else None
+            results.append(a)
+        return jsonify({"anomalies": results})
+
+    @app.route('/anomalies/<int:anomaly_id>/dismiss', methods=['POST'])
+    @auth.user_required
+    def dismiss_anomaly(anomaly_id):
+        """Mark an anomaly as reviewed so it drops out of the default listing."""
+        user_id = g.user_id
+
+        try:
+            cur = db.write_db("UPDATE anomalies SET dismissed=1 WHERE id=? AND user_id=?", (anomaly_id, user_id))
+            db.commit_db()
+        except Exception as e:
+            logger.exception("DB update failed for anomaly %s", anomaly_id)
+            return jsonify({"msg": "DB update failed", "error": str(e)}), 500
+        if not cur.rowcount:
+            return jsonify({"msg": "anomaly not found or access denied"}), 404
+        return jsonify({"msg": "dismissed", "id": anomaly_id})
+
+    # ---------------- Budgets ----------------
+    @app.route('/budgets', methods=['GET'])
+    @auth.user_required
+    def get_budgets():
+        """Current month's status for every budget of the user (read from monthly_spend, not transactions)."""
+        user_id = g.user_id
+
+        try:
+            return jsonify(budgets.status(user_id, datetime.utcnow().date()))
+        except Exception as e:
+            logger.exception("DB query error in get_budgets")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+    @app.route('/budgets/<category>', methods=['PUT'])
+    @auth.user_required
+    def put_budget(category):
+        """
+        Create or change a monthly budget.
+        Body: { "limit": 5000 }
+        """
+        user_id = g.user_id
+
+        try:
+            data = request.get_json(force=True)
+        except Exception:
+            return jsonify({"msg": "Invalid JSON payload"}), 400
+        try:
+            limit = float(data.get('limit'))
+        except Exception:
+            return jsonify({"msg": "limit must be numeric"}), 400
+        if limit <= 0:
+            return jsonify({"msg": "limit must be positive"}), 400
+
+        category = normalize_category(category)
+        try:
+            budgets.set_budget(user_id, category, limit, datetime.utcnow().date())
+        except Exception as e:
+            logger.exception("DB update failed for budget %s", category)
+            return jsonify({"msg": "DB update failed", "error": str(e)}), 500
+        return jsonify({"msg": "saved", "category": category, "monthly_limit": limit})
+
+    @app.route('/budgets/<category>', methods=['DELETE'])
+    @auth.user_required
+    def delete_budget(category):
+        user_id = g.user_id
+
+        category = normalize_category(category, learn=False)
+        try:
+            deleted = budgets.delete_budget(user_id, category)
+        except Exception as e:
+            logger.exception("DB delete failed for budget %s", category)
+            return jsonify({"msg": "DB delete failed", "error": str(e)}), 500
+        if not deleted:
+            return jsonify({"msg": "budget not found"}), 404
+        return jsonify({"msg": "deleted", "category": category})
+
+    # ---------------- Forecast ----------------
+    @app.route('/forecast', methods=['GET'])
+    @auth.user_required
+    def forecast():
+        """
+        Monthly expense forecast with prediction intervals from Monte Carlo simulation, per category and total.
+        Query params: months (1-12, default 3), history (months of history, 3-60, default 24),
+        paths (100-50000, default 10000; fewer when categories x paths x months exceeds
+        FORECAST_MAX_CELLS, the response's paths says how many ran), method (bootstrap|normal), seed (optional),
+        scenario (optional, e.g. "Dining:0.8,Shopping:1.1" scales those categories),
+        under (optional amount: returns P(total <= under) per month)
+        """
+        user_id = g.user_id
+
+        try:
+            months = min(max(int(request.args.get('months', 3)), 1), 12)
+            history = min(max(int(request.args.get('history', 24)), 3), 60)
+            n_paths = min(max(int(request.args.get('paths', 10000)), 100), 50000)
+            seed = int(request.args['seed']) if request.args.get('seed') else None
+            under = float(request.args['under']) if request.args.get('under') else None
+            scenario = {}
+            for part in filter(None, (request.args.get('scenario') or '').split(',')):
+                cat, factor = part.rsplit(':', 1)
+                scenario[normalize_category(cat.strip(), learn=False)] = float(factor)
+        except Exception:
+            return jsonify({"msg": "invalid query parameters"}), 400
+        method = request.args.get('method', 'bootstrap')
+        if method not in ('bootstrap', 'normal'):
+            return jsonify({"msg": "method must be 'bootstrap' or 'normal'"}), 400
+
+        # complete months only: history ends last month, the forecast starts with the current one
+        current = datetime.utcnow().strftime("%Y-%m")
+        try:
+            rows = db.query_db(
+                "SELECT category, month, total FROM monthly_spend WHERE user_id=? AND month >= ? AND month < ? "
+                "ORDER BY month",
+                (user_id, forecast_engine.shift_month(current, -history), current)
+            )
+        except Exception as e:
+            logger.exception("DB query error in forecast")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+        if not rows:
+            return jsonify({"msg": "not enough history to forecast"}), 404
+
+        first = rows[0]['month']
+        span = forecast_engine.month_keys(first, history)
+        span = [mk for mk in span if mk < current]
+        categories, matrix = forecast_engine.history_matrix([tuple(r) for r in rows], span)
+        resp = offload.run(forecast_engine.interval_forecast, categories, matrix, months, n_paths, method,
+                           scenario, seed, under)
+        resp.update({
+            "months": forecast_engine.month_keys(current, months),
+            "history_months": span,
+            "method": method,
+            "paths_requested": n_paths,
+            "scenario": scenario
+        })
+        return jsonify(resp)
+
+    @app.route('/recurring', methods=['GET'])
+    @auth.user_required
+    def recurring_series():
+        """
+        Detected recurring transactions (subscriptions, rent, EMIs, salary) with projected occurrences.
+        Query params: horizon_days (default 90, max 730), include_stale (1 = also series that stopped)
+        """
+        user_id = g.user_id
+
+        try:
+            horizon = min(max(int(request.args.get('horizon_days', 90)), 0), 730)
+        except Exception:
+            return jsonify({"msg": "horizon_days must be an integer"}), 400
+        include_stale = request.args.get('include_stale') in ('1', 'true')
+
+        try:
+            series = recurring.list_series(user_id, datetime.utcnow().date(), horizon, include_stale)
+        except Exception as e:
+            logger.exception("DB query error in recurring_series")
+            return jsonify({"msg": "DB query failed", "error": str(e)}), 500
+
+        active = [s for s in series if s['active']]
+        monthly_cost = sum(s['monthly_amount'] for s in active if s['type'] == 'expense')
+        return jsonify({
+            "horizon_days": horizon,
+            "series": series,
+            "estimated_monthly_expense": round(monthly_cost, 2),
+            "projected_expense_total": round(sum(s['projected_total'] for s in active if s['type'] == 'expense'), 2)
+        })
+
     @app.route('/reports/monthly', methods=['GET'])
-    @jwt_required()
+    @auth.user_required
     def report_monthly():
         """
-        Returns monthly totals for last M months (default 12).
+        Returns monthly totals for last M months (default 12), archived months included.
         Output: list of {month: 'YYYY-MM', total_income: <float>, total_expense: <float>}
+        (or {columns, rows} with format=columns)
         """
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        user_id = g.user_id
 
         try:
             months = int(request.args.get('months', 12))
@@ -400,6 +873,7 @@ def create_app():
                 "SELECT date, amount, type FROM transactions WHERE user_id=? AND date >= ?",
                 (user_id, start_month.isoformat())
             )
+            archived = archive.monthly_totals(user_id, start_month.isoformat())
         except Exception as e:
             logger.exception("DB query failed in report_monthly")
             return jsonify({"msg": "DB query failed", "error": str(e)}), 500
@@ -416,34 +890,34 @@ def create_app():
             cur = cur.replace(year=year, month=month)
 
         for r in rows:
-            d = r.get('date')
+            d = r['date']
             parsed = parse_date(d)
             if not parsed:
                 continue
             m = parsed.strftime("%Y-%m")
-            amt = float(r.get('amount') or 0.0)
-            typ = r.get('type') or 'expense'
+            amt = float(r['amount'] or 0.0)
+            typ = r['type'] or 'expense'
             if m not in agg:
                 continue
             if typ == 'expense':
                 agg[m]['total_expense'] += amt
             else:
                 agg[m]['total_income'] += amt
+        for (m, typ), amt in archived.items():
+            if m in agg:
+                agg[m]['total_expense' if typ == 'expense' else 'total_income'] += amt
 
         result = [{"month": k, "total_income": round(v['total_income'], 2), "total_expense": round(v['total_expense'], 2)} for k, v in agg.items()]
-        return jsonify(result)
+        return jsonify(serialization.shape_rows(result))
 
     @app.route('/reports/series', methods=['GET'])
-    @jwt_required()
+    @auth.user_required
     def report_series():
         """
-        Return monthly time series for a specific category over last M months.
-        Query params: category (required), months (default 12)
+        Return monthly time series for a specific category over last M months, archived months included.
+        Query params: category (required), months (default 12), format=columns
         """
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        user_id = g.user_id
 
         category = request.args.get('category')
         if not category:
@@ -460,6 +934,7 @@ def create_app():
                 "SELECT date, amount FROM transactions WHERE user_id=? AND date >= ? AND category=?",
                 (user_id, start_month.isoformat(), category)
             )
+            archived = archive.monthly_totals(user_id, start_month.isoformat(), category=category)
         except Exception as e:
             logger.exception("DB query failed in report_series")
             return jsonify({"msg": "DB query failed", "error": str(e)}), 500
@@ -474,38 +949,43 @@ def create_app():
             cur = cur.replace(year=year, month=month)
 
         for r in rows:
-            d = r.get('date')
+            d = r['date']
             parsed = parse_date(d)
             if not parsed:
                 continue
             m = parsed.strftime("%Y-%m")
             if m not in agg:
                 continue
-            amt = float(r.get('amount') or 0.0)
+            amt = float(r['amount'] or 0.0)
             agg[m] += amt
+        for (m, _typ), amt in archived.items():
+            if m in agg:
+                agg[m] += amt
 
         series = [{"month": k, "total": round(v, 2)} for k, v in agg.items()]
-        return jsonify(series)
+        return jsonify(serialization.shape_rows(series))
 
     @app.route('/reports/summary', methods=['GET'])
-    @jwt_required()
+    @auth.user_required
     def summary():
         """
-        Quick summary: expense totals by category (all-time)
+        Quick summary: expense totals by category (all-time, archived history included),
+        summed from the monthly_spend index
         """
-        try:
-            user_id = int(get_jwt_identity())
-        except Exception:
-            user_id = get_jwt_identity()
+        user_id = g.user_id
 
         try:
-            rows = db.query_db("SELECT category, SUM(amount) as total FROM transactions WHERE user_id=? AND type='expense' GROUP BY category", (user_id,))
+            rows = db.query_db(
+                "SELECT category, SUM(total) as total FROM monthly_spend WHERE user_id=? GROUP BY category "
+                "HAVING ABS(SUM(total)) >= 0.005",
+                (user_id,)
+            )
         except Exception as e:
             logger.exception("DB query failed in summary")
             return jsonify({"msg": "DB query failed", "error": str(e)}), 500
 
         results = [dict(r) for r in rows]
-        return jsonify(results)
+        return jsonify(serialization.shape_rows(results))
 
     # ---------------- Helper endpoint: available categories ----------------
     @app.route('/categories', methods=['GET'])
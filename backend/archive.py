@@ -0,0 +1,350 @@
+# backend/archive.py
+"""
+Hot/cold tiering: transactions dated before the last ARCHIVE_HORIZON_MONTHS complete months move
+out of the transactions table into compressed column files, one per user and year:
+
+    <ARCHIVE_DIR>/<user_id>/<year>.txc
+
+A file is a JSON header followed by one zlib block per column: numbers as numpy arrays, low-
+cardinality text (type, category, source) as dictionary codes, free text as offsets plus UTF-8.
+Readers memory-map the file and decompress only the columns they use. ARCHIVE_DIR defaults to
+archive/ next to DB_PATH and is shared by all shards (files are keyed by user, so moving a user
+between shards leaves them in place).
+
+daily_cumsum and monthly_spend keep the archived rows' totals (the delete triggers skip users in
+`archiving`), so /reports/range, /reports/category, budgets and /forecast see all history.
+/reports/monthly, /reports/series, /reports/summary and /transactions/export read both tiers, and
+the anomaly baselines and recurring series are rebuilt from both (anomalies.backfill,
+recurring.refresh/rebuild). archive_keys lists the years each merchant key appears in, so the
+refresh after an insert reads only those files. Listing, search, flagged anomalies and category
+overrides cover hot rows only. Archived rows are read-only: re-categorization leaves them as they
+are.
+
+archive_user holds the shard's write lock while it appends a user's old rows to their year files,
+deletes them from transactions and bumps archive_marks.generation. Rows carry the generation that
+wrote them and readers skip any above the committed one, so a run that dies after writing files
+but before its commit leaves nothing visible twice; the next run drops those rows.
+"""
+import os
+import json
+import mmap
+import zlib
+import struct
+import logging
+from datetime import date
+
+import db
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger("expense-backend")
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR")
+HORIZON_MONTHS = int(os.environ.get("ARCHIVE_HORIZON_MONTHS", "24"))
+ZLIB_LEVEL = 6
+
+MAGIC = b"TXCOL01\n"
+SUFFIX = ".txc"
+
+# stored columns and their encodings; 'generation' is added by archive_user
+COLUMNS = [
+    ("id", "i8"), ("date", "date"), ("amount", "f8"), ("type", "dict"), ("category", "dict"),
+    ("category_source", "dict"), ("description", "text"), ("merchant_key", "text"),
+    ("fingerprint", "text"), ("created_at", "text"),
+]
+ROW_COLUMNS = [name for name, _ in COLUMNS]
+ENCODINGS = dict(COLUMNS, generation="u4")
+
+# ----- paths -----
+def archive_dir():
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(db.DB_PATH)), "archive")
+
+def year_path(user_id, year):
+    return os.path.join(archive_dir(), str(int(user_id)), "%s%s" % (year, SUFFIX))
+
+def user_years(user_id):
+    """Archived years of a user, ascending."""
+    try:
+        names = os.listdir(os.path.join(archive_dir(), str(int(user_id))))
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-len(SUFFIX)]) for n in names if n.endswith(SUFFIX) and n[:-len(SUFFIX)].isdigit())
+
+# ----- column file format -----
+def _encode(encoding, values):
+    """-> (raw block bytes, header fields)"""
+    if encoding == "date":
+        return np.array(values, dtype="datetime64[D]").astype("<i4").tobytes(), {"dtype": "<i4"}
+    if encoding in ("i8", "f8", "u4"):
+        return np.asarray(values, dtype="<" + encoding).tobytes(), {"dtype": "<" + encoding}
+    if encoding == "dict":
+        levels = sorted({v for v in values if v is not None})
+        if len(levels) < 65535:
+            index = {v: i + 1 for i, v in enumerate(levels)}  # code 0 is NULL
+            codes = np.fromiter((index.get(v, 0) for v in values), dtype="<u2", count=len(values))
+            return codes.tobytes(), {"dtype": "<u2", "levels": levels}
+    # free text: n+1 offsets, the UTF-8 bytes, then a packed NULL mask if any value is NULL
+    parts = [(v or "").encode("utf-8") for v in values]
+    offsets = np.zeros(len(parts) + 1, dtype="<i8")
+    np.cumsum([len(p) for p in parts], out=offsets[1:])
+    nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    block = offsets.tobytes() + b"".join(parts)
+    if nulls.any():
+        block += np.packbits(nulls).tobytes()
+    return block, {"text": True, "nulls": bool(nulls.any())}
+
+def _decode(meta, raw, n):
+    if meta.get("text"):
+        offsets = np.frombuffer(raw, dtype="<i8", count=n + 1)
+        start = 8 * (n + 1)
+        data = raw[start:start + int(offsets[-1])]
+        out = np.empty(n, dtype=object)
+        out[:] = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(n)]
+        if meta.get("nulls"):
+            mask = np.unpackbits(np.frombuffer(raw, dtype=np.uint8, offset=start + int(offsets[-1])), count=n)
+            out[mask.astype(bool)] = None
+        return out
+    arr = np.frombuffer(raw, dtype=meta["dtype"], count=n)
+    if "levels" in meta:
+        return np.array([None] + meta["levels"], dtype=object)[arr]
+    if meta["encoding"] == "date":
+        return arr.astype("datetime64[D]")
+    return arr
+
+def write_file(path, columns):
+    """Write {name: values} (equal lengths) to path atomically (temp file + rename)."""
+    n = len(columns["id"])
+    header = {"rows": n, "columns": []}
+    blocks = []
+    offset = 0
+    for name, values in columns.items():
+        encoding = ENCODINGS[name]
+        raw, meta = _encode(encoding, values)
+        block = zlib.compress(raw, ZLIB_LEVEL)
+        header["columns"].append(dict(meta, name=name, encoding=encoding, offset=offset, length=len(block)))
+        blocks.append(block)
+        offset += len(block)
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head)
+        for block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_file(path, names=None):
+    """{name: numpy array} for the requested columns (all by default), decompressing only those."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("not an archive file: %s" % path)
+        (head_len,) = struct.unpack_from("<I", mm, len(MAGIC))
+        base = len(MAGIC) + 4 + head_len
+        header = json.loads(mm[len(MAGIC) + 4:base])
+        n = header["rows"]
+        out = {}
+        view = memoryview(mm)
+        try:
+            for meta in header["columns"]:
+                if names is None or meta["name"] in names:
+                    start = base + meta["offset"]
+                    out[meta["name"]] = _decode(meta, zlib.decompress(view[start:start + meta["length"]]), n)
+        finally:
+            view.release()
+    return out
+
+# ----- reads -----
+def mark(user_id, conn=None):
+    """(through, generation) for an archived user, else None."""
+    sql = "SELECT through, generation FROM archive_marks WHERE user_id=?"
+    row = conn.execute(sql, (user_id,)).fetchone() if conn is not None else db.query_db(sql, (user_id,), one=True)
+    return (row[0], row[1]) if row else None
+
+def _years(user_id, start=None, end=None):
+    return [y for y in user_years(user_id)
+            if not (start and str(y) < start[:4]) and not (end and str(y) > end[:4])]
+
+def key_years(user_id, keys, conn=None):
+    """Archive years (as strings) holding rows of user_id with any of the merchant keys."""
+    keys = sorted({k for k in keys if k})
+    years = set()
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        sql = "SELECT DISTINCT year FROM archive_keys WHERE user_id=? AND merchant_key IN (%s)" % ",".join("?" * len(chunk))
+        rows = conn.execute(sql, [user_id] + chunk).fetchall() if conn is not None else db.query_db(sql, [user_id] + chunk)
+        years.update(r[0] for r in rows)
+    return years
+
+def _year_rows(user_id, year, names, generation, start=None, end=None, category=None, merchant_keys=None):
+    """One year file's rows written by committed runs, within the filters, as {name: array}."""
+    wanted = set(names) | {"date", "generation"} | ({"category"} if category is not None else set())
+    if merchant_keys is not None:
+        wanted.add("merchant_key")
+    cols = read_file(year_path(user_id, year), wanted)
+    keep = cols["generation"] <= generation
+    if merchant_keys is not None:
+        keep &= np.fromiter((k in merchant_keys for k in cols["merchant_key"].tolist()), dtype=bool, count=len(keep))
+    if start:
+        keep &= cols["date"] >= np.datetime64(start[:10])
+    if end:
+        keep &= cols["date"] <= np.datetime64(end[:10])
+    if category is not None:
+        keep &= cols["category"] == category
+    return {name: cols[name][keep] for name in names}
+
+def scan(user_id, names, start=None, end=None, category=None, conn=None, merchant_keys=None):
+    """
+    Committed archived rows of user_id as {name: array} (dates as datetime64[D]), in date order,
+    optionally limited to start <= date <= end (ISO strings), one category and a set of merchant
+    keys (only the year files archive_keys lists for them are read).
+    """
+    m = mark(user_id, conn)
+    years = _years(user_id, start, end) if m else []
+    if m and merchant_keys is not None:
+        merchant_keys = set(merchant_keys)
+        listed = key_years(user_id, merchant_keys, conn)
+        years = [y for y in years if str(y) in listed]
+    parts = [_year_rows(user_id, y, names, m[1], start, end, category, merchant_keys) for y in years]
+    if not parts:
+        return {name: np.array([], dtype="datetime64[D]" if name == "date" else object) for name in names}
+    return {name: np.concatenate([p[name] for p in parts]) for name in names}
+
+def monthly_totals(user_id, start=None, category=None, conn=None):
+    """{('YYYY-MM', type): summed amount} over committed archived rows dated on/after start."""
+    cols = scan(user_id, ["date", "amount", "type"], start=start, category=category, conn=conn)
+    totals = {}
+    months = np.datetime_as_string(cols["date"].astype("datetime64[M]")).tolist()
+    for key, amount in zip(zip(months, cols["type"].tolist()), cols["amount"].tolist()):
+        totals[key] = totals.get(key, 0.0) + amount
+    return totals
+
+def iter_rows(user_id, names, start=None, end=None, conn=None):
+    """Archived rows as tuples of `names` (date as ISO string), in date order, one year file at a time."""
+    m = mark(user_id, conn)
+    if m is None:
+        return
+    for year in _years(user_id, start, end):
+        cols = _year_rows(user_id, year, names, m[1], start, end)
+        yield from zip(*[np.datetime_as_string(cols[n]).tolist() if n == "date" else cols[n].tolist() for n in names])
+
+def existing_fingerprints(user_id, rows, conn=None):
+    """Of [(ISO date, fingerprint)], the fingerprints already in the user's archive."""
+    m = mark(user_id, conn)
+    if m is None:
+        return set()
+    by_year = {}
+    for day, fp in rows:
+        if day < m[0]:
+            by_year.setdefault(day[:4], set()).add(fp)
+    found = set()
+    for year, fps in by_year.items():
+        path = year_path(user_id, year)
+        if os.path.exists(path):
+            cols = read_file(path, {"fingerprint", "generation"})
+            stored = cols["fingerprint"][cols["generation"] <= m[1]]
+            found.update(fps.intersection(stored.tolist()))
+    return found
+
+# ----- archiving -----
+def cutoff(today=None, months=None):
+    """First day of the month `months` (default HORIZON_MONTHS) before today's month, ISO."""
+    today = today or date.today()
+    months = HORIZON_MONTHS if months is None else months
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1).isoformat()
+
+def candidates(conn, before):
+    """[(user_id, hot rows dated before `before`)] on conn's shard."""
+    return [tuple(r) for r in conn.execute(
+        "SELECT user_id, COUNT(*) FROM transactions WHERE date < ? GROUP BY user_id ORDER BY user_id", (before,))]
+
+def archive_user(conn, user_id, before):
+    """Move user_id's rows dated before `before` (ISO) from conn's shard into their year files. Returns rows moved."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        m = mark(user_id, conn)
+        committed = m[1] if m else 0
+        rows = conn.execute(
+            "SELECT %s FROM transactions WHERE user_id=? AND date < ? ORDER BY date, id" % ", ".join(ROW_COLUMNS),
+            (user_id, before)
+        ).fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+        by_year = {}
+        for r in rows:
+            by_year.setdefault(r["date"][:4], []).append(r)
+        for year, part in by_year.items():
+            path = year_path(user_id, year)
+            merged = {name: [] for name in ROW_COLUMNS + ["generation"]}
+            if os.path.exists(path):
+                old = read_file(path)
+                keep = old["generation"] <= committed  # drops rows of a run that never committed
+                for name in merged:
+                    values = old[name][keep]
+                    merged[name] = (np.datetime_as_string(values) if name == "date" else values).tolist()
+            for r in part:
+                for name in ROW_COLUMNS:
+                    merged[name].append(r[name])
+                merged["generation"].append(committed + 1)
+            order = sorted(range(len(merged["date"])), key=merged["date"].__getitem__)
+            write_file(path, {name: [values[i] for i in order] for name, values in merged.items()})
+
+        conn.execute("DELETE FROM temp.archive_ids")
+        conn.executemany("INSERT INTO temp.archive_ids (id) VALUES (?)", [(r["id"],) for r in rows])
+        conn.execute("INSERT INTO archiving (user_id) VALUES (?)", (user_id,))
+        conn.execute("DELETE FROM anomalies WHERE transaction_id IN (SELECT id FROM temp.archive_ids)")
+        conn.execute("DELETE FROM transactions WHERE id IN (SELECT id FROM temp.archive_ids)")
+        conn.execute("DELETE FROM archiving WHERE user_id=?", (user_id,))
+        conn.executemany("INSERT OR IGNORE INTO archive_keys (user_id, merchant_key, year) VALUES (?, ?, ?)",
+                         sorted({(user_id, r["merchant_key"], r["date"][:4]) for r in rows if r["merchant_key"]}))
+        conn.execute(
+            "INSERT INTO archive_marks (user_id, through, generation, rows) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET through=MAX(through, excluded.through), "
+            "generation=excluded.generation, rows=rows+excluded.rows, updated_at=CURRENT_TIMESTAMP",
+            (user_id, before, committed + 1, len(rows))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
+
+def archive_shard(conn, before, users=None):
+    """archive_user for every user on conn's shard with rows before `before` (or only `users`). Returns {user_id: rows}."""
+    moved = {}
+    for user_id, _ in candidates(conn, before):
+        if users is None or user_id in users:
+            moved[user_id] = archive_user(conn, user_id, before)
+    if moved:
+        logger.info("Archived %d rows of %d users (before %s)", sum(moved.values()), len(moved), before)
+    return moved
+
+def ensure_index(conn):
+    """Fill archive_keys for users archived before it existed (from their year files)."""
+    users = [r[0] for r in conn.execute(
+        "SELECT user_id FROM archive_marks WHERE user_id NOT IN (SELECT user_id FROM archive_keys)")]
+    for user_id in users:
+        generation = mark(user_id, conn)[1]
+        found = set()
+        for year in user_years(user_id):
+            cols = read_file(year_path(user_id, year), {"merchant_key", "generation"})
+            keys = cols["merchant_key"][cols["generation"] <= generation].tolist()
+            found.update((user_id, k, str(year)) for k in keys if k)
+        conn.executemany("INSERT OR IGNORE INTO archive_keys (user_id, merchant_key, year) VALUES (?, ?, ?)",
+                         sorted(found))
+    conn.commit()
+    return len(users)
+
+def status(conn):
+    """[{user_id, through, generation, rows, files, bytes}] for the archived users on conn's shard."""
+    out = []
+    for r in conn.execute("SELECT user_id, through, generation, rows FROM archive_marks ORDER BY user_id"):
+        paths = [year_path(r[0], y) for y in user_years(r[0])]
+        out.append({"user_id": r[0], "through": r[1], "generation": r[2], "rows": r[3],
+                    "files": len(paths), "bytes": sum(os.path.getsize(p) for p in paths)})
+    return out
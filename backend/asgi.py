@@ -0,0 +1,154 @@
+# backend/asgi.py
+"""
+ASGI entry point: the same routes as the WSGI app, served from an asyncio event loop.
+
+    uvicorn asgi:application --app-dir backend --workers 2 --port 8000
+
+- Request bodies are received and responses sent asynchronously, so a slow client (a large CSV
+  upload on a slow link) holds no thread while its bytes trickle in.
+- Route handlers are the unchanged Flask views. They do blocking SQLite work, so each request
+  runs in a bounded thread pool (ASGI_THREADS, default 16); requests beyond that queue on the
+  event loop instead of piling up threads.
+- Responses are sent as the view produces them: each chunk of a streamed response
+  (/transactions/export) goes out as its own http.response.body message, with the handler thread
+  waiting for the client to take it, so a large export is never held in memory.
+- CPU-heavy work inside the handlers (categorizing uploads, forecast simulation) goes through
+  offload.py to a process pool (ASGI_PROCESSES, default min(4, CPU count); 0 keeps it in-process).
+"""
+import io
+import os
+import sys
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import offload
+from app import create_app
+
+logger = logging.getLogger("expense-backend")
+
+THREADS = int(os.environ.get("ASGI_THREADS", "16"))
+PROCESSES = int(os.environ.get("ASGI_PROCESSES", str(min(4, os.cpu_count() or 1))))
+MAX_BODY = int(os.environ.get("ASGI_MAX_BODY", str(32 * 1024 * 1024)))
+
+class WSGIBridge:
+    """ASGI 3 application running a WSGI app's requests in a bounded thread pool."""
+
+    def __init__(self, wsgi_app, threads=THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-handler")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return  # no websockets
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY:
+                return await self._send(send, 413, [(b"content-type", b"application/json")],
+                                        [b'{"msg": "request body too large"}'])
+            if not message.get("more_body"):
+                break
+        environ = self.environ(scope, bytes(body))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.call_wsgi, environ, send, loop)
+
+    def call_wsgi(self, environ, send, loop):
+        """
+        Run the WSGI app in this worker thread and send its response from here, one chunk at a time,
+        waiting for each message to be sent. The iterable is consumed in the thread that started it
+        (a streamed Flask view keeps its request context). One chunk is held back so the last goes
+        out with more_body=False: a plain response is one body message, as before.
+        """
+        response = {"pending": None}
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def body(data, more):
+            if "status" in response:
+                emit({"type": "http.response.start", "status": response.pop("status"),
+                      "headers": response.pop("headers")})
+            emit({"type": "http.response.body", "body": data, "more_body": more})
+
+        def write(data):
+            if data:
+                if response["pending"] is not None:
+                    body(response["pending"], True)
+                response["pending"] = data
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+            return write
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                write(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        body(response["pending"] or b"", False)
+
+    @staticmethod
+    async def _send(send, status, headers, chunks):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"".join(chunks)})
+
+    @staticmethod
+    def environ(scope, body):
+        """PEP 3333 environ for an ASGI http scope."""
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": str(server[0]),
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": client[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            key = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if key == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif key != "CONTENT_LENGTH":
+                key = "HTTP_" + key
+                environ[key] = environ[key] + "," + value if key in environ else value
+        return environ
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, offload.configure, PROCESSES)
+                except Exception as e:
+                    logger.exception("ASGI startup failed")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                offload.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+application = WSGIBridge(create_app())
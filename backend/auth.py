@@ -1,11 +1,111 @@
 # backend/auth.py
-from flask import Blueprint, request, jsonify
+"""
+Registration/login, and the user_required decorator the protected routes use.
+
+Password hashes use PASSWORD_HASH_METHOD (any werkzeug method string, e.g. "scrypt",
+"scrypt:16384:8:1", "pbkdf2:sha256:600000"; default werkzeug's own default). A successful login
+with a hash made under different parameters stores a fresh hash, so changing the setting takes
+effect as users log in (PASSWORD_REHASH=0 turns that off).
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Blueprint, request, jsonify, g
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, verify_jwt_in_request, get_jwt, get_jwt_identity
 import db
 
+logger = logging.getLogger("expense-backend")
+
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+PASSWORD_REHASH = os.environ.get("PASSWORD_REHASH", "1").lower() not in ("0", "false", "no")
+TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE", "4096"))  # 0 disables the cache
+
+EMAIL_LOOKUP = "SELECT id, email, password_hash FROM users WHERE email=?"
+
 auth_bp = Blueprint('auth', __name__)
 
+# ----- identity -----
+# raw bearer token -> (user_id, exp). A token that verified once verifies again until it expires,
+# so repeat requests skip signature checking and claim decoding.
+_token_cache = OrderedDict()
+_token_lock = threading.Lock()
+
+def _bearer_token():
+    header = request.headers.get("Authorization", "")
+    if header[:7].lower() == "bearer ":
+        return header[7:].strip()
+    return None
+
+def _cached_identity(token):
+    with _token_lock:
+        hit = _token_cache.get(token)
+        if hit is None:
+            return None
+        if hit[1] <= time.time():
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return hit[0]
+
+def _remember(token, user_id, exp):
+    with _token_lock:
+        _token_cache[token] = (user_id, exp)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+def user_required(fn):
+    """
+    jwt_required() that also resolves the user id once, into g.user_id (an int for the ids this
+    app issues). Invalid or missing tokens get flask_jwt_extended's usual 401/422 responses.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _bearer_token() if TOKEN_CACHE_SIZE > 0 else None
+        user_id = _cached_identity(token) if token else None
+        if user_id is None:
+            verify_jwt_in_request()
+            identity = get_jwt_identity()
+            try:
+                user_id = int(identity)
+            except Exception:
+                user_id = identity
+            if token:
+                _remember(token, user_id, get_jwt().get("exp", float("inf")))
+        g.user_id = user_id
+        return fn(*args, **kwargs)
+    return wrapper
+
+# ----- password hashing -----
+_method_prefix = {}
+
+def _hash_prefix(method):
+    """werkzeug's full parameter string for `method` ("scrypt" -> "scrypt:32768:8:1")."""
+    prefix = _method_prefix.get(method)
+    if prefix is None:
+        prefix = _method_prefix[method] = generate_password_hash("", method).split("$", 1)[0]
+    return prefix
+
+def hash_password(pwd):
+    return generate_password_hash(pwd, PASSWORD_HASH_METHOD)
+
+def needs_rehash(pwd_hash):
+    return PASSWORD_REHASH and pwd_hash.split("$", 1)[0] != _hash_prefix(PASSWORD_HASH_METHOD)
+
+def ensure_email_index(conn):
+    """Login looks users up by email; make sure that is an index search, not a table scan."""
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + EMAIL_LOOKUP, ("",)))
+    if plan.startswith("SEARCH") and "INDEX" in plan:
+        return
+    logger.warning("users.email lookup is not indexed (%s); creating idx_users_email", plan)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+    conn.commit()
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json(force=True)
@@ -14,15 +114,16 @@ def register():
     if not email or not pwd:
         return jsonify({"msg": "email and password required"}), 400
 
-    existing = db.query_db("SELECT * FROM users WHERE email=?", (email,), one=True)
+    existing = db.query_db("SELECT 1 FROM users WHERE email=?", (email,), one=True)
     if existing:
         return jsonify({"msg": "user exists"}), 400
 
-    pwd_hash = generate_password_hash(pwd)
+    pwd_hash = hash_password(pwd)
     user_id = db.execute_db(
         "INSERT INTO users (email, password_hash) VALUES (?, ?)",
         (email, pwd_hash)
     )
+    db.place_user(user_id)
     return jsonify({"msg": "registered", "user_id": user_id}), 201
 
 
@@ -34,13 +135,20 @@ def login():
     if not email or not pwd:
         return jsonify({"msg": "email and password required"}), 400
 
-    user = db.query_db("SELECT * FROM users WHERE email=?", (email,), one=True)
+    user = db.query_db(EMAIL_LOOKUP, (email,), one=True)
     if not user:
         return jsonify({"msg": "bad credentials"}), 401
 
     if not check_password_hash(user['password_hash'], pwd):
         return jsonify({"msg": "bad credentials"}), 401
 
+    if needs_rehash(user['password_hash']):
+        try:
+            db.execute_db("UPDATE users SET password_hash=? WHERE id=?", (hash_password(pwd), user['id']))
+        except Exception:
+            # the login itself succeeded; try again next time
+            logger.exception("Password rehash failed for user %s", user['id'])
+
     # IMPORTANT: cast identity to string so JWT subject ('sub') is a string
     access = create_access_token(identity=str(user['id']))
     return jsonify({
@@ -0,0 +1,691 @@
+# backend/backup.py
+"""
+Online backups of every shard, taken while the app keeps serving, and point-in-time restores.
+
+A full backup copies the database with SQLite's online backup API, BACKUP_PAGES_PER_STEP pages
+at a time with a BACKUP_STEP_SLEEP_MS pause after each step. In WAL mode the whole copy reads one
+snapshot (a read transaction held on the source), which doesn't block writers and which their
+commits can't restart. In rollback-journal mode each step holds the read lock only while it
+runs, but every commit restarts the copy. After BACKUP_MAX_RESTARTS restarts the rest is copied
+in one step, and commits wait until that step is done.
+
+With BACKUP_WAL=1 (db.WAL_SNAPSHOTS) the shards run in WAL mode, and snapshot() adds restore
+points to the newest full backup. It copies the WAL frames committed since the previous snapshot
+into a segment file, then checkpoints them into the database. Connections from db.connect never
+checkpoint on their own. snapshot() holds the write lock from the copy through its checkpoint,
+so a WAL restart only ever drops frames that are already in a segment. The last connection to
+close checkpoints and deletes the WAL, so init_app keeps one connection per shard open. When the
+WAL was emptied, or restarted other than right after a snapshot's checkpoint (the app stopped,
+say), the next snapshot starts a new chain with a full backup. Connections opened elsewhere (the
+sqlite3 shell) checkpoint on their own and can go unnoticed: take a full backup after using one.
+
+    <BACKUP_DIR>/shard-<n>/<chain>/base.db, 000001.wal, 000002.wal, ..., manifest.json
+
+Transactions past the archive horizon live only in archive.py's year files. Each restore point
+also copies the year files of the shard's archived users that changed since the previous point,
+after its database copy, into <chain>/archive/<point>/. archive.write_file replaces files
+atomically and never drops a committed row, so a copy taken after the point holds every row the
+point's archive_marks counts; rows of later runs carry a higher generation and are ignored.
+
+    <BACKUP_DIR>/shard-<n>/<chain>/archive/base/<user_id>/<year>.txc, archive/000001/..., ...
+
+restore() rebuilds a shard as of any restore point of a chain into a new file, and its archived
+users' year files into a new directory (point ARCHIVE_DIR at it, or copy them back). verify()
+restores the newest point into a scratch directory, runs PRAGMA integrity_check, checks that the
+year files hold archive_marks.rows committed rows for every archived user, and records how long
+it all took.
+
+  BACKUP_DIR                default <directory of DB_PATH>/backups
+  BACKUP_PAGES_PER_STEP     pages per backup step (default 256; -1 = the whole file in one step)
+  BACKUP_STEP_SLEEP_MS      pause after every step (default 5)
+  BACKUP_MAX_RESTARTS       restarts before a rollback-journal copy finishes in one step (default 3)
+  BACKUP_KEEP               chains kept per shard (default 3)
+  BACKUP_SCHEDULE           1 = run the scheduler in the app (default off)
+  BACKUP_SNAPSHOT_MINUTES   scheduler: a WAL snapshot this often (default 15)
+  BACKUP_FULL_HOURS         scheduler: a new chain when the newest is this old (default 24)
+  BACKUP_VERIFY             scheduler: verify every new chain once written (default 1)
+"""
+import os
+import json
+import time
+import shutil
+import struct
+import sqlite3
+import logging
+import calendar
+import tempfile
+import threading
+from itertools import groupby
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): jobs are still serialized within the process
+    fcntl = None
+
+import db
+import archive
+import metrics
+
+logger = logging.getLogger("expense-backend")
+
+BACKUP_DIR = os.environ.get("BACKUP_DIR")
+PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", "256"))
+STEP_SLEEP = float(os.environ.get("BACKUP_STEP_SLEEP_MS", "5")) / 1000.0
+MAX_RESTARTS = int(os.environ.get("BACKUP_MAX_RESTARTS", "3"))
+KEEP = int(os.environ.get("BACKUP_KEEP", "3"))
+SCHEDULE = os.environ.get("BACKUP_SCHEDULE", "").lower() in ("1", "true", "yes")
+SNAPSHOT_MINUTES = float(os.environ.get("BACKUP_SNAPSHOT_MINUTES", "15"))
+FULL_HOURS = float(os.environ.get("BACKUP_FULL_HOURS", "24"))
+VERIFY = os.environ.get("BACKUP_VERIFY", "1").lower() not in ("0", "false", "no")
+
+BASE = "base.db"
+MANIFEST = "manifest.json"
+ARCHIVE = "archive"
+WAL_HEADER = 32
+FRAME_HEADER = 24
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+KEEP_VERIFICATIONS = 20
+
+def backup_dir():
+    return BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(db.DB_PATH)), "backups")
+
+def shard_dir(shard):
+    return os.path.join(backup_dir(), "shard-%d" % shard)
+
+def _now():
+    """UTC, in SQLite's CURRENT_TIMESTAMP format."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+def _age(timestamp):
+    """Seconds since a _now() timestamp."""
+    return time.time() - calendar.timegm(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+@contextmanager
+def _shard_lock(shard):
+    """One backup job per shard at a time: a thread lock in this process, flock across processes."""
+    with _thread_locks_guard:
+        lock = _thread_locks.setdefault(shard, threading.Lock())
+    with lock:
+        os.makedirs(shard_dir(shard), exist_ok=True)
+        with open(os.path.join(shard_dir(shard), ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+# ----- manifests -----
+def _write_json(path, doc):
+    """Write doc to path atomically (temp file + rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def chains(shard):
+    """Manifests of shard's chains, oldest first (directories without a manifest are unfinished)."""
+    d = shard_dir(shard)
+    if not os.path.isdir(d):
+        return []
+    out = []
+    for name in sorted(os.listdir(d)):
+        path = os.path.join(d, name, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                out.append(json.load(f))
+    return out
+
+def _chain_dir(manifest):
+    return os.path.join(shard_dir(manifest["shard"]), manifest["chain"])
+
+def prune(shard):
+    """Delete all but the newest KEEP chains of shard, and unfinished ones. Returns the names removed."""
+    d = shard_dir(shard)
+    names = sorted(n for n in os.listdir(d) if os.path.isdir(os.path.join(d, n)))
+    finished = [n for n in names if os.path.exists(os.path.join(d, n, MANIFEST))]
+    keep = set(finished[-KEEP:]) if KEEP > 0 else set(finished)
+    removed = [n for n in names if n not in keep]
+    for n in removed:
+        shutil.rmtree(os.path.join(d, n), ignore_errors=True)
+    return removed
+
+# ----- WAL files -----
+def _wal_header(path):
+    """(page_size, [salt1, salt2], raw bytes) of path's WAL, None while it is empty."""
+    try:
+        with open(path + "-wal", "rb") as f:
+            raw = f.read(WAL_HEADER)
+    except FileNotFoundError:
+        return None
+    if len(raw) < WAL_HEADER:
+        return None
+    magic, _, page_size, _, salt1, salt2 = struct.unpack(">6I", raw[:24])
+    if magic not in WAL_MAGIC:
+        return None
+    return page_size, [salt1, salt2], raw
+
+def _committed_end(f, start, salts, page_size):
+    """
+    (offset just past the last commit frame from `start` on, frames up to there). Frames with other
+    salts are left over from before the last WAL restart; frames after the last commit frame belong
+    to a rolled-back transaction. Only exact while no one can write (the caller holds the write lock).
+    """
+    size = os.fstat(f.fileno()).st_size
+    frame = FRAME_HEADER + page_size
+    pos, n, end, frames = start, 0, start, 0
+    while pos + frame <= size:
+        f.seek(pos)
+        pgno, commit, salt1, salt2 = struct.unpack(">4I", f.read(16))
+        if pgno == 0 or [salt1, salt2] != salts:
+            break
+        pos += frame
+        n += 1
+        if commit:
+            end, frames = pos, n
+    return end, frames
+
+def _copy_range(f, start, end, path):
+    """Copy bytes [start, end) of the open file f to path, durably."""
+    f.seek(start)
+    remaining = end - start
+    with open(path, "wb") as out:
+        while remaining:
+            block = f.read(min(remaining, 1 << 20))
+            out.write(block)
+            remaining -= len(block)
+        out.flush()
+        os.fsync(out.fileno())
+
+# ----- archived transactions -----
+def _archived_users(conn):
+    return [r[0] for r in conn.execute("SELECT user_id FROM archive_marks ORDER BY user_id")]
+
+def _copy_archive(manifest, chain_dir, point, users):
+    """
+    Copy the year files of `users` that changed since the chain's last copy of them into
+    <chain>/archive/<point>/; manifest["archive"] keeps each file's (size, mtime) as copied.
+    Returns {"dir", "files" (relative paths), "bytes"}.
+    """
+    copied = manifest.setdefault("archive", {})
+    out = {"dir": point, "files": [], "bytes": 0}
+    for user_id in users:
+        for year in archive.user_years(user_id):
+            rel = "%d/%d%s" % (user_id, year, archive.SUFFIX)
+            try:
+                src = open(archive.year_path(user_id, year), "rb")
+            except FileNotFoundError:
+                continue
+            with src:
+                st = os.fstat(src.fileno())  # of the file being copied, should a new one replace it meanwhile
+                state = [st.st_size, st.st_mtime_ns]
+                if copied.get(rel) == state:
+                    continue
+                dest = os.path.join(chain_dir, ARCHIVE, point, rel)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, "wb") as f:
+                    shutil.copyfileobj(src, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            copied[rel] = state
+            out["files"].append(rel)
+            out["bytes"] += st.st_size
+    return out
+
+def _restore_archive(manifest, chain_dir, segments, dest):
+    """Newest copy of every year file as of the last of `segments` (or the base) into the new directory dest."""
+    newest = {}
+    for entry in [manifest["base"]] + segments:
+        for rel in entry.get("archive", {}).get("files", []):
+            newest[rel] = entry["archive"]["dir"]
+    if not newest:
+        return 0
+    tmp = dest + ".restoring"
+    shutil.rmtree(tmp, ignore_errors=True)
+    for rel, point in newest.items():
+        os.makedirs(os.path.dirname(os.path.join(tmp, rel)), exist_ok=True)
+        shutil.copyfile(os.path.join(chain_dir, ARCHIVE, point, rel), os.path.join(tmp, rel))
+    os.replace(tmp, dest)
+    return len(newest)
+
+def _check_archive(conn, archive_path):
+    """Problems with the restored year files in archive_path: users whose committed rows don't match archive_marks."""
+    problems = []
+    for user_id, generation, expected in conn.execute("SELECT user_id, generation, rows FROM archive_marks ORDER BY user_id"):
+        d = os.path.join(archive_path, str(user_id))
+        names = sorted(n for n in os.listdir(d) if n.endswith(archive.SUFFIX)) if os.path.isdir(d) else []
+        if not names:
+            problems.append("user %d: no archive files (%d rows archived)" % (user_id, expected))
+            continue
+        found = 0
+        for name in names:
+            try:
+                found += int((archive.read_file(os.path.join(d, name), {"generation"})["generation"] <= generation).sum())
+            except Exception as e:
+                problems.append("user %d: %s: %s" % (user_id, name, e))
+        if found != expected:
+            problems.append("user %d: %d archived rows in files, archive_marks counts %d" % (user_id, found, expected))
+    return problems
+
+# ----- full backups -----
+class _TooManyRestarts(Exception):
+    pass
+
+def _copy(src, dest_path):
+    """Online-backup the connection src into dest_path in paced steps. Returns the step stats."""
+    stats = {"pages": 0, "steps": 0, "restarts": 0, "mode": "paced"}
+    last = [None]
+
+    def progress(status, remaining, total):
+        stats["steps"] += 1
+        stats["pages"] = total
+        if last[0] is not None and remaining > last[0]:
+            stats["restarts"] += 1  # another connection committed: the copy started over
+            if stats["restarts"] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last[0] = remaining
+        if remaining and STEP_SLEEP > 0:
+            time.sleep(STEP_SLEEP)
+
+    dest = sqlite3.connect(dest_path)
+    try:
+        try:
+            src.backup(dest, pages=PAGES_PER_STEP, progress=progress)
+        except _TooManyRestarts:
+            stats["mode"] = "single step"
+            src.backup(dest, pages=-1)
+    finally:
+        dest.close()
+    return stats
+
+def _full_backup(shard):
+    path = db.shard_paths()[shard]
+    name = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    chain_dir = os.path.join(shard_dir(shard), name)
+    n = 1
+    while os.path.exists(chain_dir):
+        n += 1
+        chain_dir = os.path.join(shard_dir(shard), "%s-%d" % (name, n))
+    os.makedirs(chain_dir)
+    base = os.path.join(chain_dir, BASE)
+
+    t0 = time.perf_counter()
+    src = db.connect(path)
+    try:
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        state = None
+        if wal:
+            # one read snapshot for the whole copy; the WAL can't restart while it is held
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            header = _wal_header(path)
+            if header is None:
+                state = {"salt": None, "offset": WAL_HEADER, "complete": True, "header": None}
+            else:
+                page_size, salts, raw = header
+                # the base holds this WAL up to some frame: the first snapshot copies it from the start
+                state = {"salt": salts, "offset": WAL_HEADER, "complete": False, "header": raw.hex()}
+        stats = _copy(src, base + ".tmp")
+        users = _archived_users(src)
+    finally:
+        if src.in_transaction:
+            src.rollback()
+        src.close()
+    with open(base + ".tmp", "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(base + ".tmp", base)
+    manifest = {"archive": {}}
+    archived = _copy_archive(manifest, chain_dir, "base", users)
+    seconds = time.perf_counter() - t0
+
+    manifest.update({
+        "chain": os.path.basename(chain_dir),
+        "shard": shard,
+        "source": path,
+        "created": _now(),
+        "checked": _now(),
+        "base": dict(stats, file=BASE, bytes=os.path.getsize(base), seconds=round(seconds, 3), archive=archived),
+        "wal": state,
+        "snapshots": [],
+        "verified": [],
+    })
+    _write_json(os.path.join(chain_dir, MANIFEST), manifest)
+    removed = prune(shard)
+    metrics.BACKUP_DURATION.observe(seconds, "full")
+    logger.info("Backup of shard %d: %s, %d pages and %d archive files in %.2fs (%s, %d steps, %d restarts)", shard,
+                manifest["chain"], stats["pages"], len(archived["files"]), seconds, stats["mode"], stats["steps"],
+                stats["restarts"])
+    return {"kind": "full", "shard": shard, "chain": manifest["chain"], "bytes": manifest["base"]["bytes"],
+            "seconds": round(seconds, 3), "pages": stats["pages"], "steps": stats["steps"],
+            "restarts": stats["restarts"], "mode": stats["mode"], "pruned": removed,
+            "archive_files": len(archived["files"]), "archive_bytes": archived["bytes"]}
+
+def full_backup(shard):
+    """Start a new chain for shard with a full online backup. Returns a summary of the backup."""
+    with _shard_lock(shard):
+        return _full_backup(shard)
+
+# ----- WAL snapshots -----
+def _snapshot(shard):
+    existing = chains(shard)
+    manifest = existing[-1] if existing else None
+    if manifest is None or manifest["wal"] is None:
+        return _full_backup(shard)
+    path = db.shard_paths()[shard]
+    state = manifest["wal"]
+    chain_dir = _chain_dir(manifest)
+
+    t0 = time.perf_counter()
+    conn = db.connect(path)
+    checkpointer = db.connect(path)
+    segment = None
+    try:
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+            return _full_backup(shard)
+        # no commits from the first frame copied until the checkpoint is done
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            header = _wal_header(path)
+            if header is None:
+                if state["salt"] is not None:
+                    # the WAL was checkpointed and emptied by someone else: frames may be missing
+                    return _restart_chain(shard, conn)
+            else:
+                page_size, salts, raw = header
+                if salts != state["salt"]:
+                    # a restart adds one to salt-1; anything else means restarts we never saw
+                    if not (state["salt"] is None or (state["complete"] and salts[0] == (state["salt"][0] + 1) % 2**32)):
+                        return _restart_chain(shard, conn)
+                    state = {"salt": salts, "offset": WAL_HEADER, "complete": False, "header": raw.hex()}
+                with open(path + "-wal", "rb") as f:
+                    end, frames = _committed_end(f, state["offset"], salts, page_size)
+                    if frames:
+                        segment = {"file": "%06d.wal" % (len(manifest["snapshots"]) + 1), "at": _now(),
+                                   "salt": salts, "header": state["header"], "start": state["offset"],
+                                   "end": end, "frames": frames, "bytes": end - state["offset"]}
+                        _copy_range(f, state["offset"], end, os.path.join(chain_dir, segment["file"]))
+                        users = _archived_users(conn)
+                state = dict(state, offset=end, complete=False)
+                if segment:
+                    manifest["snapshots"].append(segment)
+                manifest["wal"] = state
+                # recorded before the checkpoint: if we die after it, the next snapshot can't take the
+                # chain as complete and starts over instead of missing this segment
+                _write_json(os.path.join(chain_dir, MANIFEST), manifest)
+                busy, log, done = checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                copied = (end - WAL_HEADER) // (FRAME_HEADER + page_size)
+                state["complete"] = not busy and log == done == copied
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+    finally:
+        conn.close()
+        checkpointer.close()
+    if segment:
+        # after the write lock is released: files only gain rows, so a later copy still fits this point
+        segment["archive"] = _copy_archive(manifest, chain_dir, segment["file"][:-len(".wal")], users)
+    seconds = time.perf_counter() - t0
+    manifest["wal"] = state
+    manifest["checked"] = _now()
+    if segment:
+        segment["seconds"] = round(seconds, 3)
+    _write_json(os.path.join(chain_dir, MANIFEST), manifest)
+    metrics.BACKUP_DURATION.observe(seconds, "snapshot")
+    return {"kind": "snapshot", "shard": shard, "chain": manifest["chain"], "file": segment and segment["file"],
+            "frames": segment["frames"] if segment else 0, "bytes": segment["bytes"] if segment else 0,
+            "archive_files": len(segment["archive"]["files"]) if segment else 0, "seconds": round(seconds, 3)}
+
+def _restart_chain(shard, conn):
+    conn.rollback()
+    logger.warning("Shard %d: the WAL was restarted outside of a snapshot; starting a new backup chain", shard)
+    return _full_backup(shard)
+
+def snapshot(shard):
+    """
+    Add a restore point to shard's newest chain: the WAL frames committed since the last one.
+    When there is no chain yet, the shard isn't in WAL mode, or the WAL restarted in a way the
+    chain can't account for, this takes a full backup (a new chain) instead. Returns a summary.
+    """
+    with _shard_lock(shard):
+        return _snapshot(shard)
+
+# ----- restore and verification -----
+def points(manifest):
+    """Restore points of a chain, oldest first: the base backup, then one per snapshot."""
+    return [manifest["created"]] + [s["at"] for s in manifest["snapshots"]]
+
+def restore(shard, dest, at=None, chain=None, archive_dest=None):
+    """
+    Rebuild shard as of its newest restore point at or before `at` ('YYYY-MM-DD HH:MM:SS', UTC;
+    default the newest) into dest, and its archived users' year files into the directory
+    archive_dest (default dest + ".archive"); neither may exist. chain picks the chain by name.
+    Returns {"chain", "point", "snapshots", "frames", "archive", "archive_files", "seconds"}.
+    """
+    archive_dest = archive_dest or dest + ".archive"
+    for path in (dest, archive_dest):
+        if os.path.exists(path):
+            raise ValueError("%s already exists" % path)
+    found = [m for m in chains(shard)
+             if (chain is None or m["chain"] == chain) and (at is None or m["created"] <= at)]
+    if not found:
+        raise ValueError("no backup of shard %d%s" % (shard, " at or before %s" % at if at else ""))
+    manifest = found[-1]
+    segments = [s for s in manifest["snapshots"] if at is None or s["at"] <= at]
+    chain_dir = _chain_dir(manifest)
+
+    t0 = time.perf_counter()
+    tmp = dest + ".restoring"
+    for leftover in (tmp, tmp + "-wal", tmp + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    shutil.copyfile(os.path.join(chain_dir, BASE), tmp)
+    frames = 0
+    if segments:
+        conn = sqlite3.connect(tmp)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+        # one WAL per generation: its header, then its segments back to back, checkpointed into the copy
+        for _, group in groupby(segments, key=lambda s: tuple(s["salt"])):
+            group = list(group)
+            with open(tmp + "-wal", "wb") as f:
+                f.write(bytes.fromhex(group[0]["header"]))
+                for s in group:
+                    with open(os.path.join(chain_dir, s["file"]), "rb") as seg:
+                        shutil.copyfileobj(seg, f)
+            conn = sqlite3.connect(tmp)
+            try:
+                # the only connection, so PASSIVE backfills every frame (and, unlike TRUNCATE, counts them)
+                busy, log, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            finally:
+                conn.close()
+            expected = sum(s["frames"] for s in group)
+            if busy or log != expected or done != log:
+                raise RuntimeError("restore of %s: %d of %d WAL frames applied (segments %s..%s)"
+                                   % (manifest["chain"], done, expected, group[0]["file"], group[-1]["file"]))
+            frames += log
+        conn = sqlite3.connect(tmp)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    archive_files = _restore_archive(manifest, chain_dir, segments, archive_dest)
+    os.replace(tmp, dest)
+    seconds = time.perf_counter() - t0
+    return {"chain": manifest["chain"], "point": segments[-1]["at"] if segments else manifest["created"],
+            "snapshots": len(segments), "frames": frames, "archive": archive_dest if archive_files else None,
+            "archive_files": archive_files, "seconds": round(seconds, 3)}
+
+def verify(shard, chain=None):
+    """
+    Restore the newest point of shard's newest chain (or of `chain`) into a scratch directory, run
+    PRAGMA integrity_check on it and count the committed rows in its archive files against
+    archive_marks. The timed result is returned and kept in the chain's manifest.
+    """
+    scratch = tempfile.mkdtemp(prefix="verify-", dir=backup_dir())
+    try:
+        t0 = time.perf_counter()
+        restored = restore(shard, os.path.join(scratch, "restored.db"), chain=chain,
+                           archive_dest=os.path.join(scratch, "archive"))
+        t1 = time.perf_counter()
+        conn = sqlite3.connect(os.path.join(scratch, "restored.db"))
+        try:
+            integrity = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+            transactions = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            archived = conn.execute("SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM archive_marks").fetchone()
+            archive_problems = _check_archive(conn, os.path.join(scratch, "archive"))
+        finally:
+            conn.close()
+        t2 = time.perf_counter()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    result = {"at": _now(), "chain": restored["chain"], "point": restored["point"],
+              "snapshots": restored["snapshots"], "ok": integrity == ["ok"] and not archive_problems,
+              "integrity": integrity[:10], "transactions": transactions, "archived_users": archived[0],
+              "archived_rows": archived[1], "archive": archive_problems[:10],
+              "restore_seconds": round(t1 - t0, 3), "check_seconds": round(t2 - t1, 3)}
+    metrics.BACKUP_DURATION.observe(t2 - t0, "verify")
+    if not result["ok"]:
+        logger.error("Backup %s of shard %d failed verification: %s", restored["chain"], shard,
+                     "; ".join((integrity[:10] if integrity != ["ok"] else []) + archive_problems[:10]))
+    with _shard_lock(shard):
+        for manifest in chains(shard):
+            if manifest["chain"] == restored["chain"]:
+                manifest["verified"] = (manifest["verified"] + [result])[-KEEP_VERIFICATIONS:]
+                _write_json(os.path.join(_chain_dir(manifest), MANIFEST), manifest)
+    return dict(result, shard=shard)
+
+def status():
+    """{shard: [summary of each chain, oldest first]}."""
+    out = {}
+    for shard in range(len(db.shard_paths())):
+        out[shard] = [{
+            "chain": m["chain"],
+            "created": m["created"],
+            "base_bytes": m["base"]["bytes"],
+            "base_seconds": m["base"]["seconds"],
+            "snapshots": len(m["snapshots"]),
+            "snapshot_bytes": sum(s["bytes"] for s in m["snapshots"]),
+            "archive_bytes": sum(e.get("archive", {}).get("bytes", 0) for e in [m["base"]] + m["snapshots"]),
+            "newest_point": points(m)[-1],
+            "checked": m["checked"],
+            "verified": m["verified"][-1] if m["verified"] else None,
+        } for m in chains(shard)]
+    return out
+
+# ----- scheduling -----
+def run_due(verify_new=VERIFY):
+    """
+    One scheduler pass over the shards: a new chain where the newest is older than FULL_HOURS (or
+    missing), otherwise a WAL snapshot when SNAPSHOT_MINUTES have passed since the last one. With
+    several workers (or processes) running the scheduler, the shard lock makes only one do the work.
+    """
+    results = []
+    for shard in range(len(db.shard_paths())):
+        with _shard_lock(shard):
+            existing = chains(shard)
+            newest = existing[-1] if existing else None
+            if newest is None or _age(newest["created"]) >= FULL_HOURS * 3600:
+                result = _full_backup(shard)
+            elif db.WAL_SNAPSHOTS and _age(newest["checked"]) >= SNAPSHOT_MINUTES * 60:
+                result = _snapshot(shard)
+            else:
+                continue
+        if verify_new and result["kind"] == "full":
+            result["verified"] = verify(shard, result["chain"])
+        results.append(result)
+    return results
+
+def schedule_forever(stop=None, log=None):
+    """Call run_due() every minute (or every snapshot interval, if shorter) until stop is set."""
+    stop = stop or threading.Event()
+    tick = max(1.0, min(60.0, SNAPSHOT_MINUTES * 60))
+    while not stop.wait(tick):
+        try:
+            for result in run_due():
+                if log:
+                    log(result)
+        except Exception:
+            logger.exception("Scheduled backup failed")
+
+# ----- jobs started over HTTP -----
+JOBS = {"full": full_backup, "snapshot": snapshot, "verify": verify}
+
+_job = None
+_job_lock = threading.Lock()
+
+def start_job(kind):
+    """Run JOBS[kind] over every shard in a background thread. None if a job is still running."""
+    global _job
+    with _job_lock:
+        if _job is not None and _job["finished"] is None:
+            return None
+        job = _job = {"kind": kind, "started": _now(), "finished": None, "results": [], "error": None}
+
+    def run():
+        try:
+            for shard in range(len(db.shard_paths())):
+                job["results"].append(JOBS[kind](shard))
+        except Exception as e:
+            logger.exception("Backup job %s failed", kind)
+            job["error"] = str(e)
+        finally:
+            job["finished"] = _now()
+    threading.Thread(target=run, name="backup-job", daemon=True).start()
+    return dict(job, results=list(job["results"]))
+
+def current_job():
+    return dict(_job, results=list(_job["results"])) if _job else None
+
+# ----- Flask integration -----
+_anchors = []
+_scheduler = None
+_stop = threading.Event()
+
+def hold_open():
+    """Keep a connection to every shard open, so no WAL is emptied between snapshots (idempotent)."""
+    if _anchors:
+        return
+    for path in db.shard_paths():
+        conn = db.connect(path)
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # opens the WAL index
+        _anchors.append(conn)
+
+def init_app(app):
+    """Admin endpoints, the connections that keep each shard's WAL alive, and the optional scheduler."""
+    global _scheduler
+    from flask import request, jsonify
+    import profiling
+
+    if db.WAL_SNAPSHOTS:
+        hold_open()
+        if not SCHEDULE:
+            logger.warning("BACKUP_WAL=1 turns automatic checkpoints off: the WAL grows until the next "
+                           "snapshot (set BACKUP_SCHEDULE=1, or run backup_db.py --snapshot regularly)")
+    if SCHEDULE and _scheduler is None:
+        _scheduler = threading.Thread(target=schedule_forever, args=(_stop,), name="backup-scheduler", daemon=True)
+        _scheduler.start()
+
+    @app.route('/admin/backups', methods=['GET'])
+    def list_backups():
+        if not profiling.is_admin(request):
+            return jsonify({"msg": "admin token required"}), 403
+        return jsonify({
+            "directory": backup_dir(),
+            "wal_snapshots": db.WAL_SNAPSHOTS,
+            "schedule": {"enabled": SCHEDULE, "snapshot_minutes": SNAPSHOT_MINUTES, "full_hours": FULL_HOURS},
+            "job": current_job(),
+            "shards": status(),
+        })
+
+    @app.route('/admin/backups', methods=['POST'])
+    def start_backup():
+        if not profiling.is_admin(request):
+            return jsonify({"msg": "admin token required"}), 403
+        kind = (request.get_json(silent=True) or {}).get("kind", "snapshot")
+        if kind not in JOBS:
+            return jsonify({"msg": "kind must be one of: " + ", ".join(JOBS)}), 400
+        job = start_job(kind)
+        if job is None:
+            return jsonify({"msg": "a backup job is already running", "job": current_job()}), 409
+        return jsonify({"job": job}), 202
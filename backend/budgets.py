@@ -0,0 +1,81 @@
+# backend/budgets.py
+"""
+Monthly category budgets.
+
+Spend per (user, category, month) lives in monthly_spend and alerts in budget_alerts; both are
+maintained by triggers in init_db.sql, so every write path is covered at O(1) per transaction.
+This module only handles the budgets themselves and reads status from those tables.
+"""
+import calendar
+import logging
+
+import db
+
+logger = logging.getLogger("expense-backend")
+
+def rebuild(conn):
+    """Recompute monthly_spend from transactions in one grouped pass."""
+    conn.execute("DELETE FROM monthly_spend")
+    conn.execute(
+        "INSERT INTO monthly_spend (user_id, category, month, total) "
+        "SELECT user_id, COALESCE(category, 'Uncategorized'), substr(date, 1, 7), SUM(amount) "
+        "FROM transactions WHERE type = 'expense' GROUP BY 1, 2, 3"
+    )
+    conn.commit()
+
+def ensure_index(conn):
+    """Build monthly_spend for databases that have expenses from before it existed."""
+    has_index = conn.execute("SELECT 1 FROM monthly_spend LIMIT 1").fetchone()
+    has_rows = conn.execute("SELECT 1 FROM transactions WHERE type = 'expense' LIMIT 1").fetchone()
+    if has_rows and not has_index:
+        logger.info("Building monthly spend index")
+        rebuild(conn)
+
+def set_budget(user_id, category, limit, today):
+    conn = db.get_db()
+    conn.execute(
+        "INSERT INTO budgets (user_id, category, monthly_limit) VALUES (?,?,?) "
+        "ON CONFLICT(user_id, category) DO UPDATE SET monthly_limit = excluded.monthly_limit",
+        (user_id, category, limit)
+    )
+    # rewriting the current total re-runs the alert trigger against the new limit
+    conn.execute("UPDATE monthly_spend SET total = total WHERE user_id=? AND category=? AND month=?",
+                 (user_id, category, today.strftime("%Y-%m")))
+    conn.commit()
+
+def delete_budget(user_id, category):
+    conn = db.get_db()
+    cur = conn.execute("DELETE FROM budgets WHERE user_id=? AND category=?", (user_id, category))
+    conn.commit()
+    return cur.rowcount
+
+def status(user_id, today):
+    """Every budget of the user with month-to-date spend, linear month-end projection and this month's alerts."""
+    month = today.strftime("%Y-%m")
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    rows = db.query_db(
+        "SELECT b.category, b.monthly_limit, COALESCE(s.total, 0) AS spent FROM budgets b "
+        "LEFT JOIN monthly_spend s ON s.user_id = b.user_id AND s.category = b.category AND s.month = ? "
+        "WHERE b.user_id = ? ORDER BY b.category",
+        (month, user_id)
+    )
+    alerts = {}
+    for a in db.query_db("SELECT category, kind, spent, created_at FROM budget_alerts "
+                         "WHERE user_id=? AND month=? ORDER BY id", (user_id, month)):
+        alerts.setdefault(a['category'], []).append(dict(a))
+    out = []
+    for r in rows:
+        spent = round(r['spent'], 2)
+        limit = r['monthly_limit']
+        projected = round(spent * days_in_month / today.day, 2)
+        out.append({
+            "category": r['category'],
+            "monthly_limit": limit,
+            "spent": spent,
+            "remaining": round(limit - spent, 2),
+            "percent_used": round(spent / limit * 100, 1),
+            "projected": projected,
+            "status": "over" if spent >= limit else ("warning" if spent >= 0.8 * limit or projected > limit else "ok"),
+            "alerts": alerts.get(r['category'], []),
+        })
+    return {"month": month, "day": today.day, "days_in_month": days_in_month, "budgets": out}
@@ -3,6 +3,8 @@ import re
 import difflib
 from collections import Counter
 
+from metrics import timed, CATEGORIZE_LATENCY
+
 # Basic category keywords (expandable)
 CATEGORY_KEYWORDS = {
     "Groceries": ["grocery", "supermarket", "mart", "grocer", "vegetable", "bakery"],
@@ -54,6 +56,7 @@ def fuzzy_token_match(token, cutoff=0.85):
     matches = difflib.get_close_matches(token, KEYWORDS_LIST, n=1, cutoff=cutoff)
     return matches[0] if matches else None
 
+@timed(CATEGORIZE_LATENCY)
 def categorize(description: str):
     """
     Return a tuple (category, confidence_score, suggestions_list)
@@ -109,3 +112,7 @@ def categorize(description: str):
 
     # Nothing found
     return ("Uncategorized", "low", ["Uncategorized"])
+
+def categorize_many(descriptions):
+    """categorize() over a list; module-level so a batch can be shipped to a worker process."""
+    return [categorize(d) for d in descriptions]
@@ -0,0 +1,125 @@
+# backend/category_aliases.py
+import logging
+from difflib import get_close_matches
+
+from flask import has_app_context
+
+import db
+
+logger = logging.getLogger("expense-backend")
+
+CANONICAL_CATEGORIES = [
+    "Groceries", "Transport", "Dining", "Rent", "Utilities", "Entertainment",
+    "Healthcare", "Education", "Insurance", "Loan_Repayment", "Salary",
+    "Shopping", "Travel", "Miscellaneous", "Uncategorized"
+]
+
+# lowercased label -> canonical category; filled by load_aliases() at startup
+_ALIASES = {}
+# labels that resolve to themselves: not aliases, so only cached in-process, and bounded
+_UNMAPPED = {}
+MAX_UNMAPPED = 10000
+
+def _seed():
+    _ALIASES.clear()
+    for c in CANONICAL_CATEGORIES:
+        _ALIASES[c.lower()] = c
+
+_seed()
+
+def load_aliases(conn):
+    """(Re)build the in-memory alias index from the category_aliases table."""
+    _seed()
+    _UNMAPPED.clear()
+    # identity rows ('foo' -> 'foo') stored by earlier versions would shadow later matches forever
+    purged = conn.execute("DELETE FROM category_aliases WHERE source='learned' AND alias = lower(category)").rowcount
+    if purged:
+        conn.commit()
+        logger.info("Removed %d identity category aliases", purged)
+    rows = conn.execute("SELECT alias, category FROM category_aliases").fetchall()
+    for alias, category in rows:
+        _ALIASES[alias.lower()] = category
+    logger.info("Loaded %d category aliases", len(rows))
+    return len(_ALIASES)
+
+def remember(alias, category, source='learned', conn=None):
+    """Add alias -> category to the index and persist it (first writer wins)."""
+    key = str(alias).strip().lower()
+    _ALIASES[key] = category
+    _UNMAPPED.pop(key, None)
+    sql = "INSERT OR IGNORE INTO category_aliases (alias, category, source) VALUES (?,?,?)"
+    try:
+        if conn is not None:
+            conn.execute(sql, (key, category, source))
+        elif has_app_context():
+            db.execute_db(sql, (key, category, source), directory=True)
+    except Exception as e:
+        # the in-memory entry still saves the fuzzy match for this process
+        logger.warning("Could not persist category alias %r: %s", key, e)
+
+def resolve_category(cat):
+    """Slow path: exact/fuzzy match against the canonical list. Does not consult the index."""
+    # fuzzy match to canonical list
+    match = get_close_matches(cat, CANONICAL_CATEGORIES, n=1, cutoff=0.75)
+    if match:
+        return match[0]
+    # collapse very short or obviously garbage tokens to 'Uncategorized'
+    if len(cat) <= 2 or cat.lower() in ("n/a", "na", "none"):
+        return "Uncategorized"
+    return cat
+
+def normalize_category(cat, conn=None, learn=True):
+    """Map incoming category string to a canonical category if close; otherwise return cleaned string.
+
+    Lookups hit the in-memory alias index. An unknown label that resolves to something else is
+    remembered as an alias (unless learn=False: read-only requests never write); one that resolves
+    to itself is only cached in this process.
+    """
+    if not cat:
+        return "Uncategorized"
+    cat = str(cat).strip()
+    key = cat.lower()
+    hit = _ALIASES.get(key)
+    if hit is not None:
+        return hit
+    if _UNMAPPED.get(key) == cat:
+        return cat
+    resolved = resolve_category(cat)
+    if resolved != cat:
+        if learn:
+            remember(cat, resolved, conn=conn)
+    else:
+        if len(_UNMAPPED) >= MAX_UNMAPPED:
+            _UNMAPPED.clear()
+        _UNMAPPED[key] = cat
+    return resolved
+
+def remap_existing(conn, dry_run=True):
+    """
+    Re-map stored transaction categories through the alias table in one set-based UPDATE.
+    Returns a report: list of {from, to, rows}. With dry_run=True nothing is written.
+    """
+    # make sure every distinct stored label has an alias row (distinct labels only, not rows)
+    labels = [r[0] for r in conn.execute("SELECT DISTINCT category FROM transactions WHERE category IS NOT NULL")]
+    for label in labels:
+        target = normalize_category(label, conn=conn)
+        if target != label:
+            # e.g. 'groceries' hits the canonical seed, which has no table row
+            remember(label, target, conn=conn)
+
+    report = conn.execute(
+        "SELECT t.category AS old, a.category AS new, COUNT(*) AS cnt "
+        "FROM transactions t JOIN category_aliases a ON t.category = a.alias COLLATE NOCASE "
+        "WHERE t.category <> a.category GROUP BY t.category, a.category ORDER BY cnt DESC"
+    ).fetchall()
+    report = [{"from": r[0], "to": r[1], "rows": r[2]} for r in report]
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.execute(
+            "UPDATE transactions SET category = a.category FROM category_aliases a "
+            "WHERE transactions.category = a.alias COLLATE NOCASE AND transactions.category <> a.category"
+        )
+        conn.commit()
+    return report
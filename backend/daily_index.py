@@ -0,0 +1,74 @@
+# backend/daily_index.py
+import logging
+from datetime import timedelta
+
+import db
+
+logger = logging.getLogger("expense-backend")
+
+# Loose index scan over the (user_id, type, category, day) primary key: one seek per category
+# instead of reading every day row.
+_CATEGORIES_SQL = """
+WITH RECURSIVE cats(c) AS (
+    SELECT MIN(category) FROM daily_cumsum WHERE user_id = :uid AND type = :type
+    UNION ALL
+    SELECT (SELECT MIN(category) FROM daily_cumsum WHERE user_id = :uid AND type = :type AND category > c)
+    FROM cats WHERE c IS NOT NULL
+)
+SELECT c AS category,
+    COALESCE((SELECT cum_total FROM daily_cumsum
+              WHERE user_id = :uid AND type = :type AND category = c AND day <= :end
+              ORDER BY day DESC LIMIT 1), 0)
+  - COALESCE((SELECT cum_total FROM daily_cumsum
+              WHERE user_id = :uid AND type = :type AND category = c AND day < :start
+              ORDER BY day DESC LIMIT 1), 0) AS total
+FROM cats WHERE c IS NOT NULL
+"""
+
+def rebuild(conn):
+    """Recompute the whole index from transactions in one set-based pass."""
+    conn.execute("DELETE FROM daily_cumsum")
+    conn.execute(
+        "INSERT INTO daily_cumsum (user_id, type, category, day, day_total, cum_total) "
+        "SELECT user_id, type, category, day, day_total, "
+        "SUM(day_total) OVER (PARTITION BY user_id, type, category ORDER BY day) "
+        "FROM (SELECT user_id, type, COALESCE(category, 'Uncategorized') AS category, date AS day, "
+        "SUM(amount) AS day_total FROM transactions GROUP BY 1, 2, 3, 4)"
+    )
+    conn.commit()
+
+def ensure_index(conn):
+    """Build the index for databases that have transactions from before it existed."""
+    has_index = conn.execute("SELECT 1 FROM daily_cumsum LIMIT 1").fetchone()
+    has_rows = conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone()
+    if has_rows and not has_index:
+        logger.info("Building daily prefix-sum index")
+        rebuild(conn)
+
+def range_totals(user_id, start, end, tx_type='expense'):
+    """
+    Total per category for start <= date <= end (ISO strings), as {category: total}.
+    Cost is two index lookups per category, independent of how many rows fall in the range.
+    Categories with nothing in the range are left out.
+    """
+    rows = db.query_db(_CATEGORIES_SQL, {"uid": user_id, "type": tx_type, "start": start, "end": end})
+    totals = {}
+    for r in rows:
+        t = round(r['total'] or 0.0, 2)
+        if t:
+            totals[r['category']] = t
+    return totals
+
+def shift_period(start, end, mode):
+    """Comparison period for start/end (dates): 'previous' = same length just before, 'year' = one year back."""
+    if mode == 'previous':
+        length = (end - start).days + 1
+        return start - timedelta(days=length), start - timedelta(days=1)
+    if mode == 'year':
+        def back(d):
+            try:
+                return d.replace(year=d.year - 1)
+            except ValueError:  # Feb 29
+                return d.replace(year=d.year - 1, day=28)
+        return back(start), back(end)
+    raise ValueError("compare must be 'previous' or 'year'")
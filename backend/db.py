@@ -1,27 +1,218 @@
-# backend/db.py
 import sqlite3
-from flask import g
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_app_context
 import os
 
+from metrics import timed_sql, timed, DB_LATENCY
+from profiling import slow_query_log
+
 DB_PATH = os.environ.get("DB_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "expense.db"))
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "init_db.sql")
 
-def get_db():
-    db = getattr(g, '_database', None)
+# Sharding: DB_PATH is shard 0 and also the directory (users, user_shards, category aliases, the
+# learned model). DB_SHARDS lists more files that hold per-user data; each user's rows live in
+# exactly one shard. SHARD_ROUTING=directory (default) looks the user up in user_shards, placing
+# new users by hash, so users can be moved (rebalance_shards.py). SHARD_ROUTING=hash skips the
+# lookup, but then the shard list must never change and nothing can be moved.
+EXTRA_SHARDS = [os.path.abspath(p.strip()) for p in os.environ.get("DB_SHARDS", "").split(",") if p.strip()]
+SHARD_ROUTING = os.environ.get("SHARD_ROUTING", "directory").lower()
+
+# BACKUP_WAL=1 runs every shard in WAL mode with automatic checkpoints off: backup.snapshot() copies
+# the new WAL frames and checkpoints them itself, so it must be scheduled (see backup.py).
+WAL_SNAPSHOTS = os.environ.get("BACKUP_WAL", "").lower() in ("1", "true", "yes")
+
+# Columns added after the first release: (table, column, declaration).
+# Applied before init_db.sql so indexes on them can be created.
+COLUMN_MIGRATIONS = [
+    ("transactions", "fingerprint", "TEXT"),
+    ("transactions", "category_source", "TEXT"),
+    ("transactions", "merchant_key", "TEXT"),
+]
+
+# Triggers redefined after the first release: (trigger, text only the current definition contains).
+# Older stored versions are dropped before init_db.sql runs, which recreates them.
+TRIGGER_MIGRATIONS = [
+    ("transactions_cumsum_ad", "archiving"),
+    ("transactions_monthly_ad", "archiving"),
+]
+
+def connect(path=None):
+    """Open a standalone connection (used outside of a request, e.g. startup and scripts)."""
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    if WAL_SNAPSHOTS:
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+    return conn
+
+def init_schema(conn=None):
+    """Apply init_db.sql (idempotent: every statement uses IF NOT EXISTS / OR IGNORE)."""
+    own = conn is None
+    conn = conn or connect()
+    try:
+        if WAL_SNAPSHOTS:
+            conn.execute("PRAGMA journal_mode=WAL")
+        for table, column, decl in COLUMN_MIGRATIONS:
+            cols = [r[1] for r in conn.execute("PRAGMA table_info(%s)" % table)]
+            if cols and column not in cols:
+                conn.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, column, decl))
+        for trigger, marker in TRIGGER_MIGRATIONS:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (trigger,)).fetchone()
+            if row and marker not in row[0]:
+                conn.execute("DROP TRIGGER %s" % trigger)
+        with open(SCHEMA_PATH, 'r', encoding='utf-8-sig') as f:
+            conn.executescript(f.read())
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+
+# ----- shards -----
+def shard_paths():
+    return [DB_PATH] + EXTRA_SHARDS
+
+def is_sharded():
+    return len(EXTRA_SHARDS) > 0
+
+def connect_shard(shard):
+    return connect(shard_paths()[shard])
+
+def hash_shard(user_id):
+    return zlib.crc32(str(user_id).encode()) % len(shard_paths())
+
+_local = threading.local()
+
+def _directory():
+    """This thread's long-lived connection to the directory, for routing lookups."""
+    conn = getattr(_local, 'directory', None)
+    if conn is None or _local.directory_path != DB_PATH:
+        conn = _local.directory = connect()
+        _local.directory_path = DB_PATH
+    return conn
+
+def shard_of(user_id):
+    """Shard index holding user_id's data."""
+    if not is_sharded():
+        return 0
+    if SHARD_ROUTING == 'hash':
+        return hash_shard(user_id)
+    row = _directory().execute("SELECT shard FROM user_shards WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else hash_shard(user_id)
+
+def place_user(user_id, conn=None):
+    """Record a new user's shard in the directory (no-op when not sharded)."""
+    if not is_sharded() or SHARD_ROUTING == 'hash':
+        return
+    conn = conn or directory_db()
+    conn.execute("INSERT OR IGNORE INTO user_shards (user_id, shard) VALUES (?, ?)", (user_id, hash_shard(user_id)))
+    conn.commit()
+
+def pin_existing_users(conn):
+    """
+    Users without a directory entry predate sharding, so their rows are in DB_PATH: pin them to
+    shard 0 instead of letting the hash send them to an empty shard. conn is the directory.
+    """
+    if not is_sharded() or SHARD_ROUTING == 'hash':
+        return 0
+    n = conn.execute("INSERT OR IGNORE INTO user_shards (user_id, shard) SELECT id, 0 FROM users").rowcount
+    conn.commit()
+    return n
+
+def for_each_shard(fn, parallel=True):
+    """[fn(conn, shard) for every shard], each on its own connection, shards in parallel threads."""
+    paths = shard_paths()
+
+    def run(shard):
+        conn = connect(paths[shard])
+        try:
+            return fn(conn, shard)
+        finally:
+            conn.close()
+    if not parallel or len(paths) == 1:
+        return [run(i) for i in range(len(paths))]
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        return list(pool.map(run, range(len(paths))))
+
+def current_shard():
+    """Shard of the user this request is for (set by auth.user_required); 0 outside user routes."""
+    if not is_sharded() or not has_app_context():
+        return 0
+    shard = g.get('_shard')
+    if shard is None:
+        user_id = g.get('user_id')
+        shard = g._shard = shard_of(user_id) if user_id is not None else 0
+    return shard
+
+def _request_db(shard):
+    attr = '_database' if shard == 0 else '_database_%d' % shard
+    db = getattr(g, attr, None)
     if db is None:
-        os.makedirs(os.path.dirname(os.path.abspath(DB_PATH)), exist_ok=True)
-        db = g._database = sqlite3.connect(DB_PATH, check_same_thread=False)
-        db.row_factory = sqlite3.Row
+        db = connect(shard_paths()[shard])
+        setattr(g, attr, db)
     return db
 
+def get_db():
+    """The request's connection: the current user's shard (the directory for non-user routes)."""
+    return _request_db(current_shard())
+
+def directory_db():
+    """The request's connection to the directory (users, aliases, model), whatever the user's shard."""
+    return _request_db(0)
+
+def _explain(query, args):
+    return get_db().execute("EXPLAIN QUERY PLAN " + query, args).fetchall()
+
+@timed_sql("query")
+@slow_query_log(_explain)
 def query_db(query, args=(), one=False):
     cur = get_db().execute(query, args)
     rv = cur.fetchall()
     cur.close()
     return (rv[0] if rv else None) if one else rv
 
-def execute_db(query, args=()):
-    conn = get_db()
+@timed_sql("execute")
+def execute_db(query, args=(), directory=False):
+    conn = directory_db() if directory else get_db()
     cur = conn.cursor()
     cur.execute(query, args)
     conn.commit()
     return cur.lastrowid
+
+@timed_sql("execute")
+def write_db(query, args=()):
+    """Run one write in the request's transaction without committing (see commit_db); returns the cursor."""
+    return get_db().execute(query, args)
+
+@timed(DB_LATENCY, "commit", "COMMIT")
+def commit_db():
+    get_db().commit()
+
+@timed_sql("executemany")
+def executemany_db(query, seq):
+    """Run one statement over many parameter tuples in a single transaction; returns rows changed."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.executemany(query, seq)
+    conn.commit()
+    return cur.rowcount
+
+@timed_sql("executemany")
+def insert_new_db(query, seq, table, column="id"):
+    """
+    executemany_db for an INSERT into an AUTOINCREMENT table that may skip rows (ON CONFLICT DO
+    NOTHING). Runs under the write lock, so it can return `column` of exactly the rows it added.
+    """
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM %s" % table).fetchone()[0]
+        conn.executemany(query, seq)
+        added = [r[0] for r in conn.execute("SELECT %s FROM %s WHERE id > ? ORDER BY id" % (column, table), (last,))]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return added
@@ -0,0 +1,107 @@
+# backend/dedupe.py
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+
+import db
+from categorizer import normalize_text
+
+logger = logging.getLogger("expense-backend")
+
+# ----- Content fingerprint -----
+def fingerprint(user_id, date_val, amount, description, ordinal=0):
+    """
+    Stable content hash of a transaction: user, ISO date, amount (2dp), normalized description.
+    `ordinal` tells apart genuinely repeated rows (two identical coffees on the same day):
+    the n-th identical row in an upload gets ordinal n, so re-uploading the same statement
+    maps every row back onto the fingerprint it had the first time.
+    """
+    key = "|".join([str(user_id), str(date_val), "%.2f" % float(amount), normalize_text(description), str(ordinal)])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+def content_key(date_val, amount, description):
+    """The part of the fingerprint that ordinals are counted over."""
+    return (str(date_val), "%.2f" % float(amount), normalize_text(description))
+
+def backfill_fingerprints(conn):
+    """Assign fingerprints to rows inserted before the column existed (ordinals follow id order)."""
+    rows = conn.execute(
+        "SELECT id, user_id, date, amount, description FROM transactions WHERE fingerprint IS NULL ORDER BY id"
+    ).fetchall()
+    if not rows:
+        return 0
+    seen = {}
+    updates = []
+    for r in rows:
+        k = (r[1],) + content_key(r[2], r[3], r[4])
+        n = seen.get(k, 0)
+        seen[k] = n + 1
+        updates.append((fingerprint(r[1], r[2], r[3], r[4], n), r[0]))
+    # OR IGNORE: a fingerprint already taken by a newer row stays NULL on the older copy
+    conn.executemany("UPDATE OR IGNORE transactions SET fingerprint=? WHERE id=?", updates)
+    conn.commit()
+    logger.info("Backfilled fingerprints for %d transactions", len(updates))
+    return len(updates)
+
+# ----- Bloom filter pre-check -----
+class BloomFilter:
+    """Fixed-size Bloom filter over hex fingerprints (no false negatives, ~1% false positives)."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1024)
+        self.nbits = int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.k = max(1, int(round(self.nbits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fp):
+        # fingerprints are already uniform hashes: split into two 64-bit halves for double hashing
+        h1 = int(fp[:16], 16)
+        h2 = int(fp[16:32], 16) | 1
+        return [(h1 + i * h2) % self.nbits for i in range(self.k)]
+
+    def add(self, fp):
+        for p in self._positions(fp):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, fp):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(fp))
+
+MAX_CACHED_FILTERS = 1024
+_filters = OrderedDict()  # user_id -> BloomFilter, least recently used first
+
+def user_filter(user_id):
+    """
+    Per-process Bloom filter of a user's stored fingerprints, built on first use.
+    Rows written by other workers are missing until the filter is rebuilt; that only costs
+    speed, since the unique index still rejects them on insert.
+    """
+    bf = _filters.get(user_id)
+    if bf is not None and bf.count < bf.capacity:
+        _filters.move_to_end(user_id)
+        return bf
+    rows = db.query_db("SELECT fingerprint FROM transactions WHERE user_id=? AND fingerprint IS NOT NULL", (user_id,))
+    bf = BloomFilter(capacity=len(rows) * 2)
+    for r in rows:
+        bf.add(r[0])
+    _filters[user_id] = bf
+    _filters.move_to_end(user_id)
+    while len(_filters) > MAX_CACHED_FILTERS:
+        _filters.popitem(last=False)
+    return bf
+
+def existing_fingerprints(user_id, fps, chunk=500):
+    """Of the given fingerprints, return the set already stored (batched IN lookups on the unique index)."""
+    fps = list(fps)
+    found = set()
+    for i in range(0, len(fps), chunk):
+        part = fps[i:i + chunk]
+        marks = ",".join("?" * len(part))
+        rows = db.query_db(
+            "SELECT fingerprint FROM transactions WHERE user_id=? AND fingerprint IN (%s)" % marks,
+            [user_id] + part
+        )
+        found.update(r[0] for r in rows)
+    return found
@@ -1,9 +1,122 @@
-import pandas as pd
+import os
 from datetime import datetime
-from sklearn.linear_model import LinearRegression
-import numpy as np
 
-def forecast_expenses(csv_path, months_ahead=3):
+from lazy import lazy_import
+
+# imported on first use: pandas + scikit-learn add seconds to every worker boot
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+linear_model = lazy_import("sklearn.linear_model")
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.9, 0.95)
+MIN_TREND_MONTHS = 6  # shorter histories forecast their mean (a slope from 3 points is noise)
+# series x paths x months cells one simulation may hold: each float64 array of that shape is 8 bytes
+# a cell, and a forecast keeps a few of them alive at once (noise, paths, quantile copies)
+MAX_CELLS = int(os.environ.get("FORECAST_MAX_CELLS", "4000000"))
+
+def capped_paths(n_paths, n_series, months_ahead, max_cells=None):
+    """n_paths, reduced so n_series * paths * months_ahead stays within max_cells (default MAX_CELLS)."""
+    budget = (MAX_CELLS if max_cells is None else max_cells) // max(n_series * months_ahead, 1)
+    return max(1, min(n_paths, budget))
+
+def fit_trends(history):
+    """
+    Least-squares line per row of a (series x months) matrix, all rows at once.
+    Returns (intercept, slope, residuals); slope is 0 for histories under MIN_TREND_MONTHS.
+    """
+    history = np.asarray(history, dtype=np.float64)
+    t = np.arange(history.shape[1], dtype=np.float64)
+    if history.shape[1] >= MIN_TREND_MONTHS:
+        tc = t - t.mean()
+        slope = (history - history.mean(axis=1, keepdims=True)) @ tc / (tc @ tc)
+    else:
+        slope = np.zeros(history.shape[0])
+    intercept = history.mean(axis=1) - slope * t.mean()
+    residuals = history - (intercept[:, None] + slope[:, None] * t)
+    return intercept, slope, residuals
+
+def simulate_paths(history, months_ahead=3, n_paths=10000, method="bootstrap", scale=None, seed=None):
+    """
+    Monte Carlo future paths for every series of a (series x months) history matrix.
+    Returns an array (series, paths, months_ahead), clipped at 0.
+
+    method='bootstrap' resamples whole historical months of residuals (the same month for every
+    series), which keeps the correlation between categories in the totals; 'normal' draws
+    independent Gaussian errors with each series' residual spread. `scale` multiplies each
+    series (scenario simulation, e.g. 0.8 = cut that category by 20%).
+    """
+    history = np.asarray(history, dtype=np.float64)
+    n_series, n_months = history.shape
+    intercept, slope, residuals = fit_trends(history)
+    future_t = np.arange(n_months, n_months + months_ahead, dtype=np.float64)
+    trend = intercept[:, None] + slope[:, None] * future_t            # (series, months_ahead)
+    rng = np.random.default_rng(seed)
+    if method == "bootstrap":
+        picks = rng.integers(0, n_months, size=(n_paths, months_ahead))
+        noise = residuals[:, picks]                                     # (series, paths, months_ahead)
+    elif method == "normal":
+        dof = max(n_months - (2 if n_months >= MIN_TREND_MONTHS else 1), 1)
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / dof)
+        noise = rng.standard_normal((n_series, n_paths, months_ahead)) * sigma[:, None, None]
+    else:
+        raise ValueError("method must be 'bootstrap' or 'normal'")
+    paths = np.maximum(trend[:, None, :] + noise, 0.0)
+    if scale is not None:
+        paths *= np.asarray(scale, dtype=np.float64)[:, None, None]
+    return paths
+
+def quantile_bands(paths, quantiles=DEFAULT_QUANTILES):
+    """Per-series and total quantiles of simulate_paths output: ((q, series, months), (q, months))."""
+    return np.quantile(paths, quantiles, axis=1), np.quantile(paths.sum(axis=0), quantiles, axis=0)
+
+def shift_month(month, k):
+    """'YYYY-MM' k months after (or before, k < 0) `month`."""
+    n = int(month[:4]) * 12 + int(month[5:7]) - 1 + k
+    return "%04d-%02d" % (n // 12, n % 12 + 1)
+
+def month_keys(first, count):
+    """'YYYY-MM' labels for `count` consecutive months starting at `first`."""
+    return [shift_month(first, i) for i in range(count)]
+
+def history_matrix(rows, months):
+    """(category, month, total) rows -> (sorted categories, category x month matrix); missing months are 0."""
+    categories = sorted({r[0] for r in rows})
+    ci = {c: i for i, c in enumerate(categories)}
+    mi = {m: i for i, m in enumerate(months)}
+    matrix = np.zeros((len(categories), len(months)))
+    for cat, month, total in rows:
+        if month in mi:
+            matrix[ci[cat], mi[month]] += total
+    return categories, matrix
+
+def interval_forecast(categories, history, months_ahead=3, n_paths=10000, method="bootstrap",
+                      scenario=None, seed=None, under=None, quantiles=DEFAULT_QUANTILES):
+    """
+    JSON-ready forecast for a (category x month) history: mean and quantile bands per future
+    month, for each category and for the total. `scenario` maps category -> multiplier;
+    `under` adds P(total <= under) per month. n_paths is reduced to fit MAX_CELLS; the result's
+    "paths" is the number simulated.
+    """
+    n_paths = capped_paths(n_paths, len(categories), months_ahead)
+    scale = [(scenario or {}).get(c, 1.0) for c in categories]
+    paths = simulate_paths(history, months_ahead, n_paths, method, scale, seed)
+    per_cat, total = quantile_bands(paths, quantiles)
+    totals = paths.sum(axis=0)
+    labels = ["p%d" % round(q * 100) for q in quantiles]
+
+    def bands(mean, q):
+        d = {"mean": np.round(mean, 2).tolist()}
+        d.update({l: np.round(q[i], 2).tolist() for i, l in enumerate(labels)})
+        return d
+
+    out = {"total": bands(totals.mean(axis=0), total), "by_category": [], "paths": n_paths}
+    for j, c in enumerate(categories):
+        out["by_category"].append(dict(category=c, **bands(paths[j].mean(axis=0), per_cat[:, j])))
+    if under is not None:
+        out["total"]["probability_under"] = np.round((totals <= under).mean(axis=0), 4).tolist()
+    return out
+
+def forecast_expenses(csv_path, months_ahead=3, n_paths=0, quantiles=(0.05, 0.5, 0.95), seed=None):
     # Load and preprocess data
     df = pd.read_csv(csv_path)
 
@@ -19,7 +132,7 @@ def forecast_expenses(csv_path, months_ahead=3):
     y = df['Amount']
 
     # Train model
-    model = LinearRegression()
+    model = linear_model.LinearRegression()
     model.fit(X, y)
 
     # Forecast future months
@@ -38,4 +151,12 @@ def forecast_expenses(csv_path, months_ahead=3):
         'Predicted_Expense': predictions
     })
 
+    # Optional prediction intervals, e.g. P5/P50/P95 columns
+    if n_paths:
+        n_paths = capped_paths(n_paths, 1, months_ahead)
+        paths = simulate_paths(df['Amount'].to_numpy()[None, :], months_ahead, n_paths, seed=seed)
+        bands = np.quantile(paths[0], quantiles, axis=0)
+        for q, band in zip(quantiles, bands):
+            forecast_df['P%d' % round(q * 100)] = band
+
     return df, forecast_df
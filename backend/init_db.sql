@@ -16,5 +16,339 @@ CREATE TABLE IF NOT EXISTS transactions (
     category TEXT,
     type TEXT CHECK(type IN ('income','expense')) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    fingerprint TEXT,
+    category_source TEXT,
+    merchant_key TEXT,
     FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
 );
+
+-- Learned category aliases: any label seen once (lowercased) -> canonical category.
+-- Loaded into an in-memory dict at startup (see category_aliases.py).
+CREATE TABLE IF NOT EXISTS category_aliases (
+    alias TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT 'learned',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Fixes previously hard-coded in apply_category_fixes.py
+INSERT OR IGNORE INTO category_aliases (alias, category, source) VALUES ('sacnfiw', 'Miscellaneous', 'manual');
+INSERT OR IGNORE INTO category_aliases (alias, category, source) VALUES ('transportation', 'Transport', 'manual');
+INSERT OR IGNORE INTO category_aliases (alias, category, source) VALUES ('health', 'Healthcare', 'manual');
+
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category COLLATE NOCASE);
+
+-- Content fingerprint (user, date, amount, normalized description, ordinal); see dedupe.py.
+-- Rows from before the column existed may stay NULL, which the unique index allows.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions(fingerprint);
+
+-- Per-user listing and keyset pagination (ORDER BY date DESC, id DESC)
+CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, date);
+
+-- Full-text search over description and category (see search.py).
+-- External-content table: text lives in transactions only; the triggers keep the index in sync.
+-- user_id is indexed as a token so the per-user filter runs inside the FTS index.
+CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+    user_id, description, category,
+    content='transactions', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+);
+
+CREATE TRIGGER IF NOT EXISTS transactions_fts_ai AFTER INSERT ON transactions BEGIN
+    INSERT INTO transactions_fts(rowid, user_id, description, category)
+    VALUES (new.id, new.user_id, new.description, new.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_fts_ad AFTER DELETE ON transactions BEGIN
+    INSERT INTO transactions_fts(transactions_fts, rowid, user_id, description, category)
+    VALUES ('delete', old.id, old.user_id, old.description, old.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_fts_au AFTER UPDATE OF user_id, description, category ON transactions BEGIN
+    INSERT INTO transactions_fts(transactions_fts, rowid, user_id, description, category)
+    VALUES ('delete', old.id, old.user_id, old.description, old.category);
+    INSERT INTO transactions_fts(rowid, user_id, description, category)
+    VALUES (new.id, new.user_id, new.description, new.category);
+END;
+
+-- Users whose old rows are being moved to the archive (see archive.py). Deleting their rows leaves
+-- daily_cumsum and monthly_spend alone, so both keep the archived history.
+CREATE TABLE IF NOT EXISTS archiving (
+    user_id INTEGER PRIMARY KEY
+);
+
+-- Per-user daily prefix sums by (type, category), maintained by the triggers below
+-- (see daily_index.py). cum_total = sum of day_total over every day <= day, so the total
+-- for any date range is two indexed lookups per category.
+CREATE TABLE IF NOT EXISTS daily_cumsum (
+    user_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    day TEXT NOT NULL,
+    day_total REAL NOT NULL DEFAULT 0,
+    cum_total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, type, category, day)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS transactions_cumsum_ai AFTER INSERT ON transactions BEGIN
+    INSERT OR IGNORE INTO daily_cumsum (user_id, type, category, day, day_total, cum_total)
+    VALUES (new.user_id, new.type, COALESCE(new.category, 'Uncategorized'), new.date, 0,
+            COALESCE((SELECT cum_total FROM daily_cumsum
+                      WHERE user_id = new.user_id AND type = new.type
+                        AND category = COALESCE(new.category, 'Uncategorized') AND day < new.date
+                      ORDER BY day DESC LIMIT 1), 0));
+    UPDATE daily_cumsum
+    SET day_total = day_total + (CASE WHEN day = new.date THEN new.amount ELSE 0 END),
+        cum_total = cum_total + new.amount
+    WHERE user_id = new.user_id AND type = new.type
+      AND category = COALESCE(new.category, 'Uncategorized') AND day >= new.date;
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_cumsum_ad AFTER DELETE ON transactions
+WHEN NOT EXISTS (SELECT 1 FROM archiving WHERE user_id = old.user_id) BEGIN
+    UPDATE daily_cumsum
+    SET day_total = day_total - (CASE WHEN day = old.date THEN old.amount ELSE 0 END),
+        cum_total = cum_total - old.amount
+    WHERE user_id = old.user_id AND type = old.type
+      AND category = COALESCE(old.category, 'Uncategorized') AND day >= old.date;
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_cumsum_au AFTER UPDATE OF user_id, date, amount, category, type ON transactions BEGIN
+    UPDATE daily_cumsum
+    SET day_total = day_total - (CASE WHEN day = old.date THEN old.amount ELSE 0 END),
+        cum_total = cum_total - old.amount
+    WHERE user_id = old.user_id AND type = old.type
+      AND category = COALESCE(old.category, 'Uncategorized') AND day >= old.date;
+    INSERT OR IGNORE INTO daily_cumsum (user_id, type, category, day, day_total, cum_total)
+    VALUES (new.user_id, new.type, COALESCE(new.category, 'Uncategorized'), new.date, 0,
+            COALESCE((SELECT cum_total FROM daily_cumsum
+                      WHERE user_id = new.user_id AND type = new.type
+                        AND category = COALESCE(new.category, 'Uncategorized') AND day < new.date
+                      ORDER BY day DESC LIMIT 1), 0));
+    UPDATE daily_cumsum
+    SET day_total = day_total + (CASE WHEN day = new.date THEN new.amount ELSE 0 END),
+        cum_total = cum_total + new.amount
+    WHERE user_id = new.user_id AND type = new.type
+      AND category = COALESCE(new.category, 'Uncategorized') AND day >= new.date;
+END;
+
+-- Learned categorizer (see learned_categorizer.py). category_source on transactions records where
+-- the label came from: 'user' (given on input), 'auto' (categorizer), 'override' (PUT .../category).
+CREATE TABLE IF NOT EXISTS category_feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_category_feedback_user ON category_feedback(user_id);
+
+-- Serialized naive Bayes counts plus training watermarks.
+CREATE TABLE IF NOT EXISTS categorizer_model (
+    name TEXT PRIMARY KEY,
+    counts BLOB NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Recurring series (subscriptions, rent, EMIs); see recurring.py. merchant_key groups a user's rows
+-- by normalized merchant so new inserts only re-check their own group.
+CREATE INDEX IF NOT EXISTS idx_transactions_user_merchant ON transactions(user_id, merchant_key);
+-- Empty once every row is keyed, so the startup backfill check costs nothing on large tables.
+CREATE INDEX IF NOT EXISTS idx_transactions_unkeyed ON transactions(id) WHERE merchant_key IS NULL;
+
+CREATE TABLE IF NOT EXISTS recurring_series (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    merchant_key TEXT NOT NULL,
+    amount_band INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT,
+    category TEXT,
+    cadence TEXT NOT NULL,
+    interval_days REAL NOT NULL,
+    avg_amount REAL NOT NULL,
+    occurrences INTEGER NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL,
+    next_date TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, merchant_key, amount_band, type)
+);
+
+-- Streaming anomaly detection (see anomalies.py): Welford running stats of log(amount)
+-- per (user, category), and the expenses flagged against them.
+CREATE TABLE IF NOT EXISTS category_stats (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    PRIMARY KEY (user_id, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS anomalies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    typical_amount REAL NOT NULL,
+    z_score REAL NOT NULL,
+    dismissed INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_anomalies_user ON anomalies(user_id, id);
+
+-- Monthly budgets (see budgets.py). monthly_spend is expense totals per (user, category, 'YYYY-MM'),
+-- kept current by the triggers below on every write path (insert, bulk upload, category override),
+-- so budget status never reads transactions.
+CREATE TABLE IF NOT EXISTS budgets (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    monthly_limit REAL NOT NULL CHECK (monthly_limit > 0),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_spend (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    month TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category, month)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS transactions_monthly_ai AFTER INSERT ON transactions
+WHEN new.type = 'expense' BEGIN
+    INSERT OR IGNORE INTO monthly_spend (user_id, category, month)
+    VALUES (new.user_id, COALESCE(new.category, 'Uncategorized'), substr(new.date, 1, 7));
+    UPDATE monthly_spend SET total = total + new.amount
+    WHERE user_id = new.user_id AND category = COALESCE(new.category, 'Uncategorized')
+      AND month = substr(new.date, 1, 7);
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_monthly_ad AFTER DELETE ON transactions
+WHEN old.type = 'expense' AND NOT EXISTS (SELECT 1 FROM archiving WHERE user_id = old.user_id) BEGIN
+    UPDATE monthly_spend SET total = total - old.amount
+    WHERE user_id = old.user_id AND category = COALESCE(old.category, 'Uncategorized')
+      AND month = substr(old.date, 1, 7);
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_monthly_au AFTER UPDATE OF user_id, date, amount, category, type ON transactions BEGIN
+    UPDATE monthly_spend SET total = total - old.amount
+    WHERE old.type = 'expense' AND user_id = old.user_id AND category = COALESCE(old.category, 'Uncategorized')
+      AND month = substr(old.date, 1, 7);
+    INSERT OR IGNORE INTO monthly_spend (user_id, category, month)
+    SELECT new.user_id, COALESCE(new.category, 'Uncategorized'), substr(new.date, 1, 7) WHERE new.type = 'expense';
+    UPDATE monthly_spend SET total = total + new.amount
+    WHERE new.type = 'expense' AND user_id = new.user_id AND category = COALESCE(new.category, 'Uncategorized')
+      AND month = substr(new.date, 1, 7);
+END;
+
+-- One event per (user, category, month, kind). Only the current (UTC) month alerts, so importing old
+-- statements doesn't replay history. forecast_overrun: from day 7 on, the linear month-end projection
+-- exceeds the limit before spend itself does.
+CREATE TABLE IF NOT EXISTS budget_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    month TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    spent REAL NOT NULL,
+    monthly_limit REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, category, month, kind)
+);
+
+CREATE TRIGGER IF NOT EXISTS monthly_spend_alerts AFTER UPDATE OF total ON monthly_spend
+WHEN new.month = strftime('%Y-%m', 'now') BEGIN
+    INSERT OR IGNORE INTO budget_alerts (user_id, category, month, kind, spent, monthly_limit)
+    SELECT new.user_id, new.category, new.month, k.kind, new.total, b.monthly_limit
+    FROM budgets b,
+         (SELECT 'threshold_80' AS kind UNION ALL SELECT 'threshold_100' UNION ALL SELECT 'forecast_overrun') k
+    WHERE b.user_id = new.user_id AND b.category = new.category
+      AND CASE k.kind
+          WHEN 'threshold_80' THEN new.total >= 0.8 * b.monthly_limit
+          WHEN 'threshold_100' THEN new.total >= b.monthly_limit
+          ELSE new.total < b.monthly_limit AND CAST(strftime('%d', 'now') AS INTEGER) >= 7
+               AND new.total * CAST(strftime('%d', 'now', 'start of month', '+1 month', '-1 day') AS INTEGER)
+                   / CAST(strftime('%d', 'now') AS INTEGER) > b.monthly_limit
+      END;
+END;
+
+-- Sharding (see db.py): the directory maps users to shard files. It is only read in DB_PATH.
+CREATE TABLE IF NOT EXISTS user_shards (
+    user_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
+
+-- Users moved off this shard (see sharding.py). A request routed here just before the move
+-- committed fails with "user moved" instead of writing rows nobody will read again.
+CREATE TABLE IF NOT EXISTS moved_users (
+    user_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS transactions_moved_ai BEFORE INSERT ON transactions
+WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id = new.user_id) BEGIN
+    SELECT RAISE(ABORT, 'user moved to another shard');
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_moved_au BEFORE UPDATE ON transactions
+WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id = new.user_id) BEGIN
+    SELECT RAISE(ABORT, 'user moved to another shard');
+END;
+
+CREATE TRIGGER IF NOT EXISTS budgets_moved_ai BEFORE INSERT ON budgets
+WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id = new.user_id) BEGIN
+    SELECT RAISE(ABORT, 'user moved to another shard');
+END;
+
+CREATE TRIGGER IF NOT EXISTS category_feedback_moved_ai BEFORE INSERT ON category_feedback
+WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id = new.user_id) BEGIN
+    SELECT RAISE(ABORT, 'user moved to another shard');
+END;
+
+-- Progress of re-categorization jobs (recategorize.py), one row per job in every shard, updated in
+-- the same transaction as each chunk it records. job names the rule set the job applies.
+CREATE TABLE IF NOT EXISTS recategorize_jobs (
+    job TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    scanned INTEGER NOT NULL DEFAULT 0,
+    changed INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- (user, category, merchant key) groups a job changed, written with each chunk and cleared when the
+-- job finishes, so the pass recomputes only those groups' anomaly stats and recurring series.
+CREATE TABLE IF NOT EXISTS recategorize_touched (
+    job TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    merchant_key TEXT NOT NULL,
+    PRIMARY KEY (job, user_id, category, merchant_key)
+) WITHOUT ROWID;
+
+-- Hot/cold tiering (see archive.py): per user, rows dated before `through` live in column files.
+-- generation counts committed archive runs; rows in the files carry the run that wrote them, so rows
+-- of a run that failed before its commit are never read.
+CREATE TABLE IF NOT EXISTS archive_marks (
+    user_id INTEGER PRIMARY KEY,
+    through TEXT NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- The archive years each of a user's merchant keys appears in, written with archive_marks, so an
+-- insert's recurring.refresh reads only those year files.
+CREATE TABLE IF NOT EXISTS archive_keys (
+    user_id INTEGER NOT NULL,
+    merchant_key TEXT NOT NULL,
+    year TEXT NOT NULL,
+    PRIMARY KEY (user_id, merchant_key, year)
+) WITHOUT ROWID;
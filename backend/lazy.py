@@ -0,0 +1,67 @@
+# backend/lazy.py
+"""
+Deferred imports for heavy dependencies (numpy, pandas, scikit-learn).
+
+    np = lazy_import("numpy")
+
+binds a placeholder module; the real import runs on first attribute access, so workers that only
+serve CRUD routes never pay for it. warm_up() imports everything registered so far, for workers that
+should be ready for forecasting before their first request (WARM_UP=1, see app.create_app).
+"""
+import sys
+import time
+import types
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger("expense-backend")
+
+_registry = {}
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports the real module the first time an attribute is read."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = name
+
+    def _load(self):
+        module = importlib.import_module(self._lazy_target)
+        # copy the real namespace in, so later attribute reads are plain dict lookups
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name):
+    """The real module if it is already imported, otherwise a LazyModule for it."""
+    if name in sys.modules:
+        return sys.modules[name]
+    module = _registry.get(name)
+    if module is None:
+        module = _registry[name] = LazyModule(name)
+    return module
+
+def is_loaded(name):
+    return name in sys.modules
+
+def warm_up(names=None):
+    """Import registered (or the given) lazy modules now. Returns {name: seconds}."""
+    timings = {}
+    for name in names or list(_registry):
+        t = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = round(time.perf_counter() - t, 3)
+    if timings:
+        logger.info("Warm-up imports: %s", ", ".join("%s %.2fs" % kv for kv in timings.items()))
+    return timings
+
+def warm_up_in_background(names=None):
+    t = threading.Thread(target=warm_up, args=(names,), name="warm-up", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,350 @@
+# backend/learned_categorizer.py
+"""
+Optional learned categorizer: multinomial naive Bayes over hashed character n-grams.
+
+Enabled with CATEGORIZER_MODEL=nb (default 'rules' = keyword engine only). Training data is
+every transaction whose category came from a person (category_source 'user', or legacy rows
+without a source) plus the override log in category_feedback; overridden rows are learned from
+the log only, so they count once. Only the canonical categories become classes: free-text labels
+are not learned, which keeps the count matrix bounded. Training is
+incremental: only rows past the stored watermarks (one pair per shard) are read. The counts
+are stored in the directory database (DB_PATH). Each user's overrides also
+form a small adapter: their own counts, smoothed towards the global model.
+Predictions below CATEGORIZER_MIN_CONFIDENCE fall back to the rule engine.
+"""
+import io
+import os
+import re
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+
+import db
+import offload
+from categorizer import categorize_many, normalize_text
+from category_aliases import CANONICAL_CATEGORIES
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger("expense-backend")
+
+ENABLED = os.environ.get("CATEGORIZER_MODEL", "rules").lower() == "nb"
+MIN_CONFIDENCE = float(os.environ.get("CATEGORIZER_MIN_CONFIDENCE", "0.7"))
+
+N_FEATURES = 1 << 16
+NGRAMS = (3, 4, 5)
+ALPHA = 0.1              # additive smoothing
+FEEDBACK_WEIGHT = 3.0    # an explicit override counts as this many labeled rows
+ADAPTER_PRIOR = 50.0     # pseudo-counts of global n-gram mass behind each user's override counts
+ADAPTER_PRIOR_DOCS = 10.0
+MIN_TRAINING_DOCS = 50   # below this the model abstains
+SAVE_INTERVAL = 60.0     # seconds between persisting the counts
+MAX_CACHED_ADAPTERS = 256
+
+_DIGITS_RE = re.compile(r"\d+")
+_CLASSES = frozenset(CANONICAL_CATEGORIES)
+
+def features(text):
+    """Unique hashed char n-gram ids of the normalized text (digits collapsed, so ref numbers don't matter)."""
+    t = " %s " % _DIGITS_RE.sub("0", normalize_text(text))
+    ids = {zlib.crc32(t[i:i + n].encode("utf-8")) & (N_FEATURES - 1)
+           for n in NGRAMS for i in range(len(t) - n + 1)}
+    return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+class NaiveBayes:
+    """Class-by-feature count matrix; rows are added as canonical categories show up."""
+
+    def __init__(self):
+        self.classes = []
+        self.index = {}
+        self.counts = np.zeros((0, N_FEATURES), dtype=np.float32)
+        self.class_docs = np.zeros(0)
+        self.class_totals = np.zeros(0)
+        self.marks = {}  # shard -> [last transaction id learned, last feedback id learned]
+
+    @property
+    def n_docs(self):
+        return float(self.class_docs.sum())
+
+    def class_id(self, label):
+        ci = self.index.get(label)
+        if ci is None:
+            ci = self.index[label] = len(self.classes)
+            self.classes.append(label)
+            self.counts = np.vstack([self.counts, np.zeros((1, N_FEATURES), dtype=np.float32)])
+            self.class_docs = np.append(self.class_docs, 0.0)
+            self.class_totals = np.append(self.class_totals, 0.0)
+        return ci
+
+    def keep_classes(self, labels):
+        """Drop every class not in labels (models saved before classes were limited). Returns the dropped."""
+        keep = [i for i, c in enumerate(self.classes) if c in labels]
+        dropped = [c for c in self.classes if c not in labels]
+        if dropped:
+            self.classes = [self.classes[i] for i in keep]
+            self.index = {c: i for i, c in enumerate(self.classes)}
+            self.counts = self.counts[keep]
+            self.class_docs = self.class_docs[keep]
+            self.class_totals = self.class_totals[keep]
+        return dropped
+
+    def learn(self, feats, label, weight=1.0):
+        if not len(feats) or label not in _CLASSES:
+            return
+        ci = self.class_id(label)
+        self.counts[ci, feats] += weight  # ids are unique per document, so plain fancy indexing is safe
+        self.class_docs[ci] += weight
+        self.class_totals[ci] += weight * len(feats)
+
+    def predict_proba(self, feats_list, adapter=None):
+        """Posterior per class for every document, shape (n_classes, n_docs). Fully vectorized."""
+        lens = np.array([len(f) for f in feats_list])
+        all_idx = np.concatenate(feats_list)
+        offsets = np.concatenate([[0], np.cumsum(lens)[:-1]])
+        cols = self.counts[:, all_idx].astype(np.float64)
+        log_p = np.log(cols + ALPHA) - np.log(self.class_totals + ALPHA * N_FEATURES)[:, None]
+        prior = (self.class_docs + 1.0) / (self.class_docs.sum() + len(self.classes))
+        if adapter is not None:
+            # the user's own counts, smoothed towards the global distributions (Dirichlet prior)
+            u_cols = adapter.columns(self, all_idx)
+            u_totals, u_docs = adapter.totals(self)
+            log_p = np.log(u_cols + ADAPTER_PRIOR * np.exp(log_p)) - np.log(u_totals + ADAPTER_PRIOR)[:, None]
+            prior = (u_docs + ADAPTER_PRIOR_DOCS * prior) / (u_docs.sum() + ADAPTER_PRIOR_DOCS)
+        scores = np.add.reduceat(log_p, offsets, axis=1)
+        scores += np.log(prior)[:, None]
+        scores -= scores.max(axis=0, keepdims=True)
+        probs = np.exp(scores)
+        return probs / probs.sum(axis=0, keepdims=True)
+
+    # ----- persistence -----
+    def dumps(self):
+        buf = io.BytesIO()
+        np.savez_compressed(buf, classes=np.array(self.classes, dtype=object), counts=self.counts,
+                            class_docs=self.class_docs, class_totals=self.class_totals,
+                            marks=np.array([[s, t, f] for s, (t, f) in sorted(self.marks.items())],
+                                           dtype=np.int64).reshape(-1, 3))
+        return buf.getvalue()
+
+    @classmethod
+    def loads(cls, blob):
+        data = np.load(io.BytesIO(blob), allow_pickle=True)
+        m = cls()
+        m.classes = [str(c) for c in data["classes"]]
+        m.index = {c: i for i, c in enumerate(m.classes)}
+        m.counts = data["counts"].astype(np.float32)
+        m.class_docs = data["class_docs"]
+        m.class_totals = data["class_totals"]
+        marks = data["marks"]
+        if marks.ndim == 1:  # saved before sharding: [trained_upto, feedback_upto]
+            m.marks = {0: [int(marks[0]), int(marks[1])]}
+        else:
+            m.marks = {int(s): [int(t), int(f)] for s, t, f in marks}
+        return m
+
+class Adapter:
+    """One user's override counts, kept as sorted id arrays per class for vectorized lookup."""
+
+    def __init__(self):
+        self.raw = {}      # label -> {feature: count}
+        self.n_docs = {}   # label -> documents
+        self._frozen = None
+
+    def add(self, feats, label):
+        d = self.raw.setdefault(label, {})
+        for f in feats.tolist():
+            d[f] = d.get(f, 0.0) + 1.0
+        self.n_docs[label] = self.n_docs.get(label, 0) + 1
+        self._frozen = None
+
+    def _freeze(self):
+        if self._frozen is None:
+            self._frozen = {}
+            for label, d in self.raw.items():
+                keys = np.fromiter(d.keys(), dtype=np.int64, count=len(d))
+                vals = np.fromiter(d.values(), dtype=np.float64, count=len(d))
+                order = np.argsort(keys)
+                self._frozen[label] = (keys[order], vals[order])
+        return self._frozen
+
+    def columns(self, model, all_idx):
+        out = np.zeros((len(model.classes), len(all_idx)))
+        for label, (keys, vals) in self._freeze().items():
+            ci = model.index.get(label)
+            if ci is None or not len(keys):
+                continue
+            pos = np.minimum(np.searchsorted(keys, all_idx), len(keys) - 1)
+            hit = keys[pos] == all_idx
+            out[ci, hit] = vals[pos[hit]]
+        return out
+
+    def totals(self, model):
+        totals = np.zeros(len(model.classes))
+        docs = np.zeros(len(model.classes))
+        for label, d in self.raw.items():
+            ci = model.index.get(label)
+            if ci is not None:
+                totals[ci] = sum(d.values())
+                docs[ci] = self.n_docs.get(label, 0)
+        return totals, docs
+
+_model = None
+_adapters = OrderedDict()  # user_id -> Adapter
+_lock = threading.Lock()
+_last_save = 0.0
+
+# ----- training -----
+def load(conn):
+    """
+    Load persisted counts (if any) from the directory connection and catch up on rows added to
+    it since they were saved. Other shards catch up through train_incremental(conn, shard=i).
+    """
+    global _model
+    row = conn.execute("SELECT counts FROM categorizer_model WHERE name='global'").fetchone()
+    with _lock:
+        _model = NaiveBayes.loads(row[0]) if row else NaiveBayes()
+        _adapters.clear()
+        dropped = _model.keep_classes(_CLASSES)
+    if dropped:
+        logger.info("Dropped %d non-canonical classes from the learned categorizer", len(dropped))
+    train_incremental(conn, force_save=True, shard=0)
+    logger.info("Learned categorizer ready: %d classes, %.0f training docs", len(_model.classes), _model.n_docs)
+
+def load_all():
+    """load() from the directory, then catch up on every other shard (startup and scripts)."""
+    conn = db.connect()
+    try:
+        load(conn)
+    finally:
+        conn.close()
+    for shard in range(1, len(db.shard_paths())):
+        conn = db.connect_shard(shard)
+        try:
+            train_incremental(conn, force_save=True, shard=shard)
+        finally:
+            conn.close()
+
+def save(conn=None):
+    """Persist the counts to the directory: conn if it is a directory connection, else a new one."""
+    global _last_save
+    with _lock:
+        blob = _model.dumps()
+    own = conn is None
+    conn = conn or db.connect()
+    try:
+        conn.execute("INSERT OR REPLACE INTO categorizer_model (name, counts, updated_at) VALUES ('global', ?, CURRENT_TIMESTAMP)", (blob,))
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    _last_save = time.time()
+
+def train_incremental(conn, batch=5000, force_save=False, shard=None):
+    """
+    Learn from labeled rows and override feedback past the model's watermarks for conn's shard
+    (default: the current request's shard). Returns rows learned.
+    """
+    if _model is None:
+        return 0
+    if shard is None:
+        shard = db.current_shard()
+    with _lock:
+        marks = _model.marks.setdefault(shard, [0, 0])
+    learned = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, description, category FROM transactions WHERE id > ? AND category IS NOT NULL "
+            "AND (category_source IS NULL OR category_source = 'user') ORDER BY id LIMIT ?",
+            (marks[0], batch)
+        ).fetchall()
+        if not rows:
+            break
+        with _lock:
+            for tx_id, desc, cat in rows:
+                _model.learn(features(desc), cat)
+            marks[0] = rows[-1][0]
+        learned += len(rows)
+
+    feedback = conn.execute(
+        "SELECT id, user_id, description, category FROM category_feedback WHERE id > ? ORDER BY id",
+        (marks[1],)
+    ).fetchall()
+    if feedback:
+        with _lock:
+            for fb_id, user_id, desc, cat in feedback:
+                _model.learn(features(desc), cat, FEEDBACK_WEIGHT)
+                _adapters.pop(user_id, None)  # rebuilt from the log on next use
+            marks[1] = feedback[-1][0]
+        learned += len(feedback)
+
+    if learned and (force_save or time.time() - _last_save > SAVE_INTERVAL):
+        save(conn if shard == 0 else None)
+    return learned
+
+def record_override(conn, user_id, description, category):
+    """Log a user's category correction and learn from it right away."""
+    conn.execute("INSERT INTO category_feedback (user_id, description, category) VALUES (?,?,?)",
+                 (user_id, description or "", category))
+    conn.commit()
+    train_incremental(conn)
+
+def _adapter(conn, user_id):
+    ad = _adapters.get(user_id)
+    if ad is not None:
+        _adapters.move_to_end(user_id)
+        return ad
+    rows = conn.execute("SELECT description, category FROM category_feedback WHERE user_id=?", (user_id,)).fetchall()
+    if not rows:
+        return None
+    ad = Adapter()
+    for desc, cat in rows:
+        if cat in _CLASSES:
+            ad.add(features(desc), cat)
+            _model.class_id(cat)
+    _adapters[user_id] = ad
+    while len(_adapters) > MAX_CACHED_ADAPTERS:
+        _adapters.popitem(last=False)
+    return ad
+
+# ----- inference -----
+def predict(conn, user_id, descriptions):
+    """
+    [(category, probability, top-3 categories) or None] per description.
+    None means the model abstains (not trained enough, or no usable text).
+    """
+    out = [None] * len(descriptions)
+    if _model is None or _model.n_docs < MIN_TRAINING_DOCS:
+        return out
+    feats = [features(d) for d in descriptions]
+    rows = [i for i, f in enumerate(feats) if len(f)]
+    if not rows:
+        return out
+    with _lock:
+        adapter = _adapter(conn, user_id) if user_id is not None else None
+        probs = _model.predict_proba([feats[i] for i in rows], adapter)
+        classes = list(_model.classes)
+    best = probs.argmax(axis=0)
+    top3 = np.argsort(-probs, axis=0)[:3]
+    for j, i in enumerate(rows):
+        out[i] = (classes[best[j]], float(probs[best[j], j]), [classes[c] for c in top3[:, j]])
+    return out
+
+def categorize_batch(conn, user_id, descriptions):
+    """
+    Same result shape as categorizer.categorize, for a batch: [(category, confidence, suggestions)].
+    Uses the learned model where it is confident, the rule engine everywhere else.
+    """
+    preds = predict(conn, user_id, descriptions) if ENABLED else [None] * len(descriptions)
+    results = [None] * len(descriptions)
+    fallback = []
+    for i, p in enumerate(preds):
+        if p is not None and p[1] >= MIN_CONFIDENCE:
+            results[i] = (p[0], "high" if p[1] >= 0.9 else "medium", p[2])
+        else:
+            fallback.append(i)
+    # the keyword engine is pure CPU: large batches go to the process pool when one is running
+    for i, r in zip(fallback, offload.map_chunks(categorize_many, [descriptions[i] for i in fallback])):
+        results[i] = r
+    return results
@@ -0,0 +1,176 @@
+# backend/metrics.py
+"""
+In-process request/DB/categorizer metrics, exposed in Prometheus text format at /metrics.
+
+Counts are per process: under gunicorn every worker keeps its own numbers, and Prometheus
+sums them. Set METRICS_ENABLED=0 to turn all timing into a no-op.
+"""
+import os
+import re
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# seconds; tuned for an API whose DB calls are sub-millisecond and reports take ~10-100 ms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SERIES = 500  # per metric; later label sets fold into "other" to keep /metrics bounded
+
+_lock = threading.Lock()
+_registry = []
+
+def _fmt_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append('%s="%s"' % (n, v))
+    return "{" + ",".join(pairs) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.series = {}
+        _registry.append(self)
+
+    def _key(self, values):
+        key = tuple(values)
+        if key not in self.series and len(self.series) >= MAX_SERIES:
+            key = ("other",) * len(self.labels)
+        return key
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *values, amount=1):
+        if not ENABLED:
+            return
+        with _lock:
+            key = self._key(values)
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        for key, v in sorted(self.series.items()):
+            yield "%s%s %s" % (self.name, _fmt_labels(self.labels, key), v)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *values):
+        if not ENABLED:
+            return
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            key = self._key(values)
+            s = self.series.get(key)
+            if s is None:
+                # per-bucket (non-cumulative) counts, count, sum
+                s = self.series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            s[0][i] += 1
+            s[1] += 1
+            s[2] += value
+
+    def render(self):
+        for key, (counts, count, total) in sorted(self.series.items()):
+            cum = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cum += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield "%s_bucket%s %d" % (self.name, _fmt_labels(self.labels + ("le",), key + (le,)), cum)
+            yield "%s_count%s %d" % (self.name, _fmt_labels(self.labels, key), count)
+            yield "%s_sum%s %r" % (self.name, _fmt_labels(self.labels, key), total)
+
+def render():
+    """All registered metrics in Prometheus text exposition format (0.0.4)."""
+    lines = []
+    with _lock:
+        for m in _registry:
+            lines.append("# HELP %s %s" % (m.name, m.doc))
+            lines.append("# TYPE %s %s" % (m.name, m.kind))
+            lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+# ----- metrics used by the backend -----
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+DB_LATENCY = Histogram("db_query_duration_seconds", "SQL statement latency", ("op", "statement"))
+CATEGORIZE_LATENCY = Histogram("categorizer_duration_seconds", "Rule-based categorize() latency")
+UPLOAD_ROWS = Counter("upload_rows_total", "Rows seen by /transactions/bulk", ("result",))
+BACKUP_DURATION = Histogram("backup_duration_seconds", "Full backups, WAL snapshots and restore checks", ("kind",),
+                            buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+
+_NUM_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_PLACEHOLDERS_RE = re.compile(r"\?(\s*,\s*\?)+")
+_WS_RE = re.compile(r"\s+")
+_statement_cache = {}
+
+def statement_label(sql):
+    """Collapse a SQL string to a low-cardinality label (literals -> ?, IN lists -> ?...)."""
+    label = _statement_cache.get(sql)
+    if label is None:
+        label = _WS_RE.sub(" ", sql).strip()
+        label = _NUM_RE.sub("?", label)
+        label = _PLACEHOLDERS_RE.sub("?...", label)[:500]
+        if len(_statement_cache) < 2000:
+            _statement_cache[sql] = label
+    return label
+
+def timed_sql(op):
+    """Decorator for db helpers whose first argument is the SQL text."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(query, *args, **kwargs):
+            if not ENABLED:
+                return fn(query, *args, **kwargs)
+            t = time.perf_counter()
+            try:
+                return fn(query, *args, **kwargs)
+            finally:
+                DB_LATENCY.observe(time.perf_counter() - t, op, statement_label(query))
+        return wrapper
+    return deco
+
+def timed(histogram, *label_values):
+    """Decorator: observe the wrapped call's duration in histogram."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - t, *label_values)
+        return wrapper
+    return deco
+
+def init_app(app):
+    """Register request timing hooks and the /metrics endpoint."""
+    from flask import g, request, Response
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response):
+        start = getattr(g, '_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            HTTP_LATENCY.observe(time.perf_counter() - start, request.method, route, response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,61 @@
+# backend/offload.py
+"""
+CPU-bound work (categorizing uploads, forecast simulation) in a process pool.
+
+The pool only exists when a server configures one (asgi.py does, from ASGI_PROCESSES); otherwise
+everything runs inline, exactly as under the WSGI server. Functions and arguments must be
+picklable: module-level functions and plain data. Workers are spawned, not forked, so they never
+inherit the server's threads, event loop or SQLite connections.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("expense-backend")
+
+MIN_CHUNK = 200  # smaller batches are cheaper inline than the round trip to a worker
+
+_pool = None
+_processes = 0
+
+def configure(processes):
+    """Start the pool (idempotent). processes <= 0 keeps everything inline."""
+    global _pool, _processes
+    if _pool is not None or processes <= 0:
+        return
+    _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    _processes = processes
+    # start the workers now, not on the first upload
+    for f in [_pool.submit(_ping) for _ in range(processes)]:
+        f.result()
+    logger.info("Process pool started with %d workers", processes)
+
+def shutdown():
+    global _pool, _processes
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool, _processes = None, 0
+
+def _ping():
+    return True
+
+def run(fn, *args):
+    """fn(*args), in a worker process if the pool is running."""
+    if _pool is None:
+        return fn(*args)
+    return _pool.submit(fn, *args).result()
+
+def map_chunks(fn, items, min_chunk=MIN_CHUNK):
+    """
+    fn(list) -> list over `items`, split into up to one chunk per worker and run in parallel.
+    Inputs under min_chunk (or no pool) run inline in one call.
+    """
+    items = list(items)
+    if _pool is None or len(items) < min_chunk:
+        return fn(items)
+    size = max(min_chunk, -(-len(items) // _processes))
+    futures = [_pool.submit(fn, items[i:i + size]) for i in range(0, len(items), size)]
+    out = []
+    for f in futures:
+        out.extend(f.result())
+    return out
@@ -0,0 +1,188 @@
+# backend/profiling.py
+"""
+Opt-in request profiling and a slow-query log. Everything is configured from the environment:
+
+  PROFILE_ADMIN_TOKEN   requests sending 'X-Profile: <token>' are profiled (unset = header ignored)
+  PROFILE_SAMPLE_RATE   fraction of all requests to profile, e.g. 0.01 (default 0)
+  PROFILE_MODE          'cprofile' (deterministic, .prof for pstats/snakeviz) or
+                        'sample' (stack sampling, .folded for flamegraph.pl/speedscope); default cprofile
+  PROFILE_INTERVAL_MS   sampling interval for PROFILE_MODE=sample (default 2)
+  PROFILE_DIR           where dumps are written (default data/profiles)
+  PROFILE_KEEP          newest dumps kept in PROFILE_DIR; older ones are deleted (default 200, 0 = keep all)
+  SLOW_QUERY_MS         query_db calls slower than this are logged with their query plan (default 250, 0 = off)
+  SLOW_QUERY_LOG        optional file to append slow-query records to (default: application log only)
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import hmac
+import random
+import logging
+import threading
+import cProfile
+from collections import deque, Counter
+from functools import wraps
+
+logger = logging.getLogger("expense-backend")
+slow_logger = logging.getLogger("expense-backend.slow_query")
+
+ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0") or 0)
+MODE = os.environ.get("PROFILE_MODE", "cprofile")
+INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "2")) / 1000.0
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "200"))
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "250") or 0)
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG")
+
+if SLOW_QUERY_LOG:
+    _fh = logging.FileHandler(SLOW_QUERY_LOG)
+    _fh.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_logger.addHandler(_fh)
+
+# most recent slow queries, served by /admin/slow-queries
+recent_slow_queries = deque(maxlen=200)
+
+def is_admin(req):
+    """True if the request carries the profiling admin token."""
+    token = req.headers.get("X-Profile", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def prune_profiles(keep=None):
+    """Delete all but the newest `keep` (default PROFILE_KEEP) dumps in PROFILE_DIR. Returns how many went."""
+    keep = PROFILE_KEEP if keep is None else keep
+    if keep <= 0:
+        return 0
+    try:
+        dumps = sorted((e.stat().st_mtime_ns, e.path) for e in os.scandir(PROFILE_DIR)
+                       if e.name.endswith((".prof", ".folded")))
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for _, path in dumps[:-keep]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:  # another worker pruned it first
+            pass
+    return removed
+
+# ----- slow-query log -----
+def slow_query_log(explain):
+    """
+    Decorator for db.query_db: calls slower than SLOW_QUERY_MS are logged together with
+    `explain(query, args)` (EXPLAIN QUERY PLAN rows on the same connection).
+    """
+    def deco(fn):
+        if SLOW_QUERY_MS <= 0:
+            return fn
+
+        @wraps(fn)
+        def wrapper(query, args=(), *rest, **kwargs):
+            t = time.perf_counter()
+            rv = fn(query, args, *rest, **kwargs)
+            ms = (time.perf_counter() - t) * 1000
+            if ms >= SLOW_QUERY_MS:
+                try:
+                    plan = [str(row[-1]) for row in explain(query, args)]
+                except Exception as e:
+                    plan = ["EXPLAIN failed: %s" % e]
+                record = {"ms": round(ms, 2), "sql": " ".join(query.split()), "plan": plan, "at": time.time()}
+                recent_slow_queries.append(record)
+                slow_logger.warning("slow query %.1f ms: %s | plan: %s", ms, record["sql"], " ; ".join(plan))
+            return rv
+        return wrapper
+    return deco
+
+# ----- stack-sampling profiler -----
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds into folded-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def folded(self):
+        return "\n".join("%s %d" % (stack, n) for stack, n in self.stacks.most_common()) + "\n"
+
+# ----- Flask integration -----
+def init_app(app):
+    """Profile selected requests; dumps go to PROFILE_DIR, the id comes back in X-Profile-Id."""
+    from flask import g, request, jsonify, send_from_directory
+
+    @app.before_request
+    def _maybe_start_profile():
+        if request.path.startswith('/admin/') or request.path == '/metrics':
+            return
+        if not (is_admin(request) or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)):
+            return
+        if MODE == "sample":
+            prof = StackSampler(threading.get_ident(), INTERVAL)
+            prof.start()
+        else:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:  # another profiler already active in this thread
+                return
+        g._profiler = prof
+
+    @app.after_request
+    def _finish_profile(response):
+        prof = g.pop('_profiler', None)
+        if prof is None:
+            return response
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        route = re.sub(r"[^A-Za-z0-9]+", "_", rule).strip("_") or "root"
+        profile_id = "%s-%s-%s" % (time.strftime("%Y%m%dT%H%M%S"), route, uuid.uuid4().hex[:8])
+        try:
+            if isinstance(prof, StackSampler):
+                prof.stop()
+                name = profile_id + ".folded"
+                with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+                    f.write(prof.folded())
+            else:
+                prof.disable()
+                name = profile_id + ".prof"
+                prof.dump_stats(os.path.join(PROFILE_DIR, name))
+            response.headers['X-Profile-Id'] = name
+        except Exception:
+            logger.exception("Could not write profile %s", profile_id)
+        prune_profiles()
+        return response
+
+    @app.route('/admin/profiles/<path:name>', methods=['GET'])
+    def get_profile(name):
+        if not is_admin(request):
+            return jsonify({"msg": "admin token required"}), 403
+        return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+    @app.route('/admin/slow-queries', methods=['GET'])
+    def slow_queries():
+        if not is_admin(request):
+            return jsonify({"msg": "admin token required"}), 403
+        return jsonify({"threshold_ms": SLOW_QUERY_MS, "queries": list(recent_slow_queries)})
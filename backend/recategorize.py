@@ -0,0 +1,168 @@
+# backend/recategorize.py
+"""
+Re-categorize stored transactions after the keyword rules (or the learned model) change.
+
+run_shard walks one shard's transactions in id order, a chunk at a time, and gives every
+machine-labeled row (category_source 'auto'; with include_legacy also rows without a source) the
+category a fresh insert would get now. Rows a person labeled ('user', 'override') are never
+touched, including rows overridden while the job runs: the UPDATE re-checks the source. Each
+chunk is written with one set-based UPDATE in the same transaction as the job's checkpoint in
+recategorize_jobs, so an interrupted job resumes after the last chunk it committed.
+
+daily_cumsum, monthly_spend and the search index follow the UPDATE through their triggers.
+category_stats, anomalies and recurring_series are recomputed once a shard's pass is done, for the
+(user, category) and (user, merchant key) groups the job changed: each chunk records them in
+recategorize_touched. Anomalies keep their ids and dismissed flags. Archived rows (archive.py) keep
+their category but still count in the recomputed stats and series. The rule
+engine runs through offload.map_chunks, so chunks are split across the process pool when one is
+configured.
+"""
+import json
+import time
+import hashlib
+import logging
+from collections import Counter
+
+import db
+import anomalies
+import recurring
+import learned_categorizer
+from categorizer import CATEGORY_KEYWORDS
+from category_aliases import normalize_category
+
+logger = logging.getLogger("expense-backend")
+
+CHUNK = 5000
+
+def ruleset_version():
+    """Default job name: a hash of the keyword rules and categorizer mode, so new rules start a new pass."""
+    blob = json.dumps(CATEGORY_KEYWORDS, sort_keys=True) + ("nb" if learned_categorizer.ENABLED else "rules")
+    return hashlib.sha1(blob.encode()).hexdigest()[:12]
+
+def _eligible(include_legacy):
+    if include_legacy:
+        return "(category_source = 'auto' OR category_source IS NULL)"
+    return "category_source = 'auto'"
+
+def categorize_rows(conn, rows):
+    """New category for each (id, user_id, description, category) row, as a fresh insert would get it."""
+    if learned_categorizer.ENABLED:
+        # the model adapts to each user's overrides: one batch per user
+        by_user = {}
+        for i, r in enumerate(rows):
+            by_user.setdefault(r[1], []).append(i)
+        results = [None] * len(rows)
+        for user_id, idx in by_user.items():
+            for i, res in zip(idx, learned_categorizer.categorize_batch(conn, user_id, [rows[i][2] or "" for i in idx])):
+                results[i] = res
+    else:
+        results = learned_categorizer.categorize_batch(conn, None, [r[2] or "" for r in rows])
+    return [normalize_category(r[0] or "Uncategorized") for r in results]
+
+def refresh_aggregates(conn, job):
+    """Recompute the state no trigger maintains, for the groups `job` changed. Returns the groups."""
+    touched = conn.execute("SELECT user_id, category, merchant_key FROM recategorize_touched WHERE job=?",
+                           (job,)).fetchall()
+    if touched:
+        anomalies.backfill(conn, [(r[0], r[1]) for r in touched])
+        keys = {}
+        for user_id, _, mkey in touched:
+            keys.setdefault(user_id, set()).add(mkey)
+        for user_id, mkeys in keys.items():
+            recurring.refresh(user_id, mkeys, conn)
+    return len(touched)
+
+def run_shard(conn, job, chunk=CHUNK, include_legacy=False, dry_run=False, progress=None):
+    """
+    Run or resume `job` on conn's shard. Returns this run's stats: scanned, changed, seconds,
+    transitions (Counter of (old, new) category) and already_finished (the job had completed here
+    before). progress(stats) is called after every chunk. A dry run starts from the first row and
+    writes nothing, checkpoint included.
+    """
+    stats = {"scanned": 0, "changed": 0, "seconds": 0.0, "transitions": Counter(), "already_finished": False}
+    last_id = 0
+    if not dry_run:
+        conn.execute("INSERT OR IGNORE INTO recategorize_jobs (job) VALUES (?)", (job,))
+        conn.commit()
+        state = conn.execute("SELECT last_id, finished_at FROM recategorize_jobs WHERE job=?", (job,)).fetchone()
+        if state["finished_at"]:
+            stats["already_finished"] = True
+            return stats
+        last_id = state["last_id"]
+
+    eligible = _eligible(include_legacy)
+    select = ("SELECT id, user_id, description, category, merchant_key FROM transactions WHERE id > ? AND %s "
+              "ORDER BY id LIMIT ?" % eligible)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS recategorize_batch (id INTEGER PRIMARY KEY, category TEXT NOT NULL)")
+    t0 = time.perf_counter()
+    while True:
+        rows = conn.execute(select, (last_id, chunk)).fetchall()
+        if not rows:
+            break
+        changes = [(r[0], new) for r, new in zip(rows, categorize_rows(conn, rows)) if new != r[3]]
+        old = {r[0]: r for r in rows}
+        last_id = rows[-1][0]
+        written = len(changes)
+        if not dry_run:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM temp.recategorize_batch")
+                conn.executemany("INSERT INTO temp.recategorize_batch (id, category) VALUES (?, ?)", changes)
+                written = conn.execute(
+                    "UPDATE transactions SET category = b.category, category_source = 'auto' "
+                    "FROM temp.recategorize_batch b WHERE transactions.id = b.id AND %s" % eligible
+                ).rowcount
+                conn.executemany(
+                    "INSERT OR IGNORE INTO recategorize_touched (job, user_id, category, merchant_key) VALUES (?,?,?,?)",
+                    [(job, old[tx_id][1], cat, old[tx_id][4] or "")
+                     for tx_id, new in changes for cat in (old[tx_id][3] or "Uncategorized", new)]
+                )
+                conn.execute(
+                    "UPDATE recategorize_jobs SET last_id=?, scanned=scanned+?, changed=changed+?, "
+                    "updated_at=CURRENT_TIMESTAMP WHERE job=?", (last_id, len(rows), written, job)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        for tx_id, new in changes:
+            stats["transitions"][(old[tx_id][3], new)] += 1
+        stats["scanned"] += len(rows)
+        stats["changed"] += written
+        stats["seconds"] = time.perf_counter() - t0
+        if progress:
+            progress(stats)
+
+    if not dry_run:
+        # recorded over every run of the job (kept by restart), so a resumed pass still refreshes
+        # the groups earlier chunks changed
+        refresh_aggregates(conn, job)
+        conn.execute("DELETE FROM recategorize_touched WHERE job=?", (job,))
+        conn.execute("UPDATE recategorize_jobs SET finished_at=CURRENT_TIMESTAMP, updated_at=CURRENT_TIMESTAMP "
+                     "WHERE job=?", (job,))
+        conn.commit()
+    stats["seconds"] = time.perf_counter() - t0
+    logger.info("Re-categorization %s: %d rows scanned, %d changed in %.1fs",
+                job, stats["scanned"], stats["changed"], stats["seconds"])
+    return stats
+
+def run(job=None, chunk=CHUNK, include_legacy=False, dry_run=False, restart=False, progress=None):
+    """
+    run_shard on every shard, in parallel. restart discards the job's checkpoints first.
+    progress(shard, stats) is called after every chunk. Returns (job, [stats per shard]).
+    """
+    job = job or ruleset_version()
+
+    def one(conn, shard):
+        if restart and not dry_run:
+            conn.execute("DELETE FROM recategorize_jobs WHERE job=?", (job,))
+            conn.commit()
+        report = (lambda stats: progress(shard, stats)) if progress else None
+        return run_shard(conn, job, chunk, include_legacy, dry_run, report)
+    return job, db.for_each_shard(one)
+
+def status():
+    """{shard: [job rows, newest first]} from every shard."""
+    def jobs(conn, shard):
+        return [dict(r) for r in conn.execute("SELECT * FROM recategorize_jobs ORDER BY started_at DESC, job")]
+    return dict(enumerate(db.for_each_shard(jobs)))
@@ -0,0 +1,239 @@
+# backend/recurring.py
+"""
+Recurring transaction / subscription detection.
+
+Transactions are grouped by (user, merchant key, amount band, type). A group is a recurring series
+when it has enough occurrences and its day gaps cluster around one of the known cadences.
+Detected series live in recurring_series. Inserts only re-evaluate the groups they touch
+(transactions.merchant_key is indexed per user), so history is never rescanned. Archived rows
+(archive.py) are part of every group, so archiving never shrinks a series.
+"""
+import re
+import math
+import logging
+from datetime import date, timedelta
+
+import db
+import archive
+from categorizer import normalize_text
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger("expense-backend")
+
+# (name, period in days, tolerance in days, calendar months per step or None for fixed days)
+CADENCES = [
+    ("weekly", 7, 1, None),
+    ("biweekly", 14, 2, None),
+    ("monthly", 30.44, 4, 1),
+    ("quarterly", 91.3, 8, 3),
+    ("yearly", 365.25, 12, 12),
+]
+MIN_OCCURRENCES = 4
+MIN_REGULARITY = 0.75      # share of gaps that must sit within the cadence tolerance
+BAND_WIDTH = math.log(1.2)  # amounts within ~20% of each other share a band
+
+# statement noise that says nothing about the merchant
+_NOISE_TOKENS = {"upi", "pos", "neft", "imps", "ach", "d", "ref", "txn", "payment", "to", "by"}
+_DIGITS_RE = re.compile(r"\d+")
+
+_COLUMNS = ("user_id", "merchant_key", "amount_band", "type", "description", "category", "cadence",
+            "interval_days", "avg_amount", "occurrences", "first_date", "last_date", "next_date", "confidence")
+
+def merchant_key(description):
+    """First three meaningful words of the description, without reference numbers or rail prefixes."""
+    words = [w for w in _DIGITS_RE.sub(" ", normalize_text(description)).split()
+             if len(w) > 1 and w not in _NOISE_TOKENS]
+    return " ".join(words[:3]) or None
+
+def amount_band(amount):
+    return int(round(math.log(max(abs(float(amount)), 1.0)) / BAND_WIDTH))
+
+def _add_months(d, months):
+    m = d.month - 1 + months
+    y, m = d.year + m // 12, m % 12 + 1
+    for day in (d.day, 30, 29, 28):
+        try:
+            return date(y, m, day)
+        except ValueError:
+            continue
+
+def next_occurrence(last, cadence):
+    name, period, tol, months = next(c for c in CADENCES if c[0] == cadence)
+    return _add_months(last, months) if months else last + timedelta(days=period)
+
+def interval_stats(gid, day, amount, n_groups):
+    """
+    Per-group statistics over (group id, day ordinal, amount) arrays, without a Python loop:
+    count, median gap, cadence index (-1 = none), share of regular gaps, mean amount, first/last day.
+    """
+    order = np.lexsort((day, gid))
+    gid, day, amount = gid[order], day[order], amount[order]
+    count = np.bincount(gid, minlength=n_groups)
+    ends = np.cumsum(count) - 1
+    starts = ends - count + 1
+
+    same = gid[1:] == gid[:-1]
+    gaps = np.diff(day)[same].astype(np.float64)
+    gap_gid = gid[1:][same]
+    n_gaps = np.bincount(gap_gid, minlength=n_groups)
+
+    # median gap: sort gaps within each group, pick the middle one
+    o = np.lexsort((gaps, gap_gid))
+    gap_starts = np.cumsum(n_gaps) - n_gaps
+    has = n_gaps > 0
+    median = np.zeros(n_groups)
+    median[has] = gaps[o][gap_starts[has] + (n_gaps[has] - 1) // 2]
+
+    cadence = np.full(n_groups, -1)
+    tol = np.zeros(n_groups)
+    for i, (_, period, t, _) in enumerate(CADENCES):
+        hit = (cadence < 0) & (np.abs(median - period) <= t)
+        cadence[hit] = i
+        tol[hit] = t
+    regular = np.bincount(gap_gid, weights=np.abs(gaps - median[gap_gid]) <= tol[gap_gid], minlength=n_groups)
+    share = np.divide(regular, n_gaps, out=np.zeros(n_groups), where=has)
+    mean_amount = np.bincount(gid, weights=amount, minlength=n_groups) / np.maximum(count, 1)
+    return {
+        "count": count, "median": median, "cadence": cadence, "regularity": share,
+        "mean_amount": mean_amount, "first": day[starts], "last": day[ends], "last_row": order[ends],
+    }
+
+def detect(rows):
+    """
+    rows: (user_id, merchant_key, type, date, amount, description, category) tuples.
+    Returns recurring_series rows (dicts) for every group that qualifies.
+    """
+    groups = {}
+    gid, days, amounts = [], [], []
+    for user_id, mkey, tx_type, d, amount, _, _ in rows:
+        if not mkey:
+            gid.append(-1)
+            days.append(0)
+            amounts.append(0.0)
+            continue
+        g = groups.setdefault((user_id, mkey, amount_band(amount), tx_type), len(groups))
+        gid.append(g)
+        days.append(date.fromisoformat(str(d)[:10]).toordinal())
+        amounts.append(abs(float(amount)))
+    if not groups:
+        return []
+    gid = np.array(gid)
+    keep = gid >= 0
+    idx = np.flatnonzero(keep)
+    st = interval_stats(gid[keep], np.array(days)[keep], np.array(amounts)[keep], len(groups))
+
+    ok = np.flatnonzero((st["count"] >= MIN_OCCURRENCES) & (st["cadence"] >= 0) & (st["regularity"] >= MIN_REGULARITY))
+    out = []
+    keys = list(groups)
+    for g in ok:
+        user_id, mkey, band, tx_type = keys[g]
+        sample = rows[idx[st["last_row"][g]]]
+        name = CADENCES[st["cadence"][g]][0]
+        last = date.fromordinal(int(st["last"][g]))
+        out.append({
+            "user_id": user_id, "merchant_key": mkey, "amount_band": band, "type": tx_type,
+            "description": sample[5], "category": sample[6], "cadence": name,
+            "interval_days": float(st["median"][g]), "avg_amount": round(float(st["mean_amount"][g]), 2),
+            "occurrences": int(st["count"][g]),
+            "first_date": date.fromordinal(int(st["first"][g])).isoformat(), "last_date": last.isoformat(),
+            "next_date": next_occurrence(last, name).isoformat(),
+            "confidence": round(float(st["regularity"][g]) * min(1.0, st["count"][g] / 6.0), 3),
+        })
+    return out
+
+_ROW_SQL = ("SELECT user_id, merchant_key, type, date, amount, description, category FROM transactions "
+            "WHERE merchant_key IS NOT NULL")
+
+def _archived_rows(conn, user_id, keys=None):
+    """
+    user_id's committed archived rows with a merchant key (in `keys`, if given), as _ROW_SQL tuples.
+    With keys only the year files those keys appear in are read, so an insert stays cheap.
+    """
+    names = ["merchant_key", "type", "date", "amount", "description", "category"]
+    cols = archive.scan(user_id, names, conn=conn, merchant_keys=keys)
+    values = [np.datetime_as_string(cols[n]).tolist() if n == "date" else cols[n].tolist() for n in names]
+    return [(user_id,) + r for r in zip(*values) if r[0] and (keys is None or r[0] in keys)]
+
+def _store(conn, series):
+    conn.executemany(
+        "INSERT OR REPLACE INTO recurring_series (%s) VALUES (%s)" % (", ".join(_COLUMNS), ", ".join("?" * len(_COLUMNS))),
+        [tuple(s[c] for c in _COLUMNS) for s in series]
+    )
+
+def backfill_keys(conn, batch=50000):
+    """Assign merchant keys to rows inserted before the column existed (or by bulk loaders)."""
+    total, last_id = 0, 0
+    while True:
+        rows = conn.execute("SELECT id, description FROM transactions WHERE id > ? AND merchant_key IS NULL "
+                            "ORDER BY id LIMIT ?", (last_id, batch)).fetchall()
+        if not rows:
+            break
+        # rows without a usable key get '' so they are not picked up again
+        conn.executemany("UPDATE transactions SET merchant_key=? WHERE id=?",
+                         [(merchant_key(r[1]) or "", r[0]) for r in rows])
+        conn.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+    if total:
+        logger.info("Backfilled merchant keys for %d transactions", total)
+    return total
+
+def rebuild(conn):
+    """Detect every series from scratch (one pass over all transactions, archived ones included)."""
+    rows = [r for (user_id,) in conn.execute("SELECT user_id FROM archive_marks").fetchall()
+            for r in _archived_rows(conn, user_id)]
+    series = detect(rows + conn.execute(_ROW_SQL + " AND merchant_key != ''").fetchall())
+    conn.execute("DELETE FROM recurring_series")
+    _store(conn, series)
+    conn.commit()
+    return len(series)
+
+def ensure_index(conn):
+    """Key rows written without a merchant key (old rows, bulk loaders) and re-detect if there were any."""
+    if backfill_keys(conn):
+        logger.info("Detected %d recurring series", rebuild(conn))
+
+def refresh(user_id, keys, conn=None):
+    """Re-evaluate only the (user, merchant key) groups touched by new rows."""
+    keys = sorted({k for k in keys if k})
+    if not keys:
+        return 0
+    conn = conn or db.get_db()
+    found = []
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        found += detect(_archived_rows(conn, user_id, set(chunk)) + conn.execute(
+            _ROW_SQL + " AND user_id=? AND merchant_key IN (%s)" % marks, [user_id] + chunk).fetchall())
+        conn.execute("DELETE FROM recurring_series WHERE user_id=? AND merchant_key IN (%s)" % marks, [user_id] + chunk)
+    _store(conn, found)
+    conn.commit()
+    return len(found)
+
+def list_series(user_id, today, horizon_days=90, include_stale=False):
+    """
+    Stored series for a user, each with its projected occurrences up to today + horizon_days.
+    A series is stale once its expected next date is more than one tolerance window in the past.
+    """
+    rows = db.query_db("SELECT * FROM recurring_series WHERE user_id=? ORDER BY next_date, id", (user_id,))
+    horizon = today + timedelta(days=horizon_days)
+    out = []
+    for r in rows:
+        s = dict(r)
+        _, period, tol, _ = next(c for c in CADENCES if c[0] == s["cadence"])
+        nxt = date.fromisoformat(s["next_date"])
+        s["active"] = nxt + timedelta(days=tol) >= today
+        if not s["active"] and not include_stale:
+            continue
+        projected = []
+        while nxt <= horizon:
+            if nxt >= today:
+                projected.append(nxt.isoformat())
+            nxt = next_occurrence(nxt, s["cadence"])
+        s["projected"] = projected
+        s["projected_total"] = round(s["avg_amount"] * len(projected), 2)
+        s["monthly_amount"] = round(s["avg_amount"] * 30.44 / period, 2)
+        out.append(s)
+    return out
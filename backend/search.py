@@ -0,0 +1,87 @@
+# backend/search.py
+import re
+import logging
+
+import db
+
+logger = logging.getLogger("expense-backend")
+
+MAX_PAGE_SIZE = 200
+# bm25 column weights: user_id (filter only), description, category
+BM25_WEIGHTS = (0.0, 1.0, 0.5)
+
+TERM_RE = re.compile(r"\w+\*?", re.UNICODE)
+
+def ensure_index(conn):
+    """Rebuild the FTS index if it is out of step with transactions (e.g. rows from before it existed)."""
+    indexed = conn.execute("SELECT COUNT(*) FROM transactions_fts_docsize").fetchone()[0]
+    total = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    if indexed != total:
+        logger.info("Rebuilding full-text index (%d indexed, %d rows)", indexed, total)
+        conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+        conn.commit()
+
+def build_match(user_id, q):
+    """
+    Turn free text into a safe FTS5 MATCH expression scoped to one user.
+    Every word is quoted (so operators/punctuation in input can't break the query) and ANDed;
+    a trailing '*' keeps prefix search: 'swig*' matches 'swiggy'.
+    Returns None if q has no searchable terms.
+    """
+    terms = []
+    for t in TERM_RE.findall(q or ""):
+        word = t.rstrip("*")
+        terms.append('"%s"%s' % (word, "*" if t.endswith("*") else ""))
+    if not terms:
+        return None
+    return 'user_id:"%s" AND {description category}:(%s)' % (int(user_id), " ".join(terms))
+
+def parse_cursor(cursor):
+    """Cursor is '<sort key>:<id>' from the previous page's next_cursor."""
+    key, _, tx_id = (cursor or "").rpartition(":")
+    if not key:
+        raise ValueError("bad cursor")
+    return key, int(tx_id)
+
+def search_transactions(user_id, q, limit=50, cursor=None, sort="rank"):
+    """
+    Ranked (bm25) or date-ordered search. Keyset pagination: pass back next_cursor to
+    continue after the last row instead of using OFFSET.
+    Returns (rows, next_cursor).
+    """
+    match = build_match(user_id, q)
+    if match is None:
+        return [], None
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    if sort == "date":
+        sort_expr, order = "t.date", "t.date DESC, t.id DESC"
+        after = "AND (t.date < ? OR (t.date = ? AND t.id < ?))"
+    else:
+        sort_expr, order = "bm25(transactions_fts, %s, %s, %s)" % BM25_WEIGHTS, "score ASC, t.id ASC"
+        after = "AND (score > ? OR (score = ? AND t.id > ?))"
+
+    args = [match, user_id]
+    where_after = ""
+    if cursor:
+        key, last_id = parse_cursor(cursor)
+        if sort != "date":
+            key = float(key)
+        where_after = after.replace("score", sort_expr)
+        args += [key, key, last_id]
+
+    rows = db.query_db(
+        "SELECT t.id, t.date, t.amount, t.description, t.category, t.type, %s AS score "
+        "FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid "
+        # '+t.user_id' keeps the planner from walking idx_transactions_user_date and probing FTS per row;
+        # the MATCH already restricts to this user, the comparison is only a safety net
+        "WHERE transactions_fts MATCH ? AND +t.user_id = ? %s "
+        "ORDER BY %s LIMIT %d" % (sort_expr, where_after, order, limit + 1),
+        args
+    )
+    results = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = results[-1]
+        next_cursor = "%s:%s" % (last["date"] if sort == "date" else repr(last["score"]), last["id"])
+    return results, next_cursor
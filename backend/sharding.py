@@ -0,0 +1,172 @@
+# backend/sharding.py
+"""
+Moving users between shards while the app keeps serving (see db.py for routing).
+
+move_user copies one user's rows to the target shard, points the directory at it and deletes the
+originals, holding the source shard's write lock throughout. Reads are never blocked. Writes to
+the source shard wait for the move; once it commits, a write still routed the old way fails
+(moved_users guard triggers) rather than landing where nobody reads it. Moved rows get new ids on
+the target, so ids a client kept from before the move (anomaly ids, page cursors) go stale.
+
+The search index is rebuilt on the target by the insert triggers. daily_cumsum and monthly_spend
+are copied as they are, since they also hold the totals of archived rows (archive.py; the
+archive files themselves are keyed by user and stay put). The learned categorizer (CATEGORIZER_MODEL=nb) learns a moved user's
+labeled rows a second time on the target; delete its categorizer_model row to retrain from scratch.
+"""
+import time
+import logging
+
+import db
+
+logger = logging.getLogger("expense-backend")
+
+# user-scoped tables copied by move_user, in insert order (budgets after transactions, so the
+# monthly_spend triggers don't raise budget alerts for replayed history)
+COPIED_TABLES = ["transactions", "category_feedback", "recurring_series", "category_stats",
+                 "anomalies", "budgets", "budget_alerts", "archive_marks", "archive_keys"]
+# kept up by triggers on transactions, but copied over what the triggers build on the target:
+# they include archived history. Cleared directly before deleting the user's rows, so the
+# delete triggers have nothing to update.
+DERIVED_TABLES = ["daily_cumsum", "monthly_spend"]
+
+def _columns(conn, table):
+    return [r[1] for r in conn.execute("PRAGMA table_info(%s)" % table)]
+
+def _delete_user(conn, user_id):
+    for table in DERIVED_TABLES + COPIED_TABLES:
+        conn.execute("DELETE FROM %s WHERE user_id=?" % table, (user_id,))
+
+def _copy_user(src, dst, user_id):
+    """Insert user_id's rows from src into dst (inside the caller's transactions). Returns row counts."""
+    counts = {}
+    id_map = {}
+    for table in COPIED_TABLES:
+        cols = _columns(src, table)
+        # rowid tables get fresh ids on the target; WITHOUT ROWID tables are keyed by user anyway
+        keep = [c for c in cols if c != "id"]
+        order = " ORDER BY date, id" if table == "transactions" else ""
+        rows = src.execute("SELECT %s FROM %s WHERE user_id=?%s" % (", ".join(cols), table, order), (user_id,)).fetchall()
+        verb = "INSERT" if table == "transactions" else "INSERT OR IGNORE"
+        sql = "%s INTO %s (%s) VALUES (%s)" % (verb, table, ", ".join(keep), ", ".join("?" * len(keep)))
+        if table == "transactions":
+            # one at a time, in date order: the new ids are needed for anomalies, and the
+            # prefix-sum trigger only touches the newest day when dates arrive ascending
+            for r in rows:
+                id_map[r["id"]] = dst.execute(sql, [r[c] for c in keep]).lastrowid
+        elif table == "anomalies":
+            dst.executemany(sql, [[id_map.get(r["transaction_id"], r["transaction_id"]) if c == "transaction_id" else r[c]
+                                   for c in keep] for r in rows])
+        else:
+            dst.executemany(sql, [[r[c] for c in keep] for r in rows])
+        counts[table] = len(rows)
+    for table in DERIVED_TABLES:
+        cols = _columns(src, table)
+        dst.execute("DELETE FROM %s WHERE user_id=?" % table, (user_id,))
+        dst.executemany("INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(cols), ", ".join("?" * len(cols))),
+                        src.execute("SELECT %s FROM %s WHERE user_id=?" % (", ".join(cols), table), (user_id,)).fetchall())
+    return counts
+
+def move_user(user_id, target):
+    """Move one user's data to shard `target` (online). Returns {table: rows moved}, {} if already there."""
+    if db.SHARD_ROUTING == 'hash':
+        raise ValueError("SHARD_ROUTING=hash: users cannot be moved")
+    if not 0 <= target < len(db.shard_paths()):
+        raise ValueError("no shard %d" % target)
+    directory = db.connect()
+    try:
+        row = directory.execute("SELECT shard FROM user_shards WHERE user_id=?", (user_id,)).fetchone()
+        if row is None:
+            raise ValueError("user %s has no directory entry" % user_id)
+        source = row[0]
+    finally:
+        directory.close()
+    if source == target:
+        return {}
+
+    t = time.perf_counter()
+    src, dst = db.connect_shard(source), db.connect_shard(target)
+    # shard 0 is the directory's file too: update user_shards on the connection already holding its lock
+    directory = src if source == 0 else dst if target == 0 else db.connect()
+    try:
+        src.execute("BEGIN IMMEDIATE")
+        dst.execute("BEGIN IMMEDIATE")
+        dst.execute("DELETE FROM moved_users WHERE user_id=?", (user_id,))
+        _delete_user(dst, user_id)  # leftovers of an earlier, interrupted move
+        counts = _copy_user(src, dst, user_id)
+        if directory is dst:
+            directory.execute("UPDATE user_shards SET shard=? WHERE user_id=?", (target, user_id))
+        dst.commit()
+        if directory is not src and directory is not dst:
+            directory.execute("UPDATE user_shards SET shard=? WHERE user_id=?", (target, user_id))
+            directory.commit()
+        _delete_user(src, user_id)
+        src.execute("INSERT OR REPLACE INTO moved_users (user_id, shard) VALUES (?, ?)", (user_id, target))
+        if directory is src:
+            directory.execute("UPDATE user_shards SET shard=? WHERE user_id=?", (target, user_id))
+        src.commit()
+    except Exception:
+        src.rollback()
+        dst.rollback()
+        raise
+    finally:
+        for conn in {id(c): c for c in (src, dst, directory)}.values():
+            conn.close()
+    logger.info("Moved user %s from shard %d to %d in %.2fs (%d transactions)",
+                user_id, source, target, time.perf_counter() - t, counts["transactions"])
+    return counts
+
+def user_rows():
+    """{shard: {user_id: transaction rows}} from every shard, read in parallel."""
+    def count(conn, shard):
+        return {r[0]: r[1] for r in conn.execute("SELECT user_id, COUNT(*) FROM transactions GROUP BY user_id")}
+    return dict(enumerate(db.for_each_shard(count)))
+
+def plan_balance(rows=None, max_moves=50, tolerance=0.1):
+    """
+    Greedy moves [(user_id, source, target, rows)] that even out transaction rows across shards:
+    repeatedly move the biggest user from the fullest shard that fits within half the gap to the
+    emptiest one, until the shards are within `tolerance` of the mean.
+    """
+    rows = {s: dict(u) for s, u in (rows or user_rows()).items()}
+    totals = {s: sum(u.values()) for s, u in rows.items()}
+    mean = sum(totals.values()) / max(1, len(totals))
+    moves = []
+    while len(moves) < max_moves:
+        hi = max(totals, key=totals.get)
+        lo = min(totals, key=totals.get)
+        gap = totals[hi] - totals[lo]
+        if gap <= tolerance * mean:
+            break
+        fits = [(n, u) for u, n in rows[hi].items() if n <= gap / 2]
+        if not fits:
+            break
+        n, user_id = max(fits)
+        moves.append((user_id, hi, lo, n))
+        del rows[hi][user_id]
+        rows[lo][user_id] = n
+        totals[hi] -= n
+        totals[lo] += n
+    return moves
+
+def purge_orphans(dry_run=True):
+    """
+    Delete rows of users the directory places on another shard (left behind if a move was
+    interrupted after the switch). Returns {shard: [user_id, ...]}.
+    """
+    if db.SHARD_ROUTING == 'hash':
+        raise ValueError("SHARD_ROUTING=hash has no directory to check against")
+    directory = db.connect()
+    try:
+        placed = dict(directory.execute("SELECT user_id, shard FROM user_shards").fetchall())
+    finally:
+        directory.close()
+
+    def purge(conn, shard):
+        users = [u for (u,) in conn.execute("SELECT DISTINCT user_id FROM transactions")
+                 if placed.get(u, 0) != shard]
+        if not dry_run and users:
+            for u in users:
+                _delete_user(conn, u)
+            conn.commit()
+        return users
+    return {s: users for s, users in enumerate(db.for_each_shard(purge)) if users}
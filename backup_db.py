@@ -0,0 +1,109 @@
+import os, sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import db
+import backup
+
+parser = argparse.ArgumentParser(
+    description="Online backups, WAL snapshots and point-in-time restores of every shard "
+                "(without an action: list the backups).")
+parser.add_argument("--db", default=os.path.abspath(os.path.join(os.getcwd(), "data", "expense.db")),
+                    help="the directory database (shard 0); further shards come from DB_SHARDS")
+parser.add_argument("--full", action="store_true", help="start a new chain with a full backup of each shard")
+parser.add_argument("--snapshot", action="store_true",
+                    help="add a WAL snapshot to each shard's newest chain (BACKUP_WAL=1; run it while the app "
+                         "is up: when the last connection closes, the WAL is emptied and the next snapshot "
+                         "starts a new chain)")
+parser.add_argument("--verify", action="store_true", help="restore each shard's newest point and check it")
+parser.add_argument("--restore", metavar="DEST", help="rebuild --shard into the new file DEST")
+parser.add_argument("--archive-dest", metavar="DIR",
+                    help="with --restore: new directory for the archived transactions' year files (default DEST.archive)")
+parser.add_argument("--shard", type=int, default=0, help="shard for --restore (default 0)")
+parser.add_argument("--at", help="with --restore: newest point at or before this UTC time, 'YYYY-MM-DD HH:MM:SS'")
+parser.add_argument("--chain", help="with --restore / --verify: use this chain instead of the newest")
+parser.add_argument("--schedule", action="store_true",
+                    help="keep running and take backups as BACKUP_FULL_HOURS / BACKUP_SNAPSHOT_MINUTES say")
+args = parser.parse_args()
+
+if not os.path.exists(args.db):
+    raise SystemExit("DB not found: " + args.db)
+db.DB_PATH = args.db
+missing = [p for p in db.shard_paths() if not os.path.exists(p)]
+if missing:
+    raise SystemExit("Shard not found: " + ", ".join(missing))
+db.for_each_shard(lambda conn, shard: db.init_schema(conn))
+print("Backup directory:", backup.backup_dir())
+
+def mib(n):
+    return n / 2**20
+
+def report(r):
+    if r["kind"] == "full":
+        print("  - shard %d: full backup %s, %.1f MiB + %d archive files (%.1f MiB) in %.2fs (%s, %d steps, %d restarts)" % (
+            r["shard"], r["chain"], mib(r["bytes"]), r["archive_files"], mib(r["archive_bytes"]), r["seconds"],
+            r["mode"], r["steps"], r["restarts"]))
+        if r["pruned"]:
+            print("    removed old chains: " + ", ".join(r["pruned"]))
+    elif r["kind"] == "snapshot":
+        if r["frames"]:
+            print("  - shard %d: snapshot %s/%s, %d frames (%.1f MiB) in %.2fs" % (
+                r["shard"], r["chain"], r["file"], r["frames"], mib(r["bytes"]), r["seconds"]))
+        else:
+            print("  - shard %d: nothing committed since the last snapshot" % r["shard"])
+    if r.get("verified"):
+        v = r["verified"]
+        print("  - shard %d: %s restored as of %s in %.2fs, integrity %s, %d transactions (checked in %.2fs)" % (
+            v["shard"], v["chain"], v["point"], v["restore_seconds"], "ok" if v["integrity"] == ["ok"] else "FAILED: "
+            + "; ".join(v["integrity"]), v["transactions"], v["check_seconds"]))
+        print("    %d archived users, %d archived rows%s" % (
+            v["archived_users"], v["archived_rows"],
+            ", FAILED: " + "; ".join(v["archive"]) if v["archive"] else ", all in their files"))
+
+shards = range(len(db.shard_paths()))
+if args.restore:
+    try:
+        r = backup.restore(args.shard, os.path.abspath(args.restore), at=args.at, chain=args.chain,
+                           archive_dest=args.archive_dest and os.path.abspath(args.archive_dest))
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print("Restored shard %d from %s as of %s (%d snapshots, %d WAL frames) in %.2fs into %s" % (
+        args.shard, r["chain"], r["point"], r["snapshots"], r["frames"], r["seconds"], args.restore))
+    if r["archive"]:
+        print("%d archive files restored into %s (set ARCHIVE_DIR to it, or copy them into the archive directory)" % (
+            r["archive_files"], r["archive"]))
+elif args.full or args.snapshot or args.verify:
+    for shard in shards:
+        if args.full:
+            report(backup.full_backup(shard))
+        if args.snapshot:
+            report(backup.snapshot(shard))
+        if args.verify:
+            report({"kind": "verify", "verified": backup.verify(shard, args.chain)})
+elif args.schedule:
+    print("Full backup every %g hours%s; Ctrl-C to stop" % (
+        backup.FULL_HOURS, ", WAL snapshot every %g minutes" % backup.SNAPSHOT_MINUTES if db.WAL_SNAPSHOTS else ""))
+    if db.WAL_SNAPSHOTS:
+        backup.hold_open()
+
+    def scheduled(r):
+        if r["kind"] != "snapshot" or r["frames"]:
+            report(r)
+    for r in backup.run_due():
+        scheduled(r)
+    try:
+        backup.schedule_forever(log=scheduled)
+    except KeyboardInterrupt:
+        pass
+else:
+    for shard, found in backup.status().items():
+        print("shard %d:" % shard)
+        if not found:
+            print("  - No backups")
+        for c in found:
+            v = c["verified"]
+            print("  - %s  base %.1f MiB + %d snapshots (%.1f MiB), newest point %s, %s" % (
+                c["chain"], mib(c["base_bytes"]), c["snapshots"], mib(c["snapshot_bytes"]), c["newest_point"],
+                "not verified" if v is None else "verified %s (%s, restore %.2fs)" % (
+                    v["at"], "ok" if v["ok"] else "FAILED", v["restore_seconds"])))
+print('\nDone.')
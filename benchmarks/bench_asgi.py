@@ -0,0 +1,161 @@
+"""
+WSGI vs ASGI serving under the same concurrent load (request mix from load_test.py).
+
+    python benchmarks/bench_asgi.py --db /tmp/bench.db --concurrency 32 --duration 20
+    python benchmarks/bench_asgi.py --db /tmp/bench.db --slow-clients 16 --threads 8
+
+Each mode is served by its own process, on a fresh copy of the database:
+  wsgi  werkzeug with a fixed pool of --threads handler threads (like gunicorn gthread)
+  asgi  uvicorn asgi:application with ASGI_THREADS=--threads and ASGI_PROCESSES=--processes
+--slow-clients adds clients that trickle a CSV upload over --trickle seconds. A thread-per-request
+server holds a handler thread for each of them for the whole transfer.
+Needs uvicorn for the asgi mode.
+"""
+import os, sys, time, shutil, socket, argparse, tempfile, threading, subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import BACKEND, save_results, use_database
+import synth
+import load_test
+
+def serve_wsgi(port, db_path, threads):
+    """Child process: bounded-thread WSGI server."""
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import ThreadedWSGIServer
+    use_database(db_path)
+    import app as backend_app
+
+    class BoundedServer(ThreadedWSGIServer):
+        pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    BoundedServer("127.0.0.1", port, backend_app.create_app()).serve_forever()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start(mode, db_path, threads, processes):
+    port = free_port()
+    env = dict(os.environ, DB_PATH=db_path, ASGI_THREADS=str(threads), ASGI_PROCESSES=str(processes))
+    if mode == "wsgi":
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve-wsgi", str(port), db_path, str(threads)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:application", "--app-dir", BACKEND,
+               "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = "http://127.0.0.1:%d" % port
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base + "/health", timeout=2):
+                return proc, base
+        except Exception:
+            if proc.poll() is not None:
+                raise SystemExit("%s server exited with code %s" % (mode, proc.returncode))
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("%s server did not come up" % mode)
+
+def slow_uploader(base, token, body, ctype, trickle, deadline, done, lock):
+    """Send a multipart upload in small pieces spread over `trickle` seconds, repeatedly."""
+    host, port = base.split("//")[1].split(":")
+    pieces = 20
+    size = -(-len(body) // pieces)
+    count = 0
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection((host, int(port)), timeout=60) as s:
+                s.sendall(("POST /transactions/bulk HTTP/1.1\r\nHost: %s\r\nAuthorization: Bearer %s\r\n"
+                           "Content-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                           % (host, token, ctype, len(body))).encode())
+                for i in range(0, len(body), size):
+                    s.sendall(body[i:i + size])
+                    time.sleep(trickle / pieces)
+                while s.recv(65536):
+                    pass
+            count += 1
+        except OSError:
+            pass
+    with lock:
+        done.append(count)
+
+def run_mode(mode, args, src_db, tokens):
+    db_path = os.path.join(tempfile.mkdtemp(), "bench-%s.db" % mode)
+    shutil.copy(src_db, db_path)
+    proc, base = start(mode, db_path, args.threads, args.processes)
+    try:
+        slow_done, lock, slow_threads = [], threading.Lock(), []
+        if args.slow_clients:
+            body, ctype = load_test.multipart_csv(list(synth.generate_transactions(200, 1, seed=args.seed + 7)))
+            deadline = time.perf_counter() + args.duration
+            for i in range(args.slow_clients):
+                t = threading.Thread(target=slow_uploader, args=(base, tokens[1 + i % len(tokens)], body, ctype,
+                                                                 args.trickle, deadline, slow_done, lock))
+                t.start()
+                slow_threads.append(t)
+        r = load_test.run_load(base, tokens, args.concurrency, args.duration, args.seed)
+        for t in slow_threads:
+            t.join()
+        r["slow_uploads_completed"] = sum(slow_done)
+        return r
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--serve-wsgi":
+        return serve_wsgi(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="source database (built with synth data if missing); each mode gets a copy")
+    ap.add_argument("--modes", default="wsgi,asgi")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--threads", type=int, default=16, help="handler threads in both modes")
+    ap.add_argument("--processes", type=int, default=2, help="ASGI process pool size")
+    ap.add_argument("--slow-clients", type=int, default=0)
+    ap.add_argument("--trickle", type=float, default=3.0, help="seconds each slow upload takes to send")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    src_db = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    if not os.path.exists(src_db):
+        use_database(src_db)
+        print("built %d synthetic rows in %.1fs" % (args.rows, synth.load_db(src_db, args.rows, args.users, args.seed)))
+
+    # tokens only need the shared JWT secret, not a running app
+    from flask import Flask
+    from flask_jwt_extended import JWTManager
+    token_app = Flask("bench-tokens")
+    token_app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "super-secret-key")
+    JWTManager(token_app)
+    tokens = load_test.make_tokens(token_app, args.users)
+
+    results = {}
+    for mode in args.modes.split(","):
+        print("== %s" % mode)
+        results[mode] = run_mode(mode, args, src_db, tokens)
+        load_test.print_report(results[mode])
+        if args.slow_clients:
+            print("slow uploads completed: %d" % results[mode]["slow_uploads_completed"])
+
+    if len(results) == 2:
+        a, b = (results[m] for m in args.modes.split(","))
+        print("\n%-22s %12s %12s" % ("", *args.modes.split(",")))
+        print("%-22s %12.1f %12.1f" % ("throughput req/s", a["throughput_rps"], b["throughput_rps"]))
+        for k in ("p50_ms", "p99_ms"):
+            print("%-22s %12.2f %12.2f" % ("overall " + k, a["overall"].get(k, 0), b["overall"].get(k, 0)))
+
+    save_results("asgi", {"threads": args.threads, "processes": args.processes, "concurrency": args.concurrency,
+                          "slow_clients": args.slow_clients, "modes": results}, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+What backups cost while the app serves: request latency with full backups (at several page-step
+sizes) or WAL snapshots running alongside the load_test.py request mix, the backup durations, and
+a timed restore check of the result.
+
+    python benchmarks/bench_backup.py --rows 500000 --users 200 --concurrency 8 --duration 20
+    python benchmarks/bench_backup.py --db /tmp/bench.db --journal delete --pages 64,256,-1
+
+Phases, all on one copy of the database and one in-process server:
+  idle            the request mix alone (the baseline)
+  full:<pages>    full backups back to back, BACKUP_PAGES_PER_STEP=<pages> (-1 = one step)
+  snapshot        a WAL snapshot every --interval seconds (--journal wal only)
+--journal picks the mode the database runs in (wal sets BACKUP_WAL=1), so run the script once per
+mode to compare them.
+"""
+import os, sys, shutil, argparse, tempfile, threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, save_results
+import synth
+import load_test
+
+def backups_during_load(base, tokens, args, take, pause=0.0):
+    """run_load() while take() is called in a loop, `pause` seconds apart; returns (load, [results])."""
+    done = threading.Event()
+    results = []
+
+    def loop():
+        while not done.is_set():
+            results.append(take())
+            done.wait(pause)
+    t = threading.Thread(target=loop)
+    t.start()
+    try:
+        r = load_test.run_load(base, tokens, args.concurrency, args.duration, args.seed)
+    finally:
+        done.set()
+        t.join()
+    return r, results
+
+def backup_stats(results):
+    seconds = sorted(r["seconds"] * 1000 for r in results)
+    out = {"count": len(results), "duration": summarize(seconds)}
+    if results and results[0]["kind"] == "full":
+        out["restarts"] = sum(r["restarts"] for r in results)
+        out["single_step"] = sum(r["mode"] == "single step" for r in results)
+        out["mib"] = round(results[-1]["bytes"] / 2**20, 1)
+    else:
+        out["frames"] = sum(r["frames"] for r in results)
+        out["mib"] = round(sum(r["bytes"] for r in results) / 2**20, 1)
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="database to copy (built with synth data if missing)")
+    ap.add_argument("--journal", choices=["wal", "delete"], default="wal")
+    ap.add_argument("--pages", default="64,256,-1", help="BACKUP_PAGES_PER_STEP values for the full phases")
+    ap.add_argument("--sleep-ms", type=float, default=5, help="BACKUP_STEP_SLEEP_MS")
+    ap.add_argument("--interval", type=float, default=2, help="seconds between WAL snapshots")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=15, help="seconds per phase")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    # read when the backend modules are imported
+    work = tempfile.mkdtemp(prefix="bench-backup-")
+    os.environ["BACKUP_DIR"] = os.path.join(work, "backups")
+    os.environ["BACKUP_STEP_SLEEP_MS"] = str(args.sleep_ms)
+    if args.journal == "wal":
+        os.environ["BACKUP_WAL"] = "1"
+    else:
+        os.environ.pop("BACKUP_WAL", None)
+
+    source = args.db or os.path.join(work, "source.db")
+    if not os.path.exists(source):
+        secs = synth.load_db(source, args.rows, args.users, args.seed)
+        print("built %d synthetic rows in %.1fs" % (args.rows, secs))
+    db_path = os.path.join(work, "bench.db")
+    shutil.copyfile(source, db_path)
+    if args.journal == "delete":
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    server, base, app = load_test.start_local_server(db_path)
+    import backup
+    tokens = load_test.make_tokens(app, args.users)
+    phases = {}
+
+    def checkpoint():
+        # automatic checkpoints are off under BACKUP_WAL: start every phase with an empty WAL
+        if args.journal == "wal":
+            backup.snapshot(0)
+    try:
+        load_test.run_load(base, tokens, args.concurrency, args.duration, args.seed)  # warm-up, not recorded
+        checkpoint()
+        print("phase idle ...")
+        phases["idle"] = {"load": load_test.run_load(base, tokens, args.concurrency, args.duration, args.seed)}
+        for pages in [int(p) for p in args.pages.split(",")]:
+            checkpoint()
+            backup.PAGES_PER_STEP = pages
+            print("phase full:%d ..." % pages)
+            load, results = backups_during_load(base, tokens, args, lambda: backup.full_backup(0))
+            phases["full:%d" % pages] = {"load": load, "backups": backup_stats(results)}
+        if args.journal == "wal":
+            print("phase snapshot ...")
+            backup.full_backup(0)
+            checkpoint()
+            load, results = backups_during_load(base, tokens, args, lambda: backup.snapshot(0), args.interval)
+            phases["snapshot"] = {"load": load, "backups": backup_stats(results)}
+        verified = backup.verify(0)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    print("\n%-12s %8s %9s %9s %11s %9s %12s %12s" % (
+        "phase", "req/s", "p50 ms", "p99 ms", "write p99", "backups", "backup p50", "backup max"))
+    for name, p in phases.items():
+        load, b = p["load"], p.get("backups")
+        write = load["endpoints"].get("add_transaction", {})
+        print("%-12s %8.1f %9.2f %9.2f %11.2f %9s %12s %12s" % (
+            name, load["throughput_rps"], load["overall"]["p50_ms"], load["overall"]["p99_ms"],
+            write.get("p99_ms", 0), b["count"] if b else "-",
+            "%.0f ms" % b["duration"]["p50_ms"] if b and b["count"] else "-",
+            "%.0f ms" % b["duration"]["max_ms"] if b and b["count"] else "-"))
+        if b and "restarts" in b:
+            print("%-12s %d restarts, %d copies finished in one step, %.1f MiB each" % (
+                "", b["restarts"], b["single_step"], b["mib"]))
+        elif b:
+            print("%-12s %d frames, %.1f MiB of WAL segments" % ("", b["frames"], b["mib"]))
+    print("restore check: %s restored in %.2fs (%d snapshots), integrity_check %.2fs: %s" % (
+        verified["chain"], verified["restore_seconds"], verified["snapshots"], verified["check_seconds"],
+        "ok" if verified["ok"] else "FAILED"))
+
+    save_results("backup", {"journal": args.journal, "rows": args.rows, "users": args.users,
+                            "concurrency": args.concurrency, "sleep_ms": args.sleep_ms,
+                            "phases": phases, "verify": verified}, args.out)
+
+if __name__ == "__main__":
+    main()
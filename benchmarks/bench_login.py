@@ -0,0 +1,137 @@
+"""
+Login throughput per password-hash setting, and the per-request cost of token verification.
+
+    python benchmarks/bench_login.py --concurrency 8 --duration 5
+    python benchmarks/bench_login.py --methods scrypt,pbkdf2:sha256:100000
+
+For every PASSWORD_HASH_METHOD in --methods: one hash's cost, /auth/login req/s and latency from
+--concurrency threads, and the one-off cost of the first login after switching to that method
+(verify under the old hash + rehash). Then a protected route timed with plain jwt_required, and
+with auth.user_required with and without its token cache. Also prints the query plan of the
+login email lookup.
+"""
+import os, sys, time, argparse, tempfile, threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, time_calls, save_results, use_database
+
+DEFAULT_METHODS = "pbkdf2:sha256:1000000,pbkdf2:sha256:600000,scrypt:32768:8:1,scrypt:16384:8:1,pbkdf2:sha256:100000"
+PASSWORD = "correct horse battery staple"
+
+def login_load(app, emails, concurrency, duration):
+    """Each thread logs in round-robin until the deadline. Returns (latencies ms, seconds, errors)."""
+    times, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(i):
+        client = app.test_client()
+        local, errs, n = [], 0, i
+        while time.perf_counter() < deadline:
+            t = time.perf_counter()
+            r = client.post("/auth/login", json={"email": emails[n % len(emails)], "password": PASSWORD})
+            local.append((time.perf_counter() - t) * 1000)
+            errs += r.status_code != 200
+            n += concurrency
+        with lock:
+            times.extend(local)
+            errors[0] += errs
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return times, time.perf_counter() - t0, errors[0]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--methods", default=DEFAULT_METHODS)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=5)
+    ap.add_argument("--repeat", type=int, default=2000, help="requests per protected-route case")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    use_database(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    import db
+    import auth
+    import app as backend_app
+    from flask import g, jsonify
+    from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+    from werkzeug.security import generate_password_hash
+
+    app = backend_app.create_app()
+
+    # protected-route cases for the token verification timings at the end
+    @app.route("/bench/jwt")
+    @jwt_required()
+    def bench_jwt():
+        return jsonify({"user_id": int(get_jwt_identity())})
+
+    @app.route("/bench/user")
+    @auth.user_required
+    def bench_user():
+        return jsonify({"user_id": g.user_id})
+
+    conn = db.connect()
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + auth.EMAIL_LOOKUP, ("",)))
+    print("email lookup plan:", plan)
+
+    emails = ["user%d@bench.test" % i for i in range(args.users)]
+    conn.executemany("INSERT INTO users (email, password_hash) VALUES (?, '')", [(e,) for e in emails])
+    conn.commit()
+
+    results = {"email_lookup_plan": plan, "methods": {}}
+    print("\n%-24s %9s %9s %9s %9s %13s" % ("method", "hash ms", "login/s", "p50 ms", "p99 ms", "rehash ms"))
+    previous = None
+    for method in args.methods.split(","):
+        hash_times, _ = time_calls(generate_password_hash, [(PASSWORD, method)] * 3)
+
+        # first login after switching methods: verify under the previous hash, then rehash
+        rehash_ms = None
+        if previous:
+            conn.execute("UPDATE users SET password_hash=?", (generate_password_hash(PASSWORD, previous),))
+            conn.commit()
+            auth.PASSWORD_HASH_METHOD, auth.PASSWORD_REHASH = method, True
+            auth._hash_prefix(method)  # computed once per process; not part of a login
+            client = app.test_client()
+            t = time.perf_counter()
+            client.post("/auth/login", json={"email": emails[0], "password": PASSWORD})
+            rehash_ms = (time.perf_counter() - t) * 1000
+
+        # steady state: everyone already hashed under `method`
+        conn.execute("UPDATE users SET password_hash=?", (generate_password_hash(PASSWORD, method),))
+        conn.commit()
+        auth.PASSWORD_HASH_METHOD, auth.PASSWORD_REHASH = method, False
+        times, secs, errors = login_load(app, emails, args.concurrency, args.duration)
+        s = summarize(times)
+        row = {"hash_ms": summarize(hash_times)["p50_ms"], "logins_per_s": round(len(times) / secs, 1),
+               "latency": s, "errors": errors, "first_login_with_rehash_ms": rehash_ms}
+        results["methods"][method] = row
+        print("%-24s %9.1f %9.1f %9.1f %9.1f %13s" % (method, row["hash_ms"], row["logins_per_s"], s["p50_ms"],
+                                                       s["p99_ms"], "%.1f" % rehash_ms if rehash_ms else "-"))
+        previous = method
+    conn.close()
+
+    # per-request token verification on a protected route
+    with app.app_context():
+        headers = {"Authorization": "Bearer " + create_access_token(identity="1")}
+    client = app.test_client()
+    cases = [("jwt_required", "/bench/jwt", 0), ("user_required, no cache", "/bench/user", 0),
+             ("user_required, cached", "/bench/user", 4096)]
+    results["protected_route"] = {}
+    print()
+    for label, url, cache in cases:
+        auth.TOKEN_CACHE_SIZE = cache
+        auth._token_cache.clear()
+        client.get(url, headers=headers)
+        times, _ = time_calls(lambda: client.get(url, headers=headers), [()] * args.repeat)
+        s = results["protected_route"][label] = summarize(times)
+        print("%-26s p50 %7.3f ms   p99 %7.3f ms" % (label, s["p50_ms"], s["p99_ms"]))
+
+    save_results("login", {"users": args.users, "concurrency": args.concurrency, **results}, args.out)
+
+if __name__ == "__main__":
+    main()
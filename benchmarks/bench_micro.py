@@ -0,0 +1,68 @@
+"""
+Microbenchmarks for the per-row hot paths of uploads: categorize, parse_date,
+normalize_category and the dedupe fingerprint, plus the Monte Carlo forecast for one user.
+
+    python benchmarks/bench_micro.py --rows 20000
+"""
+import os, sys, argparse, random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, time_calls, save_results
+import synth
+
+def bench(name, fn, args_list, results, repeat=1):
+    times, total = time_calls(fn, args_list, repeat)
+    r = summarize(times)
+    r["ops_per_sec"] = round(len(times) / total, 1)
+    results[name] = r
+    print("%-28s %10.0f ops/s   p50 %.4f ms   p99 %.4f ms" % (name, r["ops_per_sec"], r["p50_ms"], r["p99_ms"]))
+    return r
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="results JSON path (default benchmarks/results/micro-<time>.json)")
+    args = ap.parse_args()
+
+    os.environ.setdefault("METRICS_ENABLED", "0")  # measure the functions, not the instrumentation
+    import app as backend_app
+    import dedupe
+    from categorizer import categorize
+    from category_aliases import normalize_category, resolve_category
+
+    rows = list(synth.generate_transactions(args.rows, 100, args.seed))
+    rnd = random.Random(args.seed)
+    results = {}
+
+    descs = [(r["description"],) for r in rows]
+    bench("categorize", categorize, descs, results)
+    correct = sum(1 for r in rows if categorize(r["description"])[0] == r["category"])
+    results["categorize"]["accuracy"] = round(correct / len(rows), 4)
+    print("%-28s %.1f%%" % ("categorize accuracy", correct / len(rows) * 100))
+
+    fmts = ["%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%Y"]
+    from datetime import date
+    dates = [(date.fromisoformat(r["date"]).strftime(rnd.choice(fmts)),) for r in rows]
+    bench("parse_date (mixed formats)", backend_app.parse_date, dates, results)
+    bench("parse_date (ISO)", backend_app.parse_date, [(r["date"],) for r in rows], results)
+
+    labels = [r["category"] for r in rows]
+    noisy = [rnd.choice([l, l.lower(), l.upper(), l[:-1], l + "s"]) for l in labels]
+    bench("normalize_category (indexed)", normalize_category, [(l,) for l in noisy], results)
+    bench("resolve_category (fuzzy)", resolve_category, [(l,) for l in noisy], results)
+
+    bench("dedupe.fingerprint", dedupe.fingerprint,
+          [(r["user_id"], r["date"], r["amount"], r["description"], 0) for r in rows], results)
+
+    # one user's forecast: 15 categories x 24 months of history -> 10k paths x 3 months, plus quantiles
+    import numpy as np
+    import forecast_engine
+    history = np.random.default_rng(args.seed).gamma(5.0, 1000.0, size=(15, 24))
+    bench("forecast 10k paths", lambda: forecast_engine.quantile_bands(forecast_engine.simulate_paths(history, 3, 10000)),
+          [()] * 20, results)
+
+    save_results("micro", {"rows": args.rows, "seed": args.seed, "benchmarks": results}, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Full-text search latency at scale.
+
+    python benchmarks/bench_search.py --rows 1000000 --users 100
+
+Builds a throwaway synthetic database with the real schema (FTS triggers included), then times
+GET /transactions/search queries through search.search_transactions.
+"""
+import os, sys, random, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, time_calls, save_results, use_database
+import synth
+
+QUERIES = [("word", "swiggy", "rank"), ("prefix", "swig*", "rank"),
+           ("two words", "uber ride", "rank"), ("by date", "netflix", "date")]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1000000)
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="reuse/create this database instead of a temp one")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    use_database(path)
+    if not os.path.exists(path):
+        secs = synth.load_db(path, args.rows, args.users, args.seed)
+        print("built %d rows in %.1fs" % (args.rows, secs))
+
+    from flask import Flask
+    import search
+    app = Flask(__name__)
+    rnd = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        for label, q, sort in QUERIES:
+            calls = [(rnd.randint(1, args.users), q) for _ in range(args.repeat)]
+            times, _ = time_calls(lambda uid, q: search.search_transactions(uid, q, limit=50, sort=sort), calls)
+            results[label] = summarize(times)
+            print("%-10s p50 %.2f ms  p99 %.2f ms" % (label, results[label]["p50_ms"], results[label]["p99_ms"]))
+    save_results("search", {"rows": args.rows, "users": args.users, "queries": results}, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Response payload size and encode/decode cost, per JSON encoder, row shape and compression.
+
+    python benchmarks/bench_serialization.py --rows 200000 --users 20
+    python benchmarks/bench_serialization.py --db /tmp/bench.db --repeat 50
+
+For each endpoint, the payload is fetched once and then timed in isolation:
+  encode   jsonify() with the stdlib provider vs serialization.OrjsonProvider
+  shape    list of objects vs ?format=columns
+  compress identity / gzip / br (br only if the brotli package is installed)
+  decode   what the client does: decompress + json.loads
+plus end-to-end request latency through the Flask test client for a few full configurations.
+"""
+import os, sys, gzip, json, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, time_calls, save_results, use_database
+import synth
+
+ENDPOINTS = [
+    ("transactions", "/transactions?limit=1000"),
+    ("search", "/transactions/search?q=a*&limit=200"),
+    ("report_monthly", "/reports/monthly?months=24"),
+    ("report_summary", "/reports/summary"),
+]
+
+# (label, encoder, format=columns, Accept-Encoding)
+END_TO_END = [
+    ("baseline: json, objects, identity", "json", False, None),
+    ("orjson, objects, identity", "orjson", False, None),
+    ("orjson, objects, gzip", "orjson", False, "gzip"),
+    ("orjson, columns, gzip", "orjson", True, "gzip"),
+    ("orjson, columns, br", "orjson", True, "br"),
+]
+
+def decompress(data, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br":
+        import brotli
+        return brotli.decompress(data)
+    return data
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="reuse/create this database instead of a temp one")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    use_database(path)
+    if not os.path.exists(path):
+        secs = synth.load_db(path, args.rows, args.users, args.seed)
+        print("built %d rows in %.1fs" % (args.rows, secs))
+
+    import db
+    import serialization
+    import app as backend_app
+    from flask.json.provider import DefaultJSONProvider
+    from flask_jwt_extended import create_access_token
+
+    app = backend_app.create_app()
+    providers = {"json": DefaultJSONProvider(app)}
+    if serialization.orjson is not None:
+        providers["orjson"] = serialization.OrjsonProvider(app)
+    encodings = [None] + list(serialization.ENCODINGS)
+
+    conn = db.connect()
+    user_id = conn.execute("SELECT user_id FROM transactions GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    conn.close()
+    with app.app_context():
+        headers = {"Authorization": "Bearer " + create_access_token(identity=str(user_id))}
+    client = app.test_client()
+
+    results = {"isolated": {}, "end_to_end": {}}
+    print("%-16s %-7s %-7s %-8s %10s %11s %13s %11s" % ("endpoint", "shape", "encoder", "encoding", "bytes",
+                                                          "encode ms", "compress ms", "decode ms"))
+    for name, url in ENDPOINTS:
+        app.json = providers["json"]
+        for shape in ("objects", "columns"):
+            u = url + ("&" if "?" in url else "?") + "format=columns" if shape == "columns" else url
+            r = client.get(u, headers=headers)
+            if r.status_code != 200:
+                print("%s: HTTP %d, skipped" % (name, r.status_code))
+                break
+            obj = json.loads(r.data)
+            for enc_name, provider in providers.items():
+                with app.app_context():
+                    enc_times, _ = time_calls(lambda: provider.response(obj).get_data(), [()] * args.repeat)
+                    raw = provider.response(obj).get_data()
+                for encoding in encodings:
+                    if encoding:
+                        comp_times, _ = time_calls(serialization.compress, [(raw, encoding)] * args.repeat)
+                        body = serialization.compress(raw, encoding)
+                    else:
+                        comp_times, body = [0.0], raw
+                    dec_times, _ = time_calls(lambda: json.loads(decompress(body, encoding)), [()] * args.repeat)
+                    row = {"bytes": len(body), "encode": summarize(enc_times),
+                           "compress": summarize(comp_times), "decode": summarize(dec_times)}
+                    results["isolated"]["%s/%s/%s/%s" % (name, shape, enc_name, encoding or "identity")] = row
+                    print("%-16s %-7s %-7s %-8s %10d %11.3f %13.3f %11.3f" % (
+                        name, shape, enc_name, encoding or "identity", len(body), row["encode"]["p50_ms"],
+                        row["compress"]["p50_ms"], row["decode"]["p50_ms"]))
+
+    print("\nend to end (p50 ms per request, server + client decode)")
+    for name, url in ENDPOINTS:
+        for label, enc_name, columns, encoding in END_TO_END:
+            if enc_name not in providers or (encoding and encoding not in encodings):
+                continue
+            app.json = providers[enc_name]
+            u = url + ("&" if "?" in url else "?") + "format=columns" if columns else url
+            h = dict(headers)
+            if encoding:
+                h["Accept-Encoding"] = encoding
+
+            def fetch():
+                r = client.get(u, headers=h)
+                return json.loads(decompress(r.data, r.headers.get("Content-Encoding")))
+            times, _ = time_calls(fetch, [()] * args.repeat)
+            s = summarize(times)
+            results["end_to_end"]["%s/%s" % (name, label)] = s
+            print("  %-16s %-36s %8.3f" % (name, label, s["p50_ms"]))
+
+    save_results("serialization", {"db": path, "user_id": user_id, "repeat": args.repeat, **results}, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Worker startup cost: fresh interpreter -> import app -> create_app() -> first responses.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --db /tmp/bench.db --warm-up blocking
+
+Every run is a new process, so imports are cold (as in a freshly forked gunicorn worker with
+no preload). Reports per-phase milliseconds and which heavy modules a CRUD-only worker loaded.
+"""
+import os, sys, json, time, argparse, tempfile, subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, save_results, use_database
+import synth
+
+HEAVY = ("numpy", "pandas", "sklearn")
+
+def child(db_path):
+    """Runs inside the measured process; prints one JSON line of timings."""
+    t0 = time.perf_counter()
+    use_database(db_path)
+    import app as backend_app
+    t_import = time.perf_counter()
+    app = backend_app.create_app()
+    t_create = time.perf_counter()
+    client = app.test_client()
+    client.get("/health")
+    t_health = time.perf_counter()
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        headers = {"Authorization": "Bearer " + create_access_token(identity="1")}
+    client.get("/transactions?limit=50", headers=headers)
+    t_crud = time.perf_counter()
+    crud_loaded = [m for m in HEAVY if m in sys.modules]
+    client.get("/forecast?paths=1000", headers=headers)
+    t_forecast = time.perf_counter()
+    print(json.dumps({
+        "import_app_ms": (t_import - t0) * 1000,
+        "create_app_ms": (t_create - t_import) * 1000,
+        "first_health_ms": (t_health - t_create) * 1000,
+        "first_crud_ms": (t_crud - t_health) * 1000,
+        "first_forecast_ms": (t_forecast - t_crud) * 1000,
+        "time_to_first_response_ms": (t_health - t0) * 1000,
+        "heavy_modules_after_crud": crud_loaded,
+    }))
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        return child(sys.argv[2])
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="database to use (built with synth data if missing)")
+    ap.add_argument("--warm-up", default="", help="WARM_UP value for the workers ('', 1, blocking)")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    if not os.path.exists(db_path):
+        use_database(db_path)
+        print("built %d synthetic rows in %.1fs" % (args.rows, synth.load_db(db_path, args.rows, args.users, args.seed)))
+
+    env = dict(os.environ, WARM_UP=args.warm_up, METRICS_ENABLED=os.environ.get("METRICS_ENABLED", "1"))
+    runs = []
+    for _ in range(args.runs):
+        t = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", db_path],
+                             env=env, capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        r["process_total_ms"] = (time.perf_counter() - t) * 1000
+        runs.append(r)
+
+    phases = [k for k in runs[0] if k.endswith("_ms")]
+    results = {k: summarize([r[k] for r in runs]) for k in phases}
+    for k in phases:
+        print("%-28s p50 %8.1f ms   max %8.1f ms" % (k, results[k]["p50_ms"], results[k]["max_ms"]))
+    print("heavy modules loaded by a CRUD-only worker:", runs[0]["heavy_modules_after_crud"] or "none")
+    results["heavy_modules_after_crud"] = runs[0]["heavy_modules_after_crud"]
+    save_results("startup", {"runs": args.runs, "warm_up": args.warm_up, "db": db_path, "phases": results}, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Shared helpers for the benchmark scripts: import path, timing summaries, JSON results."""
+import os, sys, json, time, platform, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.abspath(os.path.join(HERE, "..", "backend"))
+RESULTS_DIR = os.path.join(HERE, "results")
+
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+def use_database(path):
+    """Point the backend at `path`, even if db.py was already imported with the default DB_PATH."""
+    os.environ["DB_PATH"] = path
+    import db
+    db.DB_PATH = path
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+def summarize(times_ms):
+    """Latency summary (milliseconds) for a list of samples."""
+    s = sorted(times_ms)
+    if not s:
+        return {"count": 0}
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s), 3),
+        "p50_ms": round(percentile(s, 50), 3),
+        "p90_ms": round(percentile(s, 90), 3),
+        "p99_ms": round(percentile(s, 99), 3),
+        "max_ms": round(s[-1], 3),
+    }
+
+def time_calls(fn, args_list, repeat=1):
+    """Call fn(*args) for every args tuple; returns (per-call ms list, total seconds)."""
+    times = []
+    t_all = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            t = time.perf_counter()
+            fn(*args)
+            times.append((time.perf_counter() - t) * 1000)
+    return times, time.perf_counter() - t_all
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def save_results(name, payload, out=None):
+    """Write payload plus run metadata to benchmarks/results/<name>-<timestamp>.json (or `out`)."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    doc = {
+        "benchmark": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": payload,
+    }
+    path = out or os.path.join(RESULTS_DIR, "%s-%s.json" % (name, time.strftime("%Y%m%d-%H%M%S")))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    print("results written to", path)
+    return path
@@ -0,0 +1,40 @@
+"""
+Compare two benchmark result files (same benchmark, e.g. before/after a change).
+
+    python benchmarks/compare.py benchmarks/results/load-A.json benchmarks/results/load-B.json
+
+Prints every numeric leaf that appears in both, with the relative change.
+"""
+import sys, json
+
+def flatten(d, prefix=""):
+    out = {}
+    for k, v in d.items():
+        key = "%s.%s" % (prefix, k) if prefix else k
+        if isinstance(v, dict):
+            out.update(flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+def main():
+    if len(sys.argv) != 3:
+        raise SystemExit(__doc__)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        a = json.load(f)
+    with open(sys.argv[2], encoding="utf-8") as f:
+        b = json.load(f)
+    if a.get("benchmark") != b.get("benchmark"):
+        print("warning: comparing %r with %r" % (a.get("benchmark"), b.get("benchmark")))
+    print("A: %s (%s)   B: %s (%s)" % (a.get("timestamp"), a.get("git_rev"), b.get("timestamp"), b.get("git_rev")))
+    fa, fb = flatten(a.get("results", {})), flatten(b.get("results", {}))
+    width = max([len(k) for k in fa if k in fb] or [10])
+    for k in sorted(fa):
+        if k not in fb:
+            continue
+        va, vb = fa[k], fb[k]
+        change = ("%+.1f%%" % ((vb - va) / va * 100)) if va else "n/a"
+        print("%-*s %14.3f %14.3f %10s" % (width, k, va, vb, change))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Local HTTP load driver: concurrent clients against the Flask app (or any running server),
+reporting p50/p99 latency per endpoint and overall throughput.
+
+    python benchmarks/load_test.py --rows 200000 --users 200 --concurrency 16 --duration 30
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --db /tmp/bench.db   # external server
+
+Without --url the app is served in-process by werkzeug's threaded server on a free port,
+against a fresh synthetic database (or --db if it already exists).
+"""
+import os, sys, time, json, random, argparse, tempfile, threading
+import urllib.request, urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, save_results, use_database
+import synth
+
+# (name, weight) -> request builder; every builder returns (method, path, body bytes, content type)
+def _get(path):
+    return ("GET", path, None, None)
+
+SEARCH_TERMS = ["swiggy", "uber", "amazon", "rent", "netflix", "pharm*", "flip*", "emi"]
+
+def scenario_mix(rnd, csv_body):
+    today = "2024-12-31"
+    return [
+        ("list_transactions", 20, lambda: _get("/transactions?limit=100")),
+        ("report_category", 15, lambda: _get("/reports/category?days=%d" % rnd.choice([30, 90, 365, 3650]))),
+        ("report_monthly", 10, lambda: _get("/reports/monthly?months=12")),
+        ("report_range", 10, lambda: _get("/reports/range?from=2024-01-01&to=%s&compare=year" % today)),
+        ("report_series", 5, lambda: _get("/reports/series?category=Dining&months=12")),
+        ("search", 15, lambda: _get("/transactions/search?q=%s" % rnd.choice(SEARCH_TERMS))),
+        ("summary", 5, lambda: _get("/reports/summary")),
+        ("add_transaction", 15, lambda: ("POST", "/transactions", json.dumps({
+            "date": "2024-%02d-%02d" % (rnd.randint(1, 12), rnd.randint(1, 28)),
+            "amount": round(rnd.uniform(50, 5000), 2),
+            "description": rnd.choice(["Swiggy order", "Uber ride", "BigBasket", "Amazon purchase"]),
+            "type": "expense"}).encode(), "application/json")),
+        ("upload_csv", 5, lambda: ("POST", "/transactions/bulk", csv_body[0], csv_body[1])),
+    ]
+
+def multipart_csv(rows):
+    """Build a multipart/form-data body with a small upload CSV."""
+    import io, csv
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=["date", "amount", "description", "type"], extrasaction="ignore")
+    w.writeheader()
+    for r in rows:
+        w.writerow(r)
+    boundary = "----benchboundary"
+    body = ("--%s\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.csv\"\r\n"
+            "Content-Type: text/csv\r\n\r\n%s\r\n--%s--\r\n" % (boundary, buf.getvalue(), boundary)).encode()
+    return body, "multipart/form-data; boundary=%s" % boundary
+
+def start_local_server(db_path):
+    """Serve create_app() on 127.0.0.1:<free port> in a background thread."""
+    use_database(db_path)
+    from werkzeug.serving import make_server
+    import app as backend_app
+    app = backend_app.create_app()
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_port, app
+
+def make_tokens(app, n_users):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return {u: create_access_token(identity=str(u)) for u in range(1, n_users + 1)}
+
+def worker(base, tokens, mix, deadline, samples, errors, rnd, lock):
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    builders = {m[0]: m[2] for m in mix}
+    users = list(tokens)
+    local = []
+    local_err = []
+    while time.perf_counter() < deadline:
+        name = rnd.choices(names, weights=weights)[0]
+        method, path, body, ctype = builders[name]()
+        req = urllib.request.Request(base + path, data=body, method=method)
+        req.add_header("Authorization", "Bearer " + tokens[rnd.choice(users)])
+        if ctype:
+            req.add_header("Content-Type", ctype)
+        t = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                resp.read()
+            local.append((name, (time.perf_counter() - t) * 1000))
+        except urllib.error.HTTPError as e:
+            e.read()
+            local_err.append((name, e.code))
+        except Exception as e:
+            local_err.append((name, type(e).__name__))
+    with lock:
+        samples.extend(local)
+        errors.extend(local_err)
+
+def run_load(base, tokens, concurrency, duration, seed=1, upload_rows=50):
+    """Drive `concurrency` client threads for `duration` seconds; returns the results dict."""
+    rnd = random.Random(seed)
+    csv_body = multipart_csv(list(synth.generate_transactions(upload_rows, 1, seed=seed + 1000)))
+    samples, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = []
+    t0 = time.perf_counter()
+    for i in range(concurrency):
+        wr = random.Random(seed * 1000 + i)
+        mix = scenario_mix(wr, csv_body)
+        th = threading.Thread(target=worker, args=(base, tokens, mix, deadline, samples, errors, wr, lock))
+        th.start()
+        threads.append(th)
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t0
+
+    by_endpoint = {}
+    for name, ms in samples:
+        by_endpoint.setdefault(name, []).append(ms)
+    out = {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(samples),
+        "errors": len(errors),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "overall": summarize([ms for _, ms in samples]),
+        "endpoints": {k: summarize(v) for k, v in sorted(by_endpoint.items())},
+    }
+    if errors:
+        err_counts = {}
+        for name, code in errors:
+            key = "%s:%s" % (name, code)
+            err_counts[key] = err_counts.get(key, 0) + 1
+        out["error_breakdown"] = err_counts
+    return out
+
+def print_report(r):
+    print("%d requests in %.1fs: %.1f req/s, %d errors" % (r["requests"], r["duration_s"], r["throughput_rps"], r["errors"]))
+    print("%-20s %8s %9s %9s %9s" % ("endpoint", "count", "p50 ms", "p99 ms", "max ms"))
+    for name, s in list(r["endpoints"].items()) + [("OVERALL", r["overall"])]:
+        if s.get("count"):
+            print("%-20s %8d %9.2f %9.2f %9.2f" % (name, s["count"], s["p50_ms"], s["p99_ms"], s["max_ms"]))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="database to use (built with synth data if missing)")
+    ap.add_argument("--url", help="benchmark an already running server instead of an in-process one")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--label", default="wsgi-dev", help="free-form tag stored with the results")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    use_database(db_path)
+    if not os.path.exists(db_path):
+        secs = synth.load_db(db_path, args.rows, args.users, args.seed)
+        print("built %d synthetic rows in %.1fs" % (args.rows, secs))
+
+    if args.url:
+        import app as backend_app
+        base, app = args.url.rstrip("/"), backend_app.create_app()
+        server = None
+    else:
+        server, base, app = start_local_server(db_path)
+    tokens = make_tokens(app, args.users)
+
+    r = run_load(base, tokens, args.concurrency, args.duration, args.seed)
+    if server is not None:
+        server.shutdown()
+    print_report(r)
+    r.update({"label": args.label, "rows": args.rows, "users": args.users, "url": args.url or "in-process"})
+    save_results("load", r, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Deterministic synthetic data: users and transactions with realistic, noisy merchant descriptions.
+
+    python benchmarks/synth.py --rows 100000 --users 200 --csv /tmp/tx.csv
+    python benchmarks/synth.py --rows 1000000 --users 1000 --db /tmp/bench.db
+
+The same --seed always produces the same rows, so runs on different commits are comparable.
+Rows are streamed, so 10M-row files/databases don't need 10M rows in memory.
+"""
+import os, sys, csv, random, argparse, time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import common  # noqa: F401  (backend on sys.path)
+
+# category -> (merchants, (min amount, max amount), relative frequency)
+MERCHANTS = {
+    "Groceries": (["BigBasket", "DMart", "Reliance Fresh", "More Supermarket", "Nature's Basket", "local grocer"], (80, 3500), 14),
+    "Dining": (["Swiggy", "Zomato", "Starbucks Coffee", "Cafe Coffee Day", "Dominos", "restaurant dinner"], (90, 2500), 16),
+    "Transport": (["Uber", "Ola", "Rapido", "Metro card recharge", "Shell petrol", "parking fee"], (30, 1800), 12),
+    "Shopping": (["Amazon", "Flipkart", "Myntra", "Decathlon store", "Croma", "mall purchase"], (150, 15000), 10),
+    "Utilities": (["BESCOM electricity", "Airtel internet", "water bill", "Indane gas bill", "Jio recharge"], (150, 4000), 6),
+    "Entertainment": (["Netflix", "Spotify", "BookMyShow movie", "PVR cinemas", "concert tickets"], (120, 3000), 6),
+    "Healthcare": (["Apollo Pharmacy", "clinic consultation", "medical lab test", "hospital bill"], (100, 12000), 5),
+    "Travel": (["MakeMyTrip flight", "IRCTC train booking", "Airbnb stay", "OYO hotel"], (800, 40000), 4),
+    "Rent": (["house rent", "apartment rent transfer"], (8000, 45000), 3),
+    "Loan_Repayment": (["home loan EMI", "car loan EMI", "credit card repayment"], (2000, 30000), 3),
+    "Insurance": (["LIC premium", "health insurance policy", "car insurance renewal"], (500, 20000), 2),
+    "Education": (["college tuition fee", "Udemy course", "exam fee"], (300, 60000), 2),
+    "Miscellaneous": (["ATM withdrawal", "bank charges", "misc transfer"], (20, 5000), 3),
+}
+INCOME = (["salary credited", "payroll deposit", "freelance payment received", "refund credited"], (5000, 150000))
+INCOME_SHARE = 0.05
+
+PREFIXES = ["", "", "", "UPI/", "POS ", "NEFT-", "IMPS/", "ACH D- "]
+_CATS = list(MERCHANTS)
+_WEIGHTS = [MERCHANTS[c][2] for c in _CATS]
+
+def _typo(rnd, word):
+    if len(word) < 4:
+        return word
+    i = rnd.randrange(1, len(word) - 1)
+    op = rnd.random()
+    if op < 0.4:
+        return word[:i] + word[i + 1:]                              # drop a char
+    if op < 0.8:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]      # swap neighbours
+    return word[:i] + word[i] + word[i:]                            # double a char
+
+def noisy_description(rnd, merchant, typo_rate=0.08):
+    """Bank-statement style text: random prefix/case, reference numbers, occasional typos."""
+    words = merchant.split()
+    if rnd.random() < typo_rate:
+        j = rnd.randrange(len(words))
+        words[j] = _typo(rnd, words[j])
+    text = " ".join(words)
+    r = rnd.random()
+    if r < 0.3:
+        text = text.upper()
+    elif r < 0.45:
+        text = text.lower()
+    prefix = rnd.choice(PREFIXES)
+    if prefix:
+        text = "%s%s/%d" % (prefix, text, rnd.randint(100000, 999999999))
+    elif rnd.random() < 0.3:
+        text = "%s #%d" % (text, rnd.randint(1000, 99999))
+    return text
+
+def generate_users(n_users):
+    """[(id, email)] for users 1..n_users."""
+    return [(u, "user%d@example.com" % u) for u in range(1, n_users + 1)]
+
+def generate_transactions(n_rows, n_users, seed=42, start=date(2023, 1, 1), days=730):
+    """
+    Yield n_rows dicts {user_id, date, amount, description, category, type}.
+    `category` is the ground truth label (useful for categorizer accuracy).
+    """
+    rnd = random.Random(seed)
+    for _ in range(n_rows):
+        user_id = rnd.randint(1, n_users)
+        d = (start + timedelta(days=rnd.randrange(days))).isoformat()
+        if rnd.random() < INCOME_SHARE:
+            merchants, (lo, hi) = INCOME
+            cat, tx_type = "Salary", "income"
+        else:
+            cat = rnd.choices(_CATS, weights=_WEIGHTS)[0]
+            merchants, (lo, hi), _ = MERCHANTS[cat]
+            tx_type = "expense"
+        amount = round(rnd.uniform(lo, hi), 2)
+        yield {
+            "user_id": user_id,
+            "date": d,
+            "amount": amount,
+            "description": noisy_description(rnd, rnd.choice(merchants)),
+            "category": cat,
+            "type": tx_type,
+        }
+
+def write_csv(path, rows, with_category=True):
+    """Write rows in the /transactions/bulk upload format."""
+    cols = ["date", "amount", "description", "type"] + (["category"] if with_category else [])
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=cols, extrasaction="ignore")
+        w.writeheader()
+        for r in rows:
+            w.writerow(r)
+            n += 1
+    return n
+
+# per-row insert triggers that maintain derived indexes; bulk loads rebuild those in one pass instead
+BULK_LOAD_TRIGGERS = ("transactions_fts_ai", "transactions_cumsum_ai", "transactions_monthly_ai")
+
+def load_db(path, n_rows, n_users, seed=42, password_hash="x", batch=50000):
+    """Create a database with the real schema (triggers, indexes) and fill it. Returns seconds taken."""
+    import db
+    import dedupe
+    import daily_index
+    import budgets
+    t = time.perf_counter()
+    conn = db.connect(path)
+    db.init_schema(conn)
+    for name in BULK_LOAD_TRIGGERS:
+        conn.execute("DROP TRIGGER IF EXISTS %s" % name)
+    conn.executemany("INSERT OR IGNORE INTO users (id, email, password_hash) VALUES (?,?,?)",
+                     [(u, email, password_hash) for u, email in generate_users(n_users)])
+    sql = ("INSERT INTO transactions (user_id, date, amount, description, category, type, fingerprint) "
+           "VALUES (?,?,?,?,?,?,?) ON CONFLICT(fingerprint) DO NOTHING")
+    buf = []
+    seen = {}
+    for r in generate_transactions(n_rows, n_users, seed):
+        # hashed key keeps the ordinal table small enough for 10M-row loads
+        k = hash((r["user_id"],) + dedupe.content_key(r["date"], r["amount"], r["description"]))
+        n = seen.get(k, 0)
+        seen[k] = n + 1
+        buf.append((r["user_id"], r["date"], r["amount"], r["description"], r["category"], r["type"],
+                    dedupe.fingerprint(r["user_id"], r["date"], r["amount"], r["description"], n)))
+        if len(buf) >= batch:
+            conn.executemany(sql, buf)
+            conn.commit()
+            buf = []
+    if buf:
+        conn.executemany(sql, buf)
+    conn.commit()
+    conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+    daily_index.rebuild(conn)
+    budgets.rebuild(conn)
+    db.init_schema(conn)  # puts the triggers back
+    conn.close()
+    return time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--csv", help="write an upload-format CSV (all users mixed)")
+    ap.add_argument("--db", help="create/fill a SQLite database with the backend schema")
+    args = ap.parse_args()
+    if not args.csv and not args.db:
+        ap.error("give --csv and/or --db")
+    if args.csv:
+        n = write_csv(args.csv, generate_transactions(args.rows, args.users, args.seed))
+        print("wrote %d rows to %s" % (n, args.csv))
+    if args.db:
+        secs = load_db(args.db, args.rows, args.users, args.seed)
+        print("loaded %d rows into %s in %.1fs (%.0f rows/s)" % (args.rows, args.db, secs, args.rows / secs))
+
+if __name__ == "__main__":
+    main()
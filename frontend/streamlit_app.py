@@ -23,6 +23,12 @@ def safe_json(resp):
     except Exception:
         return None
 
+def records_df(body):
+    # row-list responses come as a list of objects, or {columns, rows} with ?format=columns
+    if isinstance(body, dict) and "columns" in body:
+        return pd.DataFrame(body["rows"], columns=body["columns"])
+    return pd.DataFrame(body or [])
+
 def api_request(method, path, token=None, json=None, files=None, timeout=10):
     headers = {}
     if token:
@@ -197,6 +203,8 @@ with col_main:
                                 if getattr(r, "status_code", None) == 200:
                                     payload = safe_json(r) or {}
                                     st.success(f"Uploaded {payload.get('inserted','?')} rows.")
+                                    if payload.get('skipped_duplicates'):
+                                        st.info(f"Skipped {payload['skipped_duplicates']} rows already uploaded earlier.")
                                 else:
                                     show_response_error(r)
 
@@ -210,12 +218,11 @@ with col_main:
         if not st.session_state.token:
             st.info("Login required to fetch backend transactions.")
         else:
-            r = api_request("get", "/transactions", token=st.session_state.token)
+            r = api_request("get", "/transactions?format=columns", token=st.session_state.token)
             if isinstance(r, Exception) or (hasattr(r, "status_code") and r.status_code != 200):
                 show_response_error(r)
             else:
-                txs = safe_json(r) or []
-                df_all = pd.DataFrame(txs)
+                df_all = records_df(safe_json(r))
                 if not df_all.empty:
                     df_all['date'] = pd.to_datetime(df_all['date'], errors='coerce')
                     df_all = df_all.dropna(subset=['date'])
@@ -293,10 +300,9 @@ with col_main:
 with col_side:
     st.header("Quick Insights")
     if st.session_state.token:
-        r = api_request("get", "/transactions", token=st.session_state.token)
+        r = api_request("get", "/transactions?format=columns", token=st.session_state.token)
         if not isinstance(r, Exception) and getattr(r, "status_code", 0) == 200:
-            txs = safe_json(r) or []
-            df = pd.DataFrame(txs)
+            df = records_df(safe_json(r))
             if not df.empty:
                 df['date'] = pd.to_datetime(df['date'], errors='coerce')
                 total_expense = df[df['type']=='expense']['amount'].sum()
@@ -0,0 +1,76 @@
+import os, sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import db
+import sharding
+
+parser = argparse.ArgumentParser(
+    description="Show, move and balance users across the shards in DB_SHARDS (the app can keep running).")
+parser.add_argument("--db", default=os.path.abspath(os.path.join(os.getcwd(), "data", "expense.db")),
+                    help="the directory database (shard 0); further shards come from DB_SHARDS")
+parser.add_argument("--move", action="append", default=[], metavar="USER:SHARD",
+                    help="move one user to a shard (repeatable)")
+parser.add_argument("--balance", action="store_true", help="plan moves that even out transaction rows")
+parser.add_argument("--max-moves", type=int, default=50)
+parser.add_argument("--purge-orphans", action="store_true",
+                    help="find rows left on a shard the directory no longer points at")
+parser.add_argument("--apply", action="store_true", help="carry out --balance / --purge-orphans (default is a dry run)")
+args = parser.parse_args()
+
+if not os.path.exists(args.db):
+    raise SystemExit("DB not found: " + args.db)
+db.DB_PATH = args.db
+if not db.is_sharded():
+    raise SystemExit("DB_SHARDS is not set: there is only one shard")
+if db.SHARD_ROUTING == 'hash':
+    raise SystemExit("SHARD_ROUTING=hash: users are placed by hash and cannot be moved")
+
+# new shard files get the schema; users from before sharding are pinned to shard 0
+db.for_each_shard(lambda conn, shard: db.init_schema(conn))
+conn = db.connect()
+db.pin_existing_users(conn)
+conn.close()
+
+def show(rows):
+    for shard, users in sorted(rows.items()):
+        print("  shard %d  %-50s %6d users %10d transactions" % (shard, db.shard_paths()[shard], len(users), sum(users.values())))
+
+rows = sharding.user_rows()
+print("Shards:")
+show(rows)
+
+moves = []
+for item in args.move:
+    user, _, shard = item.partition(":")
+    try:
+        moves.append((int(user), int(shard)))
+    except ValueError:
+        raise SystemExit("--move expects USER:SHARD, got " + repr(item))
+
+if args.balance:
+    plan = sharding.plan_balance(rows, max_moves=args.max_moves)
+    print("\nBalance plan:" if args.apply else "\nBalance plan (use --apply to move):")
+    if not plan:
+        print("  - Already balanced")
+    for user_id, source, target, n in plan:
+        print("  - user %d: shard %d -> %d (%d transactions)" % (user_id, source, target, n))
+    if args.apply:
+        moves += [(user_id, target) for user_id, source, target, n in plan]
+
+for user_id, target in moves:
+    counts = sharding.move_user(user_id, target)
+    print("Moved user %d to shard %d: %s" % (user_id, target, ", ".join("%s %d" % kv for kv in counts.items()) or "already there"))
+
+if args.purge_orphans:
+    orphans = sharding.purge_orphans(dry_run=not args.apply)
+    print("\nOrphaned rows:" if args.apply else "\nOrphaned rows (use --apply to delete):")
+    if not orphans:
+        print("  - None")
+    for shard, users in orphans.items():
+        print("  - shard %d: users %s" % (shard, ", ".join(map(str, users))))
+
+if moves:
+    print("\nShards now:")
+    show(sharding.user_rows())
+print('\nDone.')
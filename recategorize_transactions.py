@@ -0,0 +1,86 @@
+import os, sys
+import argparse
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import db
+import offload
+import recategorize
+import learned_categorizer
+from category_aliases import load_aliases
+
+# worker processes are spawned and re-import this file: keep the job under the main guard
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-run the categorizer over stored transactions (resumable; rows users labeled are kept).")
+    parser.add_argument("--db", default=os.path.abspath(os.path.join(os.getcwd(), "data", "expense.db")),
+                        help="the directory database (shard 0); further shards come from DB_SHARDS")
+    parser.add_argument("--job", help="job name to run or resume (default: a hash of the current rules)")
+    parser.add_argument("--chunk", type=int, default=recategorize.CHUNK, help="rows per batch and per commit")
+    parser.add_argument("--workers", type=int, default=0, help="categorize in this many worker processes")
+    parser.add_argument("--include-legacy", action="store_true",
+                        help="also re-label rows stored before category_source existed")
+    parser.add_argument("--restart", action="store_true", help="discard the job's checkpoints and start over")
+    parser.add_argument("--status", action="store_true", help="only list the jobs recorded in each shard")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default is a dry run)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit("DB not found: " + args.db)
+    db.DB_PATH = args.db
+    missing = [p for p in db.shard_paths() if not os.path.exists(p)]
+    if missing:
+        raise SystemExit("Shard not found: " + ", ".join(missing))
+    db.for_each_shard(lambda conn, shard: db.init_schema(conn))
+
+    if args.status:
+        for shard, jobs in recategorize.status().items():
+            print("shard %d:" % shard)
+            if not jobs:
+                print("  - No jobs")
+            for j in jobs:
+                print("  - %s  last id %d, %d scanned, %d changed, %s" % (
+                    j["job"], j["last_id"], j["scanned"], j["changed"],
+                    "finished " + j["finished_at"] if j["finished_at"] else "unfinished"))
+        return
+
+    conn = db.connect()
+    load_aliases(conn)
+    conn.close()
+    if learned_categorizer.ENABLED:
+        learned_categorizer.load_all()
+    if args.workers > 0:
+        offload.configure(args.workers)
+
+    lock = threading.Lock()
+
+    def progress(shard, stats):
+        with lock:
+            print("  shard %d: %9d scanned %8d %s %9.0f rows/s" % (
+                shard, stats["scanned"], stats["changed"], "changed" if args.apply else "would change",
+                stats["scanned"] / max(stats["seconds"], 1e-9)), flush=True)
+
+    print("Re-categorizing:" if args.apply else "Dry run (use --apply to write):")
+    try:
+        job, results = recategorize.run(args.job, chunk=args.chunk, include_legacy=args.include_legacy,
+                                        dry_run=not args.apply, restart=args.restart, progress=progress)
+    finally:
+        offload.shutdown()
+
+    scanned = sum(r["scanned"] for r in results)
+    changed = sum(r["changed"] for r in results)
+    seconds = max([r["seconds"] for r in results] + [1e-9])
+    print("\nJob %s: %d rows scanned, %d %s in %.1fs (%.0f rows/s)" % (
+        job, scanned, changed, "changed" if args.apply else "would change", seconds, scanned / seconds))
+    if any(r["already_finished"] for r in results):
+        print("  - Already finished on %d shard(s) (use --restart to run this job again)"
+              % sum(r["already_finished"] for r in results))
+
+    transitions = sum((r["transitions"] for r in results), Counter())
+    for (old, new), n in transitions.most_common(20):
+        print(f"  - {n} rows: {old!r} -> {new!r}")
+    print('\nDone.')
+
+if __name__ == "__main__":
+    main()